@@ -0,0 +1 @@
+"""Benchmarks for sh_doctest.  See the benchmark targets of the Makefile."""
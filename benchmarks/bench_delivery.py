@@ -0,0 +1,26 @@
+"""Compare the per-case cost of each shell.shell script delivery mode.
+
+python -m benchmarks.bench_delivery [cases]
+"""
+
+import sys
+import timeit
+
+from sh_doctest import shell
+
+
+def main(cases: int = 200) -> None:
+    print(f"{'delivery':<10} {'ms/case':>8}")
+    for delivery in shell.DELIVERIES[1:]:
+        context = shell.ShellContext("set -eu", "exit 0", delivery=delivery)
+        seconds = min(
+            timeit.repeat(
+                lambda: shell.shell("true", context=context), number=cases, repeat=3
+            )
+        )
+        print(f"{delivery:<10} {seconds / cases * 1000:8.3f}")
+    print(f"auto selects {shell.best_delivery()}")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,31 @@
+"""Compare the memory held by a LineBlock of command output in compact form with
+the same block expanded to one NumberedLine per line.
+
+    python -m benchmarks.bench_memory [lines]
+"""
+
+import sys
+import tracemalloc
+
+from sh_doctest.line_block import LineBlock
+
+
+def measure(build) -> tuple[int, object]:
+    tracemalloc.start()
+    value = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, value
+
+
+def main(count: int = 1_000_000) -> None:
+    text = "".join(f"output line {i} with some typical width\n" for i in range(count))
+    compact, block = measure(lambda: LineBlock.from_text(text))
+    expanded, _ = measure(lambda: block.lines)
+    print(f"{count} lines,  {len(text) / 2**20:.1f} MiB of text")
+    print(f"compact LineBlock:      {compact / 2**20:8.1f} MiB")
+    print(f"NumberedLine per line:  {expanded / 2**20:8.1f} MiB additional")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,41 @@
+import pytest
+
+from sh_doctest.line_block import LineBlock
+from sh_doctest.spec import Spec
+from sh_doctest.templates import TemplatedDoc
+
+from .synthetic import generate_spec, output_text
+
+
+def expand(text: str) -> TemplatedDoc:
+    doc = TemplatedDoc("synthetic", LineBlock.from_text(text))
+    doc.parse()
+    return doc
+
+
+def parse(expanded: str) -> Spec:
+    spec = Spec("synthetic.expanded")
+    spec.parse(expanded)
+    return spec
+
+
+@pytest.fixture(scope="session")
+def spec_text() -> str:
+    """10 templates x 10 expansions x 5 cases,  each with 20 lines of output."""
+    return generate_spec(templates=10, expansions=10, cases=5, output_lines=20)
+
+
+@pytest.fixture(scope="session")
+def expanded_text(spec_text) -> str:
+    return expand(spec_text).text
+
+
+@pytest.fixture
+def parsed_spec(expanded_text) -> Spec:
+    return parse(expanded_text)
+
+
+@pytest.fixture(scope="session")
+def large_output() -> LineBlock:
+    """100k lines of command output."""
+    return LineBlock.from_text(output_text(100_000))
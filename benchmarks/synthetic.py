@@ -0,0 +1,46 @@
+"""Generate synthetic specs for benchmarking:  `templates` templates,  each expanded
+`expansions` times,  each expansion defining `cases` cases whose commands print
+`output_lines` lines of `line_width` characters.
+
+    python -m benchmarks.synthetic [templates] [expansions] [cases] [output_lines]
+"""
+
+import sys
+
+
+def output_text(lines: int, width: int = 60) -> str:
+    """Return the `lines` lines of `width` characters printed by each case."""
+    return "".join(f"{i:08d}".ljust(width, "x") + "\n" for i in range(lines))
+
+
+def generate_spec(
+    templates: int = 1,
+    expansions: int = 1,
+    cases: int = 1,
+    output_lines: int = 1,
+    line_width: int = 60,
+) -> str:
+    """Return the text of a synthetic spec,  suitable for TemplatedDoc."""
+    parts = ["This narrative line introduces a synthetic spec.\n\n"]
+    for t in range(templates):
+        parts.append(f"template: t{t}\nvar: n\n")
+        for c in range(cases):
+            parts.append(
+                f"Case {c} of template {t} for expansion <n>.\n"
+                f"name: t{t}-c{c}-<n>\n"
+                f"$ seq -f '%08g' 0 {output_lines - 1} | "
+                f"awk '{{printf \"%-{line_width}s\\n\", $0}}' | tr ' ' x\n"
+                f"{output_text(output_lines, line_width)}\n"
+            )
+        parts.append(f"end_template: t{t}\n\n")
+        for e in range(expansions):
+            parts.append(f"expand: t{t}\nlet: n {e}\n\n")
+    return "".join(parts)
+
+
+def case_count(templates: int, expansions: int, cases: int) -> int:
+    return templates * expansions * cases
+
+
+if __name__ == "__main__":
+    sys.stdout.write(generate_spec(*(int(arg) for arg in sys.argv[1:5])))
@@ -0,0 +1,50 @@
+"""Timings of each phase of processing a spec,  for comparison across commits:
+
+make benchmark          # run and save a new baseline in benchmarks/baselines
+make benchmark-compare  # run and fail on regressions vs. the latest baseline
+"""
+
+import pytest
+
+from sh_doctest import shell, worker
+from sh_doctest.case import Case, CaseChecker
+from sh_doctest.command_result import CommandResult
+from sh_doctest.line_block import LineBlock
+from sh_doctest.numbered_line import NumberedLine
+
+from .conftest import expand, parse
+
+
+def test_expand(benchmark, spec_text):
+    doc = benchmark(expand, spec_text)
+    assert len(doc.expansions) == 100
+
+
+def test_parse(benchmark, expanded_text):
+    spec = benchmark(parse, expanded_text)
+    assert len(spec.test_cases) == 500
+
+
+@pytest.mark.parametrize("engine", ["subprocess", "worker"])
+def test_shell_overhead(benchmark, engine):
+    run = shell.shell if engine == "subprocess" else worker.shell
+    result = benchmark(run, "true", context=shell.ShellContext("", ""))
+    assert result.returncode == 0
+
+
+@pytest.mark.parametrize("matching", [True, False])
+def test_check_pattern(benchmark, large_output, matching):
+    result = large_output if matching else large_output[:-1]
+    checker = CaseChecker(Case())
+    outcome = benchmark(checker.check_pattern, NumberedLine("0"), large_output, result)
+    assert (outcome == "Passed") == matching
+
+
+def test_to_yaml(benchmark, parsed_spec):
+    for case in parsed_spec.test_cases:
+        case.result = CommandResult(
+            NumberedLine("0"), LineBlock(case.expected.stdout), LineBlock()
+        )
+        case.comparison = dict(exit_code="Passed", stdout="Passed", stderr="Passed")
+    text = benchmark(parsed_spec.to_yaml)
+    assert "t9-c4-9" in text
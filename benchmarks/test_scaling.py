@@ -0,0 +1,69 @@
+"""Checks that the cost of each phase grows no faster than expected as its input
+grows.  Each phase is timed at a base size and at FACTOR times that size;  linear
+phases must not slow down by much more than FACTOR.
+"""
+
+import time
+
+import pytest
+
+from sh_doctest.case import Case, CaseChecker
+from sh_doctest.line_block import LineBlock
+from sh_doctest.numbered_line import NumberedLine
+
+from .conftest import expand, parse
+from .synthetic import generate_spec, output_text
+
+FACTOR = 8
+LINEAR_LIMIT = FACTOR * 2  # allow for noise and cache effects
+
+
+def best_time(func, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def growth(func, small, large) -> float:
+    """Return how many times longer `func` takes on `large` than on `small`."""
+    return best_time(func, large) / best_time(func, small)
+
+
+@pytest.mark.parametrize("dimension", ["templates", "expansions", "cases"])
+def test_expand_linear(dimension):
+    small = generate_spec(**{dimension: 10}, output_lines=5)
+    large = generate_spec(**{dimension: 10 * FACTOR}, output_lines=5)
+    assert growth(expand, small, large) < LINEAR_LIMIT
+
+
+def test_parse_linear():
+    small = expand(generate_spec(expansions=20, cases=5)).text
+    large = expand(generate_spec(expansions=20 * FACTOR, cases=5)).text
+    assert growth(parse, small, large) < LINEAR_LIMIT
+
+
+def test_parse_linear_in_output():
+    small = expand(generate_spec(cases=5, output_lines=1000)).text
+    large = expand(generate_spec(cases=5, output_lines=1000 * FACTOR)).text
+    assert growth(parse, small, large) < LINEAR_LIMIT
+
+
+def test_check_pattern_linear():
+    checker = CaseChecker(Case())
+
+    def check(text):
+        block = LineBlock.from_text(text)
+        checker.check_pattern(NumberedLine("0"), block, block)
+
+    assert (
+        growth(check, output_text(20_000), output_text(20_000 * FACTOR)) < LINEAR_LIMIT
+    )
+
+
+def test_to_yaml_linear():
+    small = parse(expand(generate_spec(expansions=10, cases=5)).text)
+    large = parse(expand(generate_spec(expansions=10 * FACTOR, cases=5)).text)
+    assert growth(lambda spec: spec.to_yaml(), small, large) < LINEAR_LIMIT
@@ -0,0 +1,160 @@
+"""This module defines an execution engine built on asyncio subprocesses,  so that
+a single thread can drive hundreds of concurrent cases.
+
+shell() is the coroutine counterpart of shell.shell():  scripts are wrapped and
+delivered the same way,  run in their own session as the run_as identity,  and
+their output is collected by the same Captures and LineMatchers.  On timeout or
+divergence,  or when the task running the case is cancelled,  the whole process
+group is sent SIGTERM and,  after a grace period,  SIGKILL.  asyncio reaps the
+children itself,  so only wall clock time is measured.
+"""
+
+import asyncio
+import os
+import signal
+import subprocess
+import time
+
+from .capture import Capture, LineMatcher
+from .command_result import ResourceUsage
+from .shell import (
+    DEFAULT_TIMEOUT,
+    KILL_GRACE,
+    CompletedCase,
+    OutputDiverged,
+    ShellContext,
+    decode_output,
+    process_run_as,
+    script_path,
+    wrap_script,
+)
+
+# -----------------------------------------------------------------------------------
+
+
+async def shell(
+    script: str,
+    cwd: str = ".",
+    timeout: float = DEFAULT_TIMEOUT,
+    check: bool = False,
+    interpreter: str = "/bin/bash",
+    run_as=None,
+    context: ShellContext | None = None,
+    max_output: int | None = None,
+    watch: LineMatcher | None = None,
+) -> subprocess.CompletedProcess:
+    """Run `script` like shell.shell() without blocking the event loop."""
+    context = context or ShellContext()
+    combined_script = wrap_script(script, interpreter, context)
+    user, group, extra_groups = process_run_as(run_as)
+    with script_path(combined_script, context.delivery) as (path, pass_fds):
+        result = await run_process(
+            (interpreter, path),
+            timeout,
+            check,
+            max_output,
+            watch,
+            pass_fds=pass_fds,
+            cwd=cwd,
+            user=user,
+            group=group,
+            extra_groups=extra_groups,
+        )
+    return result
+
+
+async def run_process(
+    args: tuple[str, ...],
+    timeout: float,
+    check: bool = False,
+    max_output: int | None = None,
+    watch: LineMatcher | None = None,
+    **popen_kwargs,
+) -> subprocess.CompletedProcess:
+    """The coroutine counterpart of shell.run_process().  Instead of a Cancellation
+    the task running it is cancelled,  which kills the process group first.
+    """
+    start = time.monotonic()
+    stdout, stderr = Capture(max_output, watch=watch), Capture(max_output)
+    diverged = asyncio.Event()
+
+    async def collect(stream: asyncio.StreamReader, capture: Capture) -> None:
+        while data := await stream.read(65536):
+            capture.extend(data)
+            if watch and watch.divergence:
+                diverged.set()
+
+    async def finish() -> int:
+        assert process.stdout is not None and process.stderr is not None
+        await asyncio.gather(
+            collect(process.stdout, stdout), collect(process.stderr, stderr)
+        )
+        return await process.wait()
+
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True,
+        **popen_kwargs,
+    )
+    finished = asyncio.ensure_future(finish())
+    stopped = asyncio.ensure_future(diverged.wait())
+    try:
+        try:
+            await asyncio.wait(
+                (finished, stopped),
+                timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        except asyncio.CancelledError:
+            await kill_group(process.pid, finished)
+            raise
+        if not finished.done():
+            await kill_group(process.pid, finished)
+            if watch and watch.divergence:
+                raise OutputDiverged(
+                    args,
+                    *watch.divergence,
+                    output=stdout.getvalue(),
+                    stderr=stderr.getvalue(),
+                )
+            raise subprocess.TimeoutExpired(
+                args, timeout, output=stdout.getvalue(), stderr=stderr.getvalue()
+            )
+        result = CompletedCase(
+            args,
+            finished.result(),
+            stdout.decode(decode_output),
+            stderr.decode(decode_output),
+        )
+    finally:
+        stopped.cancel()
+        stdout.close()
+        stderr.close()
+    result.usage = ResourceUsage(time.monotonic() - start)
+    result.truncated = tuple(
+        name
+        for name, capture in (("stdout", stdout), ("stderr", stderr))
+        if capture.truncated
+    )
+    if check:
+        result.check_returncode()
+    return result
+
+
+async def kill_group(pgid: int, finished: asyncio.Future) -> None:
+    """Send SIGTERM to process group `pgid`,  give it KILL_GRACE seconds to exit
+    and close its output,  then SIGKILL whatever remains.
+    """
+    for sig, grace in ((signal.SIGTERM, KILL_GRACE), (signal.SIGKILL, KILL_GRACE)):
+        try:
+            os.killpg(pgid, sig)
+        except ProcessLookupError:
+            pass
+        try:
+            await asyncio.wait_for(asyncio.shield(finished), grace)
+            return
+        except asyncio.TimeoutError:
+            pass
+    finished.cancel()  # output held open by a process outside the group
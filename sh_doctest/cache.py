@@ -0,0 +1,149 @@
+"""This module defines an on-disk cache of case results keyed by a hash of every
+input which determines the outcome of running a case:  the header and trailer,
+the state captured from setup fixtures,  the commands,  run_as,  the case options
+and the context's timeout and output limits,  the interpreter and engine,  the
+contents of any files the case declares with inputs:,  and the scratch directory
+settings along with the names,  sizes,  and times of the files seeding it.
+
+A cache hit supplies the stored CommandResult in place of running the commands;
+the result is still checked against the expected output as usual.  Cases with
+side effects opt out with cacheable: no.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from . import __version__
+from .case import Case
+from .command_result import CommandResult
+from .line_block import LineBlock
+from .log import log
+from .numbered_line import NumberedLine
+from .scheduler import split_names
+from .shell import ShellContext
+
+# -----------------------------------------------------------------------------------
+
+
+class ResultCache:
+    """Cached results stored as one small JSON file per key beneath `directory`.
+    Entries older than `max_age` seconds are ignored and evicted,  and evict()
+    removes the least recently used entries beyond `max_bytes`.  With `refresh`
+    every case runs and its result replaces any cached one.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 512 * 2**20,
+        max_age: float = 30 * 24 * 3600,
+        refresh: bool = False,
+        interpreter: str = "/bin/bash",
+    ) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.refresh = refresh
+        self.interpreter = interpreter
+
+    def key(self, case: Case, context: ShellContext) -> str | None:
+        """Return the cache key of `case`,  or None if it must not be cached."""
+        if case.option("cacheable", "yes").lower() in ("no", "false", "0"):
+            return None
+        inputs: dict[str, str | None] = {}
+        for path in split_names(case.option("inputs")):
+            try:
+                with open(path, "rb") as input_file:
+                    inputs[path] = hashlib.sha256(input_file.read()).hexdigest()
+            except OSError:
+                inputs[path] = None
+        options = {name: value.line for name, value in sorted(case.options.items())}
+        limits = [context.timeout, context.max_output, context.fail_fast_output]
+        scratch = context.scratch.identity(case) if context.scratch else None
+        identity = [
+            __version__,
+            self.interpreter,
+            context.engine,
+            context.preamble(),
+            context.trailer,
+            str(case.run_as),
+            str(case.commands),
+            inputs,
+            options,
+            limits,
+            scratch,
+        ]
+        return hashlib.sha256(json.dumps(identity).encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key: str) -> CommandResult | None:
+        """Return the cached result for `key`,  if any,  marking it recently used."""
+        if self.refresh:
+            return None
+        path = self.path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                return None
+            with open(path, "r", encoding="utf-8") as entry_file:
+                entry = json.load(entry_file)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return CommandResult(
+            NumberedLine(entry["exit_code"]),
+            LineBlock.from_text(entry["stdout"]),
+            LineBlock.from_text(entry["stderr"]),
+            truncated=tuple(entry.get("truncated", ())),
+        )
+
+    def put(self, key: str, result: CommandResult) -> None:
+        """Store `result` under `key`,  replacing any existing entry atomically."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = dict(
+            exit_code=str(result.exit_code),
+            stdout=str(result.stdout),
+            stderr=str(result.stderr),
+            truncated=list(result.truncated),
+        )
+        handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w", encoding="utf-8") as entry_file:
+                json.dump(entry, entry_file)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def evict(self) -> None:
+        """Remove expired entries,  then the least recently used beyond max_bytes."""
+        entries = []
+        now = time.time()
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.max_age:
+                    self.remove(path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+
+    def remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError as exc:
+            log.debug(f"Could not evict {path}: {exc}")
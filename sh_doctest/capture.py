@@ -0,0 +1,158 @@
+"""This module defines the buffers which collect the stdout and stderr of a case as
+it runs.
+
+Output is held in memory until it passes a spill threshold and is then written to
+an anonymous temporary file instead,  so a case which prints a lot costs disk
+rather than memory while it runs.  Spilled output is decoded straight from an mmap
+of the file,  without first being copied back into memory as bytes.  Output
+beyond a size limit is read and discarded so the case never blocks on a full
+pipe,  and the capture records that it was truncated.  Cases keep at most
+DEFAULT_MAX_OUTPUT bytes of each stream unless given another limit,  since what is
+kept is decoded and compared in memory.
+"""
+
+import codecs
+import locale
+import mmap
+import re
+import tempfile
+from typing import IO
+
+from .line_block import LINE_BREAKS
+from .log import log
+
+# -----------------------------------------------------------------------------------
+
+SPILL_THRESHOLD = 8 * 2**20  # bytes of output held in memory before spilling
+DEFAULT_MAX_OUTPUT = 64 * 2**20  # bytes of each stream a case keeps by default
+
+SIZE_UNITS = {"": 1, "K": 2**10, "M": 2**20, "G": 2**30}
+
+
+def parse_size(value: str) -> int:
+    """Parse a byte count such as 4096,  64K,  10M,  or 1G."""
+    match = re.fullmatch(r"\s*(\d+)\s*([KMG]?)i?B?\s*", value, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size '{value}',  expected e.g. 4096,  64K,  or 10M.")
+    return int(match.group(1)) * SIZE_UNITS[match.group(2).upper()]
+
+
+class Capture:
+    """The output of one stream of a case.  At most `limit` bytes are kept when a
+    limit is given,  and more than `spill` bytes are kept on disk.
+    """
+
+    def __init__(
+        self,
+        limit: int | None = None,
+        spill: int | None = None,
+        watch: "LineMatcher | None" = None,
+    ) -> None:
+        self.limit = limit
+        self.spill = SPILL_THRESHOLD if spill is None else spill
+        self.watch = watch  # sees all output as it arrives
+        self.buffer = bytearray()
+        self.file: IO[bytes] | None = None  # anonymous temporary file once spilled
+        self.size = 0  # bytes kept
+        self.truncated = False
+
+    def extend(self, data: bytes) -> None:
+        """Append `data`,  discarding whatever exceeds the limit."""
+        if self.watch is not None:
+            self.watch.feed(data)
+        if self.limit is not None and self.size + len(data) > self.limit:
+            data = data[: self.limit - self.size]
+            if not self.truncated:
+                log.debug(f"Truncating output at {self.limit} bytes.")
+                self.truncated = True
+        if not data:
+            return
+        self.size += len(data)
+        if self.file is None and self.size > self.spill:
+            self.file = tempfile.TemporaryFile()
+            self.file.write(self.buffer)
+            self.buffer = bytearray()
+        if self.file is None:
+            self.buffer.extend(data)
+        else:
+            self.file.write(data)
+
+    def getvalue(self) -> bytes:
+        """Return the output kept so far as bytes."""
+        if self.file is None:
+            return bytes(self.buffer)
+        self.file.flush()
+        self.file.seek(0)
+        return self.file.read()
+
+    def decode(self, decoder) -> str:
+        """Return the output kept as text,  decoded by `decoder` from memory or from
+        an mmap of the spill file.
+        """
+        if self.file is None:
+            return decoder(self.buffer)
+        self.file.flush()
+        with mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return decoder(mapped)
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class LineMatcher:
+    """Compares output with `expected` lines as it arrives,  recording in
+    `divergence` the index of the first expected line it cannot match and the
+    line actually output.
+
+    Only divergences which the final comparison of the stripped output would also
+    find are recorded:  whitespace-only lines and trailing whitespace,  which might
+    yet be stripped,  are matched once they are known not to be trailing.  Output
+    with line breaks other than LF and CRLF is not matched at all.
+    """
+
+    def __init__(self, expected: list[str]) -> None:
+        self.expected = expected
+        self.decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(
+            errors="replace"
+        )
+        self.pending = ""  # incomplete last line
+        self.matched = 0  # expected lines matched so far
+        self.held: list[str] = []  # whitespace-only lines which may be trailing
+        self.enabled = True
+        self.divergence: tuple[int, str] | None = None
+
+    def feed(self, data: bytes) -> None:
+        if not self.enabled:
+            return
+        lines = (self.pending + self.decoder.decode(data)).split("\n")
+        self.pending = lines.pop()
+        for line in lines:
+            line = line.removesuffix("\r")
+            if any(char in LINE_BREAKS for char in line):
+                self.enabled = False  # numbered differently by LineBlock.from_text
+                return
+            if not self.match(line):
+                self.enabled = False
+                return
+
+    def match(self, line: str) -> bool:
+        if not line.strip():
+            if self.matched or self.held:  # leading blank lines are stripped
+                self.held.append(line)
+            return True
+        if not self.matched and not self.held:
+            line = line.lstrip()
+        for index, actual in enumerate(self.held + [line]):
+            position = self.matched + index
+            last = position == len(self.expected) - 1
+            if (
+                position >= len(self.expected)
+                or (actual.rstrip() if last else actual) != self.expected[position]
+            ):
+                self.divergence = (position, actual)
+                return False
+        self.matched += len(self.held) + 1
+        self.held = []
+        return True
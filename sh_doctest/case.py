@@ -1,4 +1,5 @@
 from typing import Any
+import asyncio
 import difflib
 import subprocess
 import re
@@ -9,7 +10,89 @@ from .log import log
 from .numbered_line import NumberedLine
 from .line_block import LineBlock
 from .command_result import CommandResult
+from . import aio
+from . import capture
 from . import shell
+from . import worker
+
+DIFF_CONTEXT = 3  # unchanged lines shown around each difference
+DIFF_MAX_LINES = 1000  # lines of diff kept in a comparison
+DIFF_MAX_WORK = 4_000_000  # largest product of differing line counts given to difflib
+REPORT_MAX_LINES = 50  # lines of commands or of each comparison in a failure report
+
+HUNK_HEADER = re.compile(r"@@ -(\d+)(,\d+)? \+(\d+)(,\d+)? @@")
+
+
+def bounded_diff(
+    expected: list[str],
+    result: list[str],
+    context: int = DIFF_CONTEXT,
+    max_lines: int = DIFF_MAX_LINES,
+) -> str:
+    """Return a unified diff of `expected` and `result` in the format of
+    difflib.unified_diff(),  computed only over the lines between their common
+    prefix and suffix and cut off after `max_lines`.  When too many lines differ
+    for difflib to finish quickly the differing lines are shown as one hunk.
+    """
+    limit = min(len(expected), len(result))
+    prefix = 0
+    while prefix < limit and expected[prefix] == result[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and expected[-1 - suffix] == result[-1 - suffix]:
+        suffix += 1
+    start = max(0, prefix - context)
+    old = expected[start : len(expected) - max(0, suffix - context)]
+    new = result[start : len(result) - max(0, suffix - context)]
+    changed_old = len(expected) - prefix - suffix
+    changed_new = len(result) - prefix - suffix
+    if changed_old * changed_new <= DIFF_MAX_WORK:
+        lines = difflib.unified_diff(
+            old, new, fromfile="expected", tofile="result", n=context
+        )
+    else:
+        lines = coarse_diff(old, new, prefix - start, len(old) - changed_old)
+
+    def shift(match: re.Match) -> str:
+        old_start, old_len, new_start, new_len = match.groups()
+        return (
+            f"@@ -{int(old_start) + start}{old_len or ''} "
+            f"+{int(new_start) + start}{new_len or ''} @@"
+        )
+
+    diffs = []
+    for count, line in enumerate(lines):
+        if count == max_lines:
+            diffs.append(f"... diff truncated after {max_lines} lines")
+            break
+        diffs.append(HUNK_HEADER.sub(shift, line) if line.startswith("@@") else line)
+    return "\n".join(str(d) for d in diffs).strip()
+
+
+def coarse_diff(old: list[str], new: list[str], lead: int, unchanged: int):
+    """Yield a single hunk replacing the differing middle of `old` with that of
+    `new`,  where `lead` unchanged lines precede it and `unchanged` lines in all
+    surround it.
+    """
+    yield "--- expected\n"
+    yield "+++ result\n"
+    old_len = f",{len(old)}" if len(old) != 1 else ""
+    new_len = f",{len(new)}" if len(new) != 1 else ""
+    yield f"@@ -{1 if old else 0}{old_len} +{1 if new else 0}{new_len} @@\n"
+    tail = unchanged - lead
+    yield from (" " + line for line in old[:lead])
+    yield from ("-" + line for line in old[lead : len(old) - tail])
+    yield from ("+" + line for line in new[lead : len(new) - tail])
+    yield from (" " + line for line in old[len(old) - tail :])
+
+
+def truncate_lines(text: str, max_lines: int = REPORT_MAX_LINES) -> str:
+    """Return the first `max_lines` lines of `text`,  noting how many were cut."""
+    lines = text.split("\n", max_lines)
+    if len(lines) <= max_lines:
+        return text
+    more = lines[max_lines].count("\n") + 1
+    return "\n".join(lines[:max_lines]) + f"\n... {more} more lines"
 
 
 class Case:
@@ -21,14 +104,17 @@ class Case:
         self.narrative = LineBlock()
         self.name = NumberedLine("", -1)
         self.run_as = NumberedLine("", -1)
+        self.options: dict[str, NumberedLine] = {}
         self.commands = LineBlock()
         self.expected = CommandResult()
         self.result = CommandResult()
         self.comparison: dict[str, str | None] = {}
+        self.selected = True  # False when excluded from the run,  e.g. by --shard
+        self.occurrence = 0  # earlier cases in the spec with this name and commands
 
     def to_simpl(self) -> list[dict[str, Any] | str]:
         """Convert the test case to a YAML string."""
-        return [
+        simpl: list[dict[str, Any] | str] = [
             "-" * 80,
             dict(narrative=self.narrative.to_simpl()),
             dict(name=self.name.to_simpl()),
@@ -38,6 +124,16 @@ class Case:
             dict(result=self.result.to_simpl()),
             dict(comparison=self.comparison),
         ]
+        if self.options:
+            simpl.insert(
+                4, dict(options={k: v.to_simpl() for k, v in self.options.items()})
+            )
+        return simpl
+
+    def option(self, name: str, default: str = "") -> str:
+        """Return the value of case option `name`,  e.g. group: or depends:."""
+        value = self.options.get(name)
+        return value.line if value is not None else default
 
     def is_interesting(self) -> bool:
         """Return True if the test case is interesting."""
@@ -46,11 +142,27 @@ class Case:
     def to_yaml(self) -> str:
         return yaml.dump(self.to_simpl())
 
-    def run_and_check(self) -> bool:
-        runner = CaseRunner(self)
+    def run_and_check(
+        self, report: bool = True, context: shell.ShellContext | None = None
+    ) -> bool:
+        """Run and check the case,  returning True if it failed.  Concurrent runners
+        pass report=False and call report_failure() later to keep reports in spec order.
+        """
+        runner = CaseRunner(self, context)
         runner.run()
+        return self.check(report)
+
+    async def run_and_check_async(
+        self, report: bool = True, context: shell.ShellContext | None = None
+    ) -> bool:
+        """Like run_and_check() but running the case with the asyncio engine."""
+        runner = CaseRunner(self, context)
+        await runner.run_async()
+        return self.check(report)
+
+    def check(self, report: bool = True) -> bool:
         checker = CaseChecker(self)
-        if failed := checker.check():
+        if (failed := checker.check()) and report:
             self.report_failure()
         return failed
 
@@ -59,7 +171,7 @@ class Case:
             f"FAILED: '{self.name}' at line {self.name.lineno+1} running as {self.run_as}\n",
             "-" * 80,
             "\n",
-            self.commands.to_text(),
+            truncate_lines(self.commands.to_text()),
             "\n",
             "-" * 80,
             sep="",
@@ -67,26 +179,97 @@ class Case:
         for part, value in self.comparison.items():
             if value != "Passed":
                 print(part + ":")
-                print(value)
+                print(truncate_lines(str(value)))
+
+
+class ClassifiedLine:
+    """A spec line paired with its stripped text and the directive keyword it
+    starts with,  computed once when the line enters the parser.
+    """
+
+    __slots__ = ("raw", "stripped", "kind")
+
+    def __init__(self, raw: NumberedLine) -> None:
+        self.raw = raw
+        self.stripped = raw.strip()
+        self.kind = next(
+            (kind for kind in LineStream.KINDS if self.stripped.startswith(kind)), ""
+        )
+
+    def is_blank(self) -> bool:
+        return not self.stripped
+
+    def is_flush(self, kind: str) -> bool:
+        """Return True if the unstripped line starts with directive `kind`."""
+        return self.kind == kind and self.raw.startswith(kind)
+
+    def option(self) -> str:
+        """Return the option keyword the unstripped line starts with,  if any.
+        Options are only looked for in case headers,  so output or narrative
+        which happens to start with one is left alone.
+        """
+        return next(
+            (kind for kind in LineStream.OPTIONS if self.raw.startswith(kind)), ""
+        )
+
+
+class LineStream:
+    """A forward-only cursor over numbered lines.  Each line is classified exactly
+    once as it is pulled from the underlying iterable so parsing is linear in the
+    number of lines.
+    """
+
+    OPTIONS = (
+        "group:",
+        "depends:",
+        "cacheable:",
+        "inputs:",
+        "timeout:",
+        "max_output:",
+        "fail_fast_output:",
+        "scratch:",
+        "scratch_from:",
+    )
+    KINDS = ("name:", "run_as:", "exit_code:", "!!", "$")
+
+    def __init__(self, lines) -> None:
+        self._lines = iter(lines)
+        self.current: ClassifiedLine | None = None
+        self.advance()
+
+    def __bool__(self) -> bool:
+        return self.current is not None
+
+    def advance(self) -> None:
+        line = next(self._lines, None)
+        self.current = None if line is None else ClassifiedLine(line)
 
 
 class CaseParser:
     previous_name = NumberedLine("", -1)  # persists case-to-case for lightweight cases
     previous_run_as = NumberedLine("", -1)
 
-    def __init__(self, lines: LineBlock) -> None:
-        self.lines = lines
+    def __init__(self, lines) -> None:
+        self.stream = LineStream(lines)
 
     @classmethod
     def from_file(cls, filepath: str) -> "CaseParser":
         with open(filepath, "r", encoding="utf-8") as spec_file:
             spec_text = spec_file.read()
+        return cls.from_text(spec_text)
+
+    @classmethod
+    def from_text(cls, spec_text: str) -> "CaseParser":
         return cls(LineBlock.from_text(spec_text))
 
+    def at_end(self) -> bool:
+        """Return True when every line has been consumed."""
+        return not self.stream
+
     def skip_empty(self):
-        """Remove empty lines from the beginning and end of the list."""
-        while self.lines and not self.lines[0].strip():
-            self.lines = self.lines[1:]
+        """Skip empty lines at the current position."""
+        while self.stream and self.stream.current.is_blank():
+            self.stream.advance()
 
     def reset_previous(self):
         self.previous_name = NumberedLine("", -1)
@@ -94,12 +277,15 @@ class CaseParser:
 
     def parse(self) -> Case:
         log.debug("." * 80)
-        log.debug("Parsing case at line", self.lines[0])
+        log.debug(
+            "Parsing case at line", self.stream.current and self.stream.current.raw
+        )
         case = Case()
         # self.reset_previous()
         self.parse_narrative(case)
         self.parse_name(case)
         self.parse_run_as(case)
+        self.parse_options(case)
         self.parse_commands(case)
         self.parse_exit_code(case)
         self.parse_expected_stdout(case)
@@ -107,33 +293,29 @@ class CaseParser:
         return case
 
     def parse_narrative(self, case: Case):
-        """Parse the narrative from the list of lines, adding it to the
-        narrative and returning the list of remaining lines.
-        """
+        """Parse the narrative up to the first directive,  dropping trailing blank lines."""
         self.skip_empty()
-        while self.lines and not self.lines[0].strip().startswith(
-            ("name:", "run_as:", "$", "exit_code:", "!!")
-        ):
-            case.narrative.append(self.lines[0])
+        stream = self.stream
+        while (current := stream.current) and not current.kind:
+            case.narrative.append(current.raw)
             log.debug("Narrative added:", case.narrative[-1])
-            self.lines = self.lines[1:]
+            stream.advance()
         while case.narrative and case.narrative[-1].strip() == "":
             log.debug("Removing empty line from narrative:", case.narrative[-1].lineno)
-            case.narrative = case.narrative[:-1]
+            case.narrative.pop()
 
     def parse_inheritable(self, case: Case, field_name: str, prefix: str):
         """Parse a field that can be inherited from the previous case."""
         self.skip_empty()
-        if self.lines and self.lines[0].startswith(prefix):
-            setattr(case, field_name, self.lines[0][len(prefix) :].strip())
+        current = self.stream.current
+        if current and current.is_flush(prefix):
+            setattr(case, field_name, current.raw[len(prefix) :].strip())
             log.debug(f"Setting {field_name}:", getattr(case, field_name))
-            self.lines = self.lines[1:]
+            self.stream.advance()
         elif not getattr(case, field_name):  # Inherit if field is not yet set
             previous_field = getattr(self, f"previous_{field_name}")
             setattr(case, field_name, previous_field.copy())
-            getattr(case, field_name).lineno = (
-                self.lines[0].lineno if self.lines else -1
-            )
+            getattr(case, field_name).lineno = current.raw.lineno if current else -1
             log.debug(f"Inheriting prior {field_name}:", getattr(case, field_name))
         setattr(
             self, f"previous_{field_name}", getattr(case, field_name)
@@ -147,89 +329,225 @@ class CaseParser:
         """Parse the run_as field."""
         self.parse_inheritable(case, "run_as", "run_as:")
 
+    def parse_options(self, case: Case):
+        """Parse optional case directives such as group: and depends: which
+        follow name: and run_as:.
+        """
+        self.skip_empty()
+        stream = self.stream
+        while (current := stream.current) and (option := current.option()):
+            keyword = option[:-1]
+            case.options[keyword] = current.raw[len(option) :].strip()
+            log.debug(f"Setting option {keyword}:", case.options[keyword])
+            stream.advance()
+            self.skip_empty()
+
     def parse_commands(self, case: Case):
         self.skip_empty()
-        while self.lines and self.lines[0].startswith("$"):
-            case.commands.append(self.lines[0][2:])
+        stream = self.stream
+        while (current := stream.current) and current.is_flush("$"):
+            case.commands.append(current.raw[2:])
             log.debug("Command added:", case.commands[-1])
-            self.lines = self.lines[1:]
+            stream.advance()
 
     def parse_exit_code(self, case: Case):
         if not case.commands:
             return
-        if self.lines:
-            if self.lines[0].startswith("exit_code:"):
-                case.expected.exit_code = self.lines[0][len("exit_code:") :].strip()
-                log.debug("Setting exit_code:", case.expected.exit_code)
-                self.lines = self.lines[1:]
+        current = self.stream.current
+        if current and current.is_flush("exit_code:"):
+            case.expected.exit_code = current.raw[len("exit_code:") :].strip()
+            log.debug("Setting exit_code:", case.expected.exit_code)
+            self.stream.advance()
 
     def parse_expected_stdout(self, case: Case):
         if not case.commands:  # or case.expected.exit_code.line in ["ignore_stdout"]:
             log.debug("No commands, skipping stdout")
             return
+        stream = self.stream
         while (
-            self.lines
-            and (line := self.lines[0].strip())
-            and not line.startswith(("!!", "$ ", "name:", "run_as:", "exit_code:"))
+            (current := stream.current)
+            and (line := current.stripped)
+            and current.kind not in ("!!", "name:", "run_as:", "exit_code:")
+            and not line.startswith("$ ")
         ):
             if line.startswith(("|", "<BLANKLINE>")):
                 line = NumberedLine("", -1)
             case.expected.stdout.append(line)
             log.debug("Stdout added:", case.expected.stdout[-1])
-            self.lines = self.lines[1:]
+            stream.advance()
 
     def parse_expected_stderr(self, case: Case):
-        if self.lines and self.lines[0].startswith("!!"):
+        stream = self.stream
+        if (current := stream.current) and current.is_flush("!!"):
             # assume exit_code:fail if !! and default ok
             if case.expected.exit_code == NumberedLine("0"):
                 log.debug("Assuming exit_code:fail based on stderr !!")
-                case.expected.exit_code = NumberedLine("fail", self.lines[0].lineno)
-            self.lines = self.lines[1:]  # skip !!
+                case.expected.exit_code = NumberedLine("fail", current.raw.lineno)
+            stream.advance()  # skip !!
         if not case.commands or case.expected.exit_code.line in ["ignore_stderr"]:
             log.debug("No commands or ignore_stderr, etc, skipping stderr")
             return
         while (
-            self.lines
-            and (line := self.lines[0].strip())
-            and not line.startswith(("$", "name:", "run_as:", "exit_code:"))
+            (current := stream.current)
+            and (line := current.stripped)
+            and current.kind not in ("$", "name:", "run_as:", "exit_code:")
         ):
             if line.startswith(("|", "<BLANKLINE>")):
                 log.debug("Trimming stderr line:", line)
                 line = NumberedLine("", -1)
             case.expected.stderr.append(line)
             log.debug("Stderr added:", case.expected.stderr[-1])
-            self.lines = self.lines[1:]
+            stream.advance()
 
 
 class CaseRunner:
-    def __init__(self, case: Case) -> None:
+    def __init__(self, case: Case, context: shell.ShellContext | None = None) -> None:
         self.case: Case = case
+        self.context = context
+        self.cache_key: str | None = None
+        self.cwd: str | None = None  # scratch directory the case runs in
 
     def run(self) -> None:
         """Run the test case."""
+        if self.context and self.context.engine == "asyncio":
+            asyncio.run(self.run_async())
+            return
+        if (command_text := self.begin()) is None:
+            return
+        use_worker = self.context and self.context.engine == "worker"
+        engine = worker if use_worker else shell
+        try:
+            self.finish(engine.shell(command_text, **self.shell_options()))
+        except (subprocess.TimeoutExpired, shell.OutputDiverged) as exc:
+            self.interrupted(command_text, exc)
+        finally:
+            self.end()
+
+    async def run_async(self) -> None:
+        """Run the test case with the asyncio engine."""
+        if (command_text := self.begin()) is None:
+            return
+        try:
+            self.finish(await aio.shell(command_text, **self.shell_options()))
+        except (subprocess.TimeoutExpired, shell.OutputDiverged) as exc:
+            self.interrupted(command_text, exc)
+        finally:
+            self.end()
+
+    def begin(self) -> str | None:
+        """Return the commands to run,  or None if there are none or the result
+        came from the cache.
+        """
         command_text = str(self.case.commands)
-        if command_text.strip():
+        if not command_text.strip():
+            return None
+        context = self.context
+        cache = context.cache if context else None
+        if cache and context and (key := cache.key(self.case, context)):
+            if (cached := cache.get(key)) is not None:
+                log.debug(f"Reusing cached result for {self.case.name}")
+                self.case.result = cached
+                return None
+            self.cache_key = key
+        if scratch := self.context.scratch if self.context else None:
+            self.cwd = scratch.acquire(self.case)
+        log.debug("." * 80)
+        log.debug(f"Running {self.case.name} as {self.case.run_as}:\n{command_text}\n")
+        return command_text
+
+    def end(self) -> None:
+        """Hand back the case's scratch directory,  if any,  for removal."""
+        if self.cwd and self.context and self.context.scratch:
+            self.context.scratch.release(self.cwd)
+            self.cwd = None
+
+    def shell_options(self) -> dict[str, Any]:
+        return dict(
+            cwd=self.cwd or ".",
+            timeout=self.timeout(),
+            run_as=self.case.run_as,
+            context=self.context,
+            max_output=self.max_output(),
+            watch=self.watch(),
+        )
+
+    def finish(self, result: subprocess.CompletedProcess) -> None:
+        """Record the result of running the commands,  caching it if possible."""
+        self.case.result = CommandResult.from_completed_process(result)
+        if self.cache_key and self.context and self.context.cache:
+            self.context.cache.put(self.cache_key, self.case.result)
+        log.debug(
+            f"Result:\nExitCode:\n{result.returncode}\nStdout:\n{result.stdout}\nStderr:\n{result.stderr}"
+        )
+
+    def interrupted(
+        self,
+        command_text: str,
+        exc: subprocess.TimeoutExpired | shell.OutputDiverged,
+    ) -> None:
+        """Record the partial result of a case stopped by a timeout or divergence."""
+        stdout = shell.decode_output(exc.stdout or b"")
+        stderr = shell.decode_output(exc.stderr or b"")
+        if isinstance(exc, shell.OutputDiverged):
+            expected = self.case.expected.stdout
+            where = (
+                f"line {expected[exc.index].lineno+1}"
+                if exc.index < len(expected)
+                else "the end of expected output"
+            )
+            log.error(
+                f"Stopped {self.case.name}:  stdout diverged at {where},  "
+                f"got: {exc.line!r}"
+            )
+            exit_code = "diverged"
+        else:
+            log.error(
+                f"Timeout after {exc.timeout}s: {self.case.name}\n{command_text}\n"
+                f"stdout:\n{stdout}\nstderr:\n{stderr}\n"
+            )
+            exit_code = "timeout"
+        self.case.result = CommandResult(
+            exit_code=NumberedLine(exit_code, -1),
+            stdout=LineBlock.from_text(stdout),
+            stderr=LineBlock.from_text(stderr),
+        )
+
+    def timeout(self) -> float:
+        """Seconds the case may run:  its timeout: option,  else the context's."""
+        if value := self.case.option("timeout"):
             try:
-                log.debug("." * 80)
-                log.debug(
-                    f"Running {self.case.name} as {self.case.run_as}:\n{command_text}\n"
-                )
-                result = shell.shell(command_text, run_as=self.case.run_as)
-                self.case.result = CommandResult.from_completed_process(result)
-                log.debug(
-                    f"Result:\nExitCode:\n{result.returncode}\nStdout:\n{result.stdout}\nStderr:\n{result.stderr}"
-                )
-            except subprocess.TimeoutExpired as exc:
-                stdout = exc.stdout.decode("utf-8") if exc.stdout else ""
-                stderr = exc.stderr.decode("utf-8") if exc.stderr else ""
-                log.error(
-                    f"Timeout: {self.case.name}\n{command_text}\nstdout:\n{stdout}\nstderr:\n{stderr}\n"
-                )
-                self.case.result = CommandResult(
-                    exit_code=NumberedLine("timeout", -1),
-                    stdout=[],
-                    stderr=[],
-                )
+                return float(value)
+            except ValueError:
+                raise ValueError(
+                    f"Invalid timeout: '{value}' for case '{self.case.name}'."
+                ) from None
+        return self.context.timeout if self.context else shell.DEFAULT_TIMEOUT
+
+    def max_output(self) -> int:
+        """Bytes of each stream kept:  the max_output: option,  else the context's,
+        else DEFAULT_MAX_OUTPUT,  which bounds what is decoded for comparison.
+        """
+        if value := self.case.option("max_output"):
+            return capture.parse_size(value)
+        if self.context and self.context.max_output is not None:
+            return self.context.max_output
+        return capture.DEFAULT_MAX_OUTPUT
+
+    def watch(self) -> capture.LineMatcher | None:
+        """With fail_fast_output: yes or --fail-fast-output,  a matcher which stops
+        the case at its first line of stdout that cannot match the expected output.
+        """
+        if value := self.case.option("fail_fast_output").lower():
+            enabled = value in ("yes", "true", "1")
+        else:
+            enabled = bool(self.context and self.context.fail_fast_output)
+        if (
+            not enabled
+            or self.case.expected.exit_code.line in ["ignore_stdout", "ignore_stderr"]
+            or "<invert-check>" in self.case.name
+        ):
+            return None
+        return capture.LineMatcher(self.case.expected.stdout.str_list())
 
 
 class CaseChecker:
@@ -263,34 +581,46 @@ class CaseChecker:
             return "Passed"
         elif expected in ["0", "ok", "ignore_stdout"] and result in ["0", "ok"]:
             return "Passed"
-        elif ((expected in ["fail", "ignore_stderr"] or
-               (re.match(r"\d+", expected) and expected != "0"))
-              and result not in ["0", "ok"]):
+        elif (
+            expected in ["fail", "ignore_stderr"]
+            or (re.match(r"\d+", expected) and expected != "0")
+        ) and result not in ["0", "ok"]:
             return "Passed"
         else:
             return f"Expected exit code {expected},  got {result}."
 
     def check_stdout(self) -> str:
-        return self.check_pattern(
-            self.case.expected.exit_code,
-            self.case.expected.stdout,
-            self.case.result.stdout,
+        return self.flag_truncated(
+            "stdout",
+            self.check_pattern(
+                self.case.expected.exit_code,
+                self.case.expected.stdout,
+                self.case.result.stdout,
+            ),
         )
 
     def check_stderr(self) -> str:
-        return self.check_pattern(
-            self.case.expected.exit_code,
-            self.case.expected.stderr,
-            self.case.result.stderr,
+        return self.flag_truncated(
+            "stderr",
+            self.check_pattern(
+                self.case.expected.exit_code,
+                self.case.expected.stderr,
+                self.case.result.stderr,
+            ),
         )
 
+    def flag_truncated(self, stream: str, comparison: str) -> str:
+        """Note on a failed comparison that `stream` was cut short at max_output."""
+        if comparison == "Passed" or stream not in self.case.result.truncated:
+            return comparison
+        return f"Output exceeded max_output and was truncated.\n{comparison}"
+
     def check_pattern(
         self, exit_code: NumberedLine, expected: LineBlock, result: LineBlock
     ) -> str:
         if exit_code.line in ["ignore_stdout", "ignore_stderr"]:
             return "Passed"
-        diffs = difflib.unified_diff(
-            expected.str_list(), result.str_list(), fromfile="expected", tofile="result"
-        )
-        diffs_str = "\n".join(str(d) for d in diffs).strip()
+        if expected == result:
+            return "Passed"
+        diffs_str = bounded_diff(expected.str_list(), result.str_list())
         return diffs_str or "Passed"
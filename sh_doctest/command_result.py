@@ -5,18 +5,99 @@ from .numbered_line import NumberedLine
 from .line_block import LineBlock
 
 
+class ResourceUsage:
+    """The cost of running a case:  wall clock seconds,  user and system CPU seconds,
+    and the peak resident set size in KiB of the largest process in its tree.
+    Measurements an engine cannot make are None.  A forked child is charged for the
+    pages it shares with sh_doctest until it execs,  so on Linux max_rss is never
+    less than the peak RSS sh_doctest had when it started the case,  `shared_rss`.
+    """
+
+    __slots__ = ("duration", "user_time", "system_time", "max_rss", "shared_rss")
+
+    def __init__(
+        self,
+        duration: float,
+        user_time: float | None = None,
+        system_time: float | None = None,
+        max_rss: int | None = None,
+        shared_rss: int | None = None,
+    ) -> None:
+        self.duration = duration
+        self.user_time = user_time
+        self.system_time = system_time
+        self.max_rss = max_rss
+        self.shared_rss = shared_rss
+
+    def __repr__(self) -> str:
+        return (
+            f"ResourceUsage({self.duration!r}, {self.user_time!r}, "
+            f"{self.system_time!r}, {self.max_rss!r}, {self.shared_rss!r})"
+        )
+
+    @property
+    def cpu_time(self) -> float | None:
+        """User plus system CPU seconds,  if measured."""
+        if self.user_time is None or self.system_time is None:
+            return None
+        return self.user_time + self.system_time
+
+    @property
+    def case_rss(self) -> int | None:
+        """The peak RSS in KiB of the case's own processes:  max_rss if it exceeds
+        shared_rss and so cannot be pages inherited from sh_doctest.  None if not
+        measured or if the case's peak is hidden below shared_rss.
+        """
+        if self.max_rss is None or self.shared_rss is None:
+            return None
+        return self.max_rss if self.max_rss > self.shared_rss else None
+
+    @classmethod
+    def from_rusage(
+        cls, duration: float, rusage, shared_rss: int | None = None
+    ) -> "ResourceUsage":
+        """Create from the resource.struct_rusage returned by os.wait4(),  given
+        the peak RSS of sh_doctest when the child was started.
+        """
+        return cls(
+            duration, rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss, shared_rss
+        )
+
+    def to_simpl(self) -> dict[str, float | int]:
+        simpl = dict(
+            duration=self.duration,
+            user_time=self.user_time,
+            system_time=self.system_time,
+            max_rss_kib=self.max_rss,
+            shared_rss_kib=self.shared_rss,
+        )
+        return {
+            key: round(value, 6) if isinstance(value, float) else value
+            for key, value in simpl.items()
+            if value is not None
+        }
+
+
 class CommandResult:
     """The result of a single command,  including the exit code,  stdout,  and stderr."""
 
     def __init__(
         self,
         exit_code: NumberedLine | None = None,
-        stdout: list[NumberedLine] | list[str] | None = None,
-        stderr: list[NumberedLine] | list[str] | None = None,
+        stdout: LineBlock | list[NumberedLine] | list[str] | None = None,
+        stderr: LineBlock | list[NumberedLine] | list[str] | None = None,
+        usage: ResourceUsage | None = None,
+        truncated: tuple[str, ...] = (),
     ) -> None:
         self.exit_code: NumberedLine = exit_code or NumberedLine("0")
-        self.stdout: LineBlock = LineBlock(stdout) or LineBlock()
-        self.stderr: LineBlock = LineBlock(stderr) or LineBlock()
+        self.stdout: LineBlock = (
+            stdout if isinstance(stdout, LineBlock) else LineBlock(stdout)
+        )
+        self.stderr: LineBlock = (
+            stderr if isinstance(stderr, LineBlock) else LineBlock(stderr)
+        )
+        self.usage = usage  # measured only when the commands actually ran
+        self.truncated = truncated  # names of streams cut short at max_output:
 
     def __bool__(self) -> bool:
         """Return True if this is not a default empty result."""
@@ -27,20 +108,29 @@ class CommandResult:
         )
 
     def to_simpl(self) -> list[dict[str, Any]]:
-        return (
-            [
-                {"exit_code": self.exit_code.to_simpl()},
-                {"stdout": self.stdout.to_simpl()},
-                {"stderr": self.stderr.to_simpl()},
-            ]
-            if self
-            else []
-        )
+        if not self:
+            return []
+        simpl: list[dict[str, Any]] = [
+            {"exit_code": self.exit_code.to_simpl()},
+            {"stdout": self.stdout.to_simpl()},
+            {"stderr": self.stderr.to_simpl()},
+        ]
+        if self.truncated:
+            simpl.append({"truncated": list(self.truncated)})
+        if self.usage is not None:
+            simpl.append({"usage": self.usage.to_simpl()})
+        return simpl
 
     @classmethod
     def from_completed_process(cls, result: subprocess.CompletedProcess):
         stdout_block = LineBlock.from_text(result.stdout)
         stderr_block = LineBlock.from_text(result.stderr)
+        usage = getattr(result, "usage", None)
+        truncated = getattr(result, "truncated", ())
         return cls(
-            NumberedLine(str(result.returncode)), stdout_block.lines, stderr_block.lines
+            NumberedLine(str(result.returncode)),
+            stdout_block,
+            stderr_block,
+            usage if isinstance(usage, ResourceUsage) else None,
+            truncated if isinstance(truncated, tuple) else (),
         )
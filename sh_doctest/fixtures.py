@@ -0,0 +1,168 @@
+"""This module runs the setup:, teardown:, and session_setup: pseudo-cases which
+prepare the environment of the cases of a spec once rather than for every case.
+
+A setup fixture runs once,  like an ordinary case,  and the state it leaves behind
+is captured as bash source:  the environment variables it exported or changed,
+every function definition,  the shell options,  and the umask.  That source is
+added to the context and evaluated by each later case in place of re-running the
+setup commands.  session_setup: works the same way but runs at most once per
+sh_doctest run,  however many specs declare it and however many processes run
+them;  its state is shared through files in the session directory.
+"""
+
+import atexit
+import fcntl
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from .case import Case, CaseRunner
+from .log import log
+from . import shell
+
+# -----------------------------------------------------------------------------------
+
+FIXTURES = ("session_setup", "setup", "teardown")
+
+STATE_MARKER = "--- sh-doctest fixture state ---"
+
+# Environment variables which describe the capturing shell itself.
+IGNORED_VARIABLES = ("PWD", "OLDPWD", "SHLVL", "_")
+
+ENVIRONMENT = r"""for __sh_doctest_name in $(compgen -e); do
+    printf '%s\0' "$(declare -p "$__sh_doctest_name")"
+done
+"""
+
+CAPTURE = f"""
+printf '%s\\0' '{STATE_MARKER}'
+{ENVIRONMENT}printf '%s\\0' '{STATE_MARKER}'
+declare -f
+shopt -po
+shopt -p
+echo "umask $(umask)"
+printf '%s\\0' '{STATE_MARKER}'
+"""
+
+
+class FixtureError(RuntimeError):
+    """A setup fixture failed so the cases which rely on it cannot run."""
+
+
+def capture_state(fixture: Case, context: shell.ShellContext) -> str:
+    """Run `fixture` and return the bash source which recreates its state."""
+    script = (
+        f"printf '%s\\0' '{STATE_MARKER}'\n{ENVIRONMENT}"
+        f"printf '%s\\0' '{STATE_MARKER}'\n{fixture.commands}\n{CAPTURE}"
+    )
+    result = run_fixture(fixture, context, script, check=True)
+    parts = result.stdout.split(STATE_MARKER + "\0")
+    if len(parts) < 6:
+        raise FixtureError(
+            f"Fixture '{fixture.name}' at line {fixture.name.lineno+1} exited "
+            f"before its state could be captured:\n{result.stderr}"
+        )
+    _, before, output, after, definitions = parts[:5]
+    if output.strip():
+        log.debug(f"Output of {fixture.name}:\n{output}")
+    unchanged = set(before.split("\0"))
+    variables = [
+        declaration
+        for declaration in after.split("\0")
+        if declaration
+        and declaration not in unchanged
+        and variable_name(declaration) not in IGNORED_VARIABLES
+    ]
+    return (
+        f"# State captured from {fixture.name} at line {fixture.name.lineno+1}\n"
+        + "".join(declaration + "\n" for declaration in variables)
+        + definitions
+    )
+
+
+def variable_name(declaration: str) -> str:
+    """Return the name declared by a `declare -p` line."""
+    return declaration.split(" ", 2)[-1].split("=", 1)[0]
+
+
+def run_fixture(
+    fixture: Case,
+    context: shell.ShellContext,
+    script: str | None = None,
+    check: bool = False,
+) -> subprocess.CompletedProcess:
+    """Run the commands of `fixture`,  or `script`,  as its run_as identity.  With
+    `check`,  FixtureError is raised if it fails or times out.
+    """
+    log.debug(f"Running fixture {fixture.name}:\n{fixture.commands}\n")
+    try:
+        result = shell.shell(
+            str(fixture.commands) if script is None else script,
+            timeout=CaseRunner(fixture, context).timeout(),
+            run_as=fixture.run_as,
+            context=context,
+        )
+    except subprocess.TimeoutExpired as exc:
+        raise FixtureError(
+            f"Fixture '{fixture.name}' at line {fixture.name.lineno+1} timed out "
+            f"after {exc.timeout}s."
+        ) from None
+    if check and result.returncode:
+        raise FixtureError(
+            f"Fixture '{fixture.name}' at line {fixture.name.lineno+1} failed "
+            f"with exit code {result.returncode}:\n{result.stderr}"
+        )
+    return result
+
+
+_session_lock = threading.Lock()
+_session_dir: str | None = None
+
+
+def session_dir(context: shell.ShellContext) -> str:
+    """Return the directory of session state shared by the whole run,  creating a
+    temporary one for this process if the context does not name one.
+    """
+    global _session_dir
+    if context.session_dir:
+        return context.session_dir
+    with _session_lock:
+        if _session_dir is None:
+            _session_dir = tempfile.mkdtemp(prefix="sh-doctest-session-")
+            atexit.register(shutil.rmtree, _session_dir, True)
+    return _session_dir
+
+
+def session_state(fixture: Case, context: shell.ShellContext) -> str:
+    """Return the state of session_setup `fixture`,  running it only if no other
+    spec in this run has.  Concurrent specs wait on a lock while it runs.
+    """
+    identity = "\0".join(
+        (context.header, context.trailer, str(fixture.run_as), str(fixture.commands))
+    )
+    key = hashlib.sha256(identity.encode("utf-8")).hexdigest()
+    path = os.path.join(session_dir(context), key)
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if os.path.exists(path + ".failed"):
+                with open(path + ".failed", encoding="utf-8") as failed:
+                    raise FixtureError(failed.read())
+            if os.path.exists(path + ".sh"):
+                log.debug(f"Reusing state of {fixture.name} from this session.")
+                with open(path + ".sh", encoding="utf-8") as state:
+                    return state.read()
+            try:
+                text = capture_state(fixture, context)
+            except FixtureError as exc:
+                with open(path + ".failed", "w", encoding="utf-8") as failed:
+                    failed.write(str(exc))
+                raise
+            with open(path + ".sh", "w", encoding="utf-8") as state:
+                state.write(text)
+            return text
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
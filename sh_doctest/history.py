@@ -0,0 +1,138 @@
+"""This module identifies cases across runs and machines and records how long they
+took and whether they failed,  so later runs can balance and order work by past
+results.
+
+A case key combines the spec path as given on the command line,  the case name,
+and a hash of the commands,  so editing a case's commands makes it a new case.
+Cases repeating the name and commands of an earlier case in the same spec add
+their occurrence number so they remain distinct.
+A timings file is a JSON object mapping case keys to durations in seconds.  A
+run history maps case keys to their last few durations and their last status,
+and can also be read as a timings file.  Keys of cases a spec no longer defines
+are dropped from the history when that spec is run again.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+from .case import Case
+from .log import log
+
+# -----------------------------------------------------------------------------------
+
+
+def case_key(spec_path: str, case: Case) -> str:
+    """Return the identity of `case` within the spec at `spec_path`."""
+    digest = hashlib.sha256(str(case.commands).encode("utf-8")).hexdigest()
+    key = f"{spec_path}::{case.name}::{digest[:16]}"
+    return f"{key}::{case.occurrence}" if case.occurrence else key
+
+
+def load_durations(paths: list[str]) -> dict[str, float]:
+    """Merge the timings files at `paths`,  later files taking precedence.  Missing
+    or unreadable files are skipped.
+    """
+    durations: dict[str, float] = {}
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8") as timings_file:
+                timings = json.load(timings_file)
+        except FileNotFoundError:
+            log.debug("No timings file at", path)
+            continue
+        except (OSError, ValueError) as exc:
+            log.warning(f"Ignoring unreadable timings file {path}: {exc}")
+            continue
+        for key, value in timings.items():
+            if isinstance(value, dict):  # a RunHistory entry
+                value = RunHistory.mean(value.get("durations"))
+            if isinstance(value, (int, float)):
+                durations[key] = float(value)
+    return durations
+
+
+def save_durations(path: str, durations: dict[str, float]) -> None:
+    """Atomically write `durations` to the timings file at `path`."""
+    save_json(path, durations)
+
+
+def save_json(path: str, value) -> None:
+    """Atomically replace the file at `path` with `value` as JSON."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as json_file:
+            json.dump(value, json_file, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+class RunHistory:
+    """The recent durations and the last status of each case key,  kept in a JSON
+    file and updated after every run.
+    """
+
+    KEEP = 5  # durations remembered per case
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.entries: dict[str, dict] = {}
+
+    @classmethod
+    def load(cls, path: str) -> "RunHistory":
+        history = cls(path)
+        try:
+            with open(path, encoding="utf-8") as history_file:
+                history.entries = json.load(history_file)
+        except FileNotFoundError:
+            log.debug("Starting new run history", path)
+        except (OSError, ValueError) as exc:
+            log.warning(f"Ignoring unreadable run history {path}: {exc}")
+        return history
+
+    def record(self, key: str, failed: bool, duration: float | None = None) -> None:
+        entry = self.entries.setdefault(key, {"durations": []})
+        entry["status"] = "failed" if failed else "passed"
+        if duration is not None:
+            durations = entry["durations"] + [round(duration, 6)]
+            entry["durations"] = durations[-self.KEEP :]
+
+    def duration(self, key: str) -> float | None:
+        """The mean of the recent durations of `key`,  if any."""
+        return self.mean(self.entries.get(key, {}).get("durations"))
+
+    @staticmethod
+    def mean(durations: list[float] | None) -> float | None:
+        return sum(durations) / len(durations) if durations else None
+
+    def failed(self, key: str) -> bool:
+        return self.entries.get(key, {}).get("status") == "failed"
+
+    def failed_keys(self) -> set[str]:
+        """The keys of the cases which failed the last time they ran."""
+        return {key for key in self.entries if self.failed(key)}
+
+    def prune(self, spec_keys: dict[str, set[str]]) -> None:
+        """Forget the cases of the specs in `spec_keys`,  which maps spec paths to
+        the keys of the cases they now define,  that they no longer define.  Cases
+        whose commands were edited would otherwise stay failed forever.
+        """
+        for key in list(self.entries):
+            spec_path = key.partition("::")[0]
+            if spec_path in spec_keys and key not in spec_keys[spec_path]:
+                del self.entries[key]
+
+    def durations(self) -> dict[str, float]:
+        """The mean recent duration of every key with one,  as a timings dict."""
+        return {
+            key: duration
+            for key in self.entries
+            if (duration := self.duration(key)) is not None
+        }
+
+    def save(self) -> None:
+        save_json(self.path, self.entries)
@@ -1,57 +1,114 @@
+from array import array
 import functools
 
 from .numbered_line import NumberedLine
 
+# Characters which str.splitlines() treats as line boundaries.
+LINE_BREAKS = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+
 
 @functools.total_ordering
 class LineBlock:
-    """A block of lines,  each with a line number."""
+    """A block of lines,  each with a line number.
+
+    Blocks made from text are stored compactly as the text itself plus arrays of
+    line start and end offsets,  with NumberedLine objects created only as lines are
+    accessed.  Slicing such a block,  or popping from either end,  produces a view on
+    the same buffer.  Any other mutation converts the block to a list of lines.
+    """
+
+    __slots__ = ("_lines", "_text", "_starts", "_ends", "_start", "_stop")
+
+    # Set only while the block is in compact form.
+    _text: str
+    _starts: array
+    _ends: array
+    _start: int
+    _stop: int
 
     def __init__(self, lines: list[str] | list[NumberedLine] | None = None) -> None:
-        self.lines: list[NumberedLine] = self._to_numbered(
+        self._lines: list[NumberedLine] | None = self._to_numbered(
             [] if lines is None else lines
         )
 
     def _to_numbered(self, lines: list[str] | list[NumberedLine]) -> list[NumberedLine]:
         return [
-            NumberedLine(line)
-            if isinstance(line, NumberedLine)
-            else NumberedLine(line, lineno)
+            (
+                NumberedLine(line)
+                if isinstance(line, NumberedLine)
+                else NumberedLine(line, lineno)
+            )
             for lineno, line in enumerate(lines)
         ]
 
+    @classmethod
+    def _view(cls, text: str, starts: array, ends: array, start: int, stop: int):
+        self = cls.__new__(cls)
+        self._lines = None
+        self._text, self._starts, self._ends = text, starts, ends
+        self._start, self._stop = start, stop
+        return self
+
+    def _line(self, index: int) -> NumberedLine:
+        """Create the line at absolute buffer `index`,  numbered by its position."""
+        return NumberedLine(self._text[self._starts[index] : self._ends[index]], index)
+
+    def _strings(self):
+        if self._lines is not None:
+            return (line.line for line in self._lines)
+        text, starts, ends = self._text, self._starts, self._ends
+        return (text[starts[i] : ends[i]] for i in range(self._start, self._stop))
+
+    @property
+    def lines(self) -> list[NumberedLine]:
+        """The lines as a list,  converting a compact block to list form."""
+        if self._lines is None:
+            self._lines = list(self)
+            del self._text, self._starts, self._ends
+        return self._lines
+
+    @lines.setter
+    def lines(self, lines: list[NumberedLine]) -> None:
+        self._lines = lines
+
     def __repr__(self) -> str:
-        return f"LineBlock({repr(self.lines)})"
+        return f"LineBlock({repr(list(self))})"
 
     def __str__(self) -> str:
-        return "\n".join(str(line) for line in self.lines)
+        return "\n".join(self._strings())
 
     def __eq__(self, other) -> bool:
         if isinstance(other, self.__class__):
-            return self.lines == other.lines
+            return len(self) == len(other) and all(
+                mine == theirs
+                for mine, theirs in zip(self._strings(), other._strings())
+            )
         else:
-            return self.lines == other
+            return list(self) == other
 
     def __lt__(self, other) -> bool:
         if isinstance(other, self.__class__):
-            return self.lines < other.lines
+            return list(self) < list(other)
         else:
-            return self.lines < other
+            return list(self) < other
 
     def to_simpl(self) -> list[list[int | str] | str]:
-        return [line.to_simpl() for line in self.lines]
+        return [line.to_simpl() for line in self]
 
     @classmethod
     def from_text(cls, text: str) -> "LineBlock":
-        return cls(
-            [
-                NumberedLine(line, lineno)
-                for lineno, line in enumerate(text.strip().splitlines())
-            ]
-        )
+        text = text.strip()
+        typecode = "I" if len(text) < 2**32 else "Q"
+        starts, ends = array(typecode), array(typecode)
+        position = 0
+        for line in text.splitlines(True):
+            starts.append(position)
+            ends.append(position + len(line.rstrip(LINE_BREAKS)))
+            position += len(line)
+        return cls._view(text, starts, ends, 0, len(starts))
 
     def to_text(self) -> str:
-        return "\n".join(str(line) for line in self.lines)
+        return "\n".join(self._strings())
 
     @classmethod
     def from_file(cls, filepath: str) -> "LineBlock":
@@ -60,26 +117,59 @@ class LineBlock:
         return cls.from_text(spec_text)
 
     def __getitem__(self, key):  # -> "NumberedLine" | "LineBlock":
+        if self._lines is not None:
+            if isinstance(key, slice):
+                return LineBlock(self._lines[key])
+            elif isinstance(key, int):
+                return self._lines[key]
+            else:
+                raise KeyError(f"Invalid key {key}.")
         if isinstance(key, slice):
-            return LineBlock(self.lines[key])
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return LineBlock(list(self)[key])
+            return self._view(
+                self._text,
+                self._starts,
+                self._ends,
+                self._start + start,
+                self._start + max(start, stop),
+            )
         elif isinstance(key, int):
-            return self.lines[key]
+            length = len(self)
+            if not -length <= key < length:
+                raise IndexError("LineBlock index out of range")
+            return self._line(self._start + key % length)
         else:
             raise KeyError(f"Invalid key {key}.")
 
+    def __iter__(self):
+        if self._lines is not None:
+            return iter(self._lines)
+        return (self._line(i) for i in range(self._start, self._stop))
+
     def __len__(self) -> int:
-        return len(self.lines)
+        if self._lines is not None:
+            return len(self._lines)
+        return self._stop - self._start
 
     def __bool__(self) -> bool:
-        return bool(len(self.lines))
+        return bool(len(self))
 
     def append(self, line: NumberedLine) -> None:
         self.lines.append(line)
 
     def pop(self, index: int = -1) -> NumberedLine:
+        if self._lines is None and index in (0, -1, len(self) - 1):
+            line = self[index]
+            if index == 0:
+                self._start += 1
+            else:
+                self._stop -= 1
+            return line
         line = self.lines[index]
         del self.lines[index]
         return line
 
     def str_list(self) -> list[str]:
-        return [str(line) for line in self.lines]
+        return list(self._strings())
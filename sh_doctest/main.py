@@ -1,17 +1,36 @@
-"""This module defines the top level program and CLI interface for sh_doctest.
-"""
+"""This module defines the top level program and CLI interface for sh_doctest."""
 
 import sys
 import argparse
+import contextlib
+import json
+import tempfile
+import threading
+from typing import Iterator, TextIO
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 from .templates import TemplatedDoc
+from . import templates
 from .spec import Spec
+from .case import Case
+from .shell import ShellContext, DELIVERIES, DEFAULT_TIMEOUT
+from .cache import ResultCache
+from .capture import parse_size
+from .command_result import ResourceUsage
+from .parse_cache import ParseCache, ParsedSpec
+from .history import RunHistory, case_key, load_durations, save_durations
+from . import scratch
+from . import shard
+from .selection import check_expression, compile_expression, parse_selector, spans_lines
 from .log import log
 
 # -----------------------------------------------------------------------------------
 
 
+SCHEDULES = ("spec", "longest-first", "failed-first")
+
+
 def parse_args(argv: list[str]) -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Run a set of shell script tests and verify expected results."
@@ -19,7 +38,24 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
     parser.add_argument(
         "test_specs",
         nargs="*",
-        help="Filepath to test specification file.  Required.",
+        help=(
+            "Filepath to test specification file.  Required.  spec.txt:LINE or "
+            "spec.txt:START-END runs only the cases spanning those lines of the "
+            "expanded spec."
+        ),
+    )
+    parser.add_argument(
+        "-k",
+        dest="keyword",
+        type=check_expression,
+        default=None,
+        metavar="EXPRESSION",
+        help=(
+            "Run only the cases whose names match EXPRESSION:  name patterns combined "
+            "with and,  or,  not,  and parentheses.  Patterns with *,  ?,  or [ are "
+            "globs matching the whole name,  others match any part of it,  ignoring "
+            "case."
+        ),
     )
     parser.add_argument(
         "--dry-run",
@@ -31,6 +67,272 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
         action="store_true",
         help="Report the first failure and exit vs. running all cases.",
     )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help=(
+            "Run up to this many independent cases of a spec concurrently.  Cases are "
+            "serial unless they declare group: or depends:."
+        ),
+    )
+    parser.add_argument(
+        "--spec-jobs",
+        "-J",
+        type=int,
+        default=1,
+        help=(
+            "Process up to this many specs concurrently in separate processes.  Each "
+            "spec then starts from the default header and trailer rather than "
+            "inheriting them from the previous spec."
+        ),
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ShellContext.ENGINES,
+        default="subprocess",
+        help=(
+            "How case scripts are run: a fresh interpreter per case (subprocess),  a "
+            "persistent interpreter per run_as identity which evaluates the header "
+            "once (worker),  or a fresh interpreter per case driven from a single "
+            "thread by asyncio,  running up to --jobs cases of each spec at once "
+            "(asyncio)."
+        ),
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help=(
+            "Seconds each case may run unless it sets timeout:.  On timeout the case's "
+            "whole process group is sent SIGTERM,  then SIGKILL if it has not exited "
+            "within a short grace period,  and any output produced so far is kept."
+        ),
+    )
+    parser.add_argument(
+        "--max-output",
+        type=parse_size,
+        default=None,
+        help=(
+            "Keep at most this many bytes of each case's stdout and stderr unless it "
+            "sets max_output:,  e.g. 64M.  Defaults to 64M.  Excess output is "
+            "discarded and the case is flagged as truncated.  Large output is spilled "
+            "to a temporary file while the case runs."
+        ),
+    )
+    parser.add_argument(
+        "--fail-fast-output",
+        action="store_true",
+        help=(
+            "Compare each case's stdout with its expected output as it is printed and "
+            "kill the case at the first line which cannot match,  unless it sets "
+            "fail_fast_output: no.  The worker engine does not support this."
+        ),
+    )
+    parser.add_argument(
+        "--script-delivery",
+        choices=DELIVERIES,
+        default="auto",
+        help=(
+            "How case scripts reach the interpreter: an in-memory file (memfd),  a "
+            "pipe,  or a temporary file.  auto picks the cheapest available."
+        ),
+    )
+    parser.add_argument(
+        "--scratch",
+        choices=scratch.SCOPES,
+        default="none",
+        help=(
+            "Run each case in a fresh scratch directory (case),  or share one among "
+            "the cases of each group: (group),  unless a case sets scratch:.  Scratch "
+            "directories are removed once their case or spec finishes."
+        ),
+    )
+    parser.add_argument(
+        "--scratch-root",
+        type=str,
+        default=None,
+        help=(
+            "Directory in which to make scratch directories.  Defaults to /dev/shm "
+            "when writable,  else the system temporary directory."
+        ),
+    )
+    parser.add_argument(
+        "--scratch-from",
+        type=str,
+        default=None,
+        help=(
+            "Directory tree to seed scratch directories with,  unless a case sets "
+            "scratch_from:.  Files are cloned by reflink where the filesystem supports "
+            "it."
+        ),
+    )
+    parser.add_argument(
+        "--scratch-link",
+        action="store_true",
+        help=(
+            "Seed scratch directories with hard links instead of clones.  Only safe "
+            "when cases never modify the seeded files in place."
+        ),
+    )
+    parser.add_argument(
+        "--jinja-cache",
+        type=str,
+        default=None,
+        help="Directory in which to persist compiled template bytecode between runs.",
+    )
+    parser.add_argument(
+        "--keep-expanded",
+        action="store_true",
+        help="Write the template expansion of each spec to <output>/<spec>.expanded.",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help=(
+            "Run each case as soon as it is expanded and parsed rather than expanding "
+            "the whole spec first.  Cases run serially and are only retained for "
+            "--save-results."
+        ),
+    )
+    parser.add_argument(
+        "--result-cache",
+        type=str,
+        default=None,
+        help=(
+            "Directory of cached case results.  Cases whose commands,  run_as,  "
+            "header,  trailer,  and declared inputs: are unchanged reuse the cached "
+            "result instead of running."
+        ),
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ignore --result-cache for this run.",
+    )
+    parser.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="Run every case and replace its cached result.",
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=float,
+        default=512,
+        help="Evict least recently used cached results beyond this size.",
+    )
+    parser.add_argument(
+        "--cache-max-age",
+        type=float,
+        default=30,
+        help="Ignore and evict cached results older than this many days.",
+    )
+    parser.add_argument(
+        "--parse-cache",
+        type=str,
+        default=None,
+        help=(
+            "Directory of cached spec parses.  Specs whose source is unchanged since "
+            "the last run skip template expansion and parsing.  Not used with "
+            "--stream."
+        ),
+    )
+    parser.add_argument(
+        "--shard",
+        type=shard.parse_shard,
+        default=None,
+        metavar="I/N",
+        help=(
+            "Run only the I-th of N disjoint shards of the cases of all specs,  e.g. "
+            "2/4.  Cases joined by group: or depends: stay on one shard.  Every node "
+            "must be given the same specs and timings to compute the same partition."
+        ),
+    )
+    parser.add_argument(
+        "--timings",
+        action="append",
+        default=[],
+        metavar="FILE",
+        help=(
+            "JSON file of past case durations written by --save-timings.  With "
+            "--shard,  cases are balanced across shards by duration rather than dealt "
+            "round-robin.  May be repeated to combine the timings of several shards."
+        ),
+    )
+    parser.add_argument(
+        "--save-timings",
+        type=str,
+        default=None,
+        metavar="FILE",
+        help="Write the duration of every case run to this JSON file,  merged with any --timings.",
+    )
+    parser.add_argument(
+        "--history",
+        type=str,
+        default=None,
+        metavar="FILE",
+        help=(
+            "JSON file recording the recent durations and last status of every case,  "
+            "updated after each run.  Used by --schedule and,  without --timings,  by "
+            "--shard."
+        ),
+    )
+    parser.add_argument(
+        "--schedule",
+        choices=SCHEDULES,
+        default="spec",
+        help=(
+            "Order in which independent cases of a spec are started according to "
+            "--history:  spec order,  the longest cases first to shorten the run,  or "
+            "the cases which failed last time first to report failures sooner.  "
+            "Failures are still reported in spec order.  Not used with --stream."
+        ),
+    )
+    parser.add_argument(
+        "--failed-first",
+        dest="schedule",
+        action="store_const",
+        const="failed-first",
+        help="Same as --schedule failed-first.",
+    )
+    parser.add_argument(
+        "--last-failed",
+        action="store_true",
+        help=(
+            "Run only the cases which failed in the last run recorded by --history,  "
+            "plus the cases they depend on through group: or depends:.  Runs every "
+            "case if none failed or no failure is still a case of the specs given.  "
+            "With --stream dependencies are not added."
+        ),
+    )
+    parser.add_argument(
+        "--summary-json",
+        type=str,
+        default=None,
+        metavar="FILE",
+        help="Write the run totals to this JSON file,  e.g. one per shard.",
+    )
+    parser.add_argument(
+        "--merge-summaries",
+        action="store_true",
+        help=(
+            "Treat the positional arguments as --summary-json files from the shards of "
+            "one run and report their combined totals instead of running specs."
+        ),
+    )
+    parser.add_argument(
+        "--report-top",
+        type=int,
+        default=5,
+        help=(
+            "At the end of the run list this many of the slowest cases,  of the cases "
+            "using the most CPU time,  and of the cases with the largest peak RSS.  "
+            "Peak RSS is measured by the subprocess engine and only ranked when it "
+            "exceeds the RSS of sh_doctest itself,  which a forked child is charged "
+            "for.  0 disables the lists."
+        ),
+    )
     parser.add_argument(
         "--save-results",
         action="store_true",
@@ -58,63 +360,556 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
     return parser.parse_args(argv)
 
 
+def write_through(chunks: Iterator[str], handle: TextIO) -> Iterator[str]:
+    """Pass `chunks` through unchanged while writing them to `handle`."""
+    for chunk in chunks:
+        handle.write(chunk)
+        yield chunk
+    handle.write("\n")
+
+
+class SpecSummary:
+    """Counts describing the processing of one or more specs,  returned by worker
+    processes and merged by the parent.
+    """
+
+    def __init__(self, spec_count: int = 0) -> None:
+        self.spec_count = spec_count
+        self.test_count = 0
+        self.template_count = 0
+        self.expansion_count = 0
+        self.skipped = 0
+        self.failures = 0
+        self.context: ShellContext | None = None  # header/trailer left by the spec
+        self.usages: list[tuple[str, ResourceUsage]] = []  # (case label, usage)
+        self.durations: dict[str, float] = {}  # by history.case_key()
+        self.statuses: dict[str, bool] = {}  # True if failed,  by history.case_key()
+
+    def merge(self, other: "SpecSummary") -> None:
+        self.spec_count += other.spec_count
+        self.test_count += other.test_count
+        self.template_count += other.template_count
+        self.expansion_count += other.expansion_count
+        self.skipped += other.skipped
+        self.failures += other.failures
+        self.usages.extend(other.usages)
+        self.durations.update(other.durations)
+        self.statuses.update(other.statuses)
+
+    def merge_shard(self, other: "SpecSummary") -> None:
+        """Add the totals of another shard of the same run.  Every shard expands
+        every spec,  so only the cases run,  skipped,  and failed are summed.
+        """
+        self.spec_count = max(self.spec_count, other.spec_count)
+        self.template_count = max(self.template_count, other.template_count)
+        self.expansion_count = max(self.expansion_count, other.expansion_count)
+        self.test_count += other.test_count
+        self.skipped += other.skipped
+        self.failures += other.failures
+
+    def to_simpl(self) -> dict[str, int]:
+        return dict(
+            spec_count=self.spec_count,
+            test_count=self.test_count,
+            template_count=self.template_count,
+            expansion_count=self.expansion_count,
+            skipped=self.skipped,
+            failures=self.failures,
+        )
+
+    @classmethod
+    def from_simpl(cls, simpl: dict[str, int]) -> "SpecSummary":
+        summary = cls()
+        for name, value in simpl.items():
+            setattr(summary, name, int(value))
+        return summary
+
+    def log_top(self, top: int) -> None:
+        """Log the `top` slowest cases,  the `top` using the most CPU time,  and the
+        `top` with the largest peak RSS of their own.  Cases whose peak stayed below
+        the RSS they were charged for sharing with sh_doctest are not ranked.
+        """
+        if not top or not self.usages:
+            return
+        slowest = sorted(self.usages, key=lambda item: item[1].duration, reverse=True)
+        log.info(
+            f"Slowest {min(top, len(slowest))} cases:\n"
+            + "\n".join(
+                f"  {usage.duration:9.3f}s  {label}" for label, usage in slowest[:top]
+            )
+        )
+        measured = [item for item in self.usages if item[1].cpu_time is not None]
+        busiest = sorted(
+            measured, key=lambda item: item[1].cpu_time or 0.0, reverse=True
+        )
+        if busiest:
+            log.info(
+                f"Busiest {min(top, len(busiest))} cases by CPU time:\n"
+                + "\n".join(
+                    f"  {usage.cpu_time:9.3f}s  {label}"
+                    for label, usage in busiest[:top]
+                )
+            )
+        measured = [item for item in self.usages if item[1].case_rss is not None]
+        largest = sorted(measured, key=lambda item: item[1].case_rss or 0, reverse=True)
+        if largest:
+            log.info(
+                f"Largest {min(top, len(largest))} cases by peak RSS:\n"
+                + "\n".join(
+                    f"  {(usage.case_rss or 0) / 1024:9.1f}M  {label}"
+                    for label, usage in largest[:top]
+                )
+            )
+
+    def log_totals(self) -> None:
+        log.info(
+            f"Executed {self.test_count} tests defined in {self.spec_count} specs."
+        )
+        if self.skipped:
+            log.info(f"Skipped {self.skipped} tests which were not selected.")
+        log.info(
+            f"Specs defined {self.template_count} templates with {self.expansion_count} template expansions."
+        )
+        log.info(
+            "All tests passed."
+            if not self.failures
+            else f"Approx {self.failures} tests failed."
+        )
+
+
 class ShDoctest:
     def __init__(self, argv: list[str]) -> None:
         self.args = parse_args(argv)
+        self.session_dir: str | None = None  # session_setup: state for this run
+        self.shard_keys: set[str] | None = None  # cases of this --shard
+        self.history: RunHistory | None = None
+        self.failed_keys: set[str] | None = None  # cases run by --last-failed
+        self.spec_keys: dict[str, set[str]] = {}  # cases each spec now defines
+        self.configure()
+
+    def __setstate__(self, state: dict) -> None:
+        """Reconfigure the process when unpickled in a --spec-jobs worker."""
+        self.__dict__.update(state)
+        self.configure()
+
+    def configure(self) -> None:
+        """Apply process wide settings from the command line."""
         log.set_level("DEBUG" if self.args.verbose else "INFO")
+        if self.args.jinja_cache:
+            templates.use_bytecode_cache(self.args.jinja_cache)
 
     def main(self) -> int:
-        failures = failed = 0
-        test_count = spec_count = template_count = expansion_count = 0
+        if self.args.merge_summaries:
+            return self.merge_summaries()
+        if self.args.history:
+            self.history = RunHistory.load(self.args.history)
+        elif self.args.last_failed:
+            log.error("--last-failed needs --history.")
+            return 1
+        elif self.args.schedule != "spec":
+            log.warning(f"--schedule {self.args.schedule} needs --history to work.")
+        if self.args.shard:
+            self.shard_keys = self.plan_shard()
+        if self.history is not None:
+            self.spec_keys = self.plan_keys()
+            if self.args.last_failed:
+                self.failed_keys = self.last_failed(self.history)
+        with tempfile.TemporaryDirectory(prefix="sh-doctest-session-") as session_dir:
+            self.session_dir = session_dir
+            if self.args.spec_jobs > 1:
+                totals = self.process_specs_concurrently()
+            else:
+                totals = self.process_specs()
+        if (cache := self.result_cache()) is not None:
+            cache.evict()
+        if totals is None:
+            log.error("Exiting on first failure.")
+            return 1
+        if self.history is not None:
+            for key, failed in totals.statuses.items():
+                self.history.record(key, failed, totals.durations.get(key))
+            self.history.prune(self.spec_keys)
+            self.history.save()
+        if self.args.save_timings:
+            durations = load_durations(self.args.timings)
+            durations.update(totals.durations)
+            save_durations(self.args.save_timings, durations)
+        if self.args.summary_json:
+            with open(self.args.summary_json, "w", encoding="utf-8") as summary_file:
+                json.dump(totals.to_simpl(), summary_file, indent=1)
+        totals.log_top(self.args.report_top)
+        totals.log_totals()
+        return totals.failures
+
+    def merge_summaries(self) -> int:
+        """Report the combined totals of the --summary-json files of all shards."""
+        totals = SpecSummary()
+        for path in self.args.test_specs:
+            with open(path, encoding="utf-8") as summary_file:
+                totals.merge_shard(SpecSummary.from_simpl(json.load(summary_file)))
+        totals.log_totals()
+        return totals.failures
+
+    def plan_shard(self) -> set[str]:
+        """Parse every spec and return the keys of the cases in this run's shard."""
+        index, count = self.args.shard
+        unit_keys: list[list[str]] = []
+        spec_paths = [parse_selector(spec)[0] for spec in self.args.test_specs]
+        for spec_path in dict.fromkeys(spec_paths):
+            cases = self.parse_for_plan(spec_path)
+            for members in shard.units(cases):
+                unit_keys.append([case_key(spec_path, cases[i]) for i in members])
+        durations = load_durations(self.args.timings)
+        if not durations and self.history is not None:
+            durations = self.history.durations()
+        assigned = shard.partition(unit_keys, durations, count)[index - 1]
+        keys = {key for unit in assigned for key in unit_keys[unit]}
+        log.info(
+            f"Shard {index}/{count} runs {len(keys)} of "
+            f"{sum(len(unit) for unit in unit_keys)} cases"
+            + (" balanced by past durations." if durations else ".")
+        )
+        return keys
+
+    def plan_keys(self) -> dict[str, set[str]]:
+        """Parse every spec and return the keys of the cases it defines,  leaving
+        out specs which define none or cannot be parsed.
+        """
+        spec_keys = {}
+        spec_paths = [parse_selector(spec)[0] for spec in self.args.test_specs]
+        for spec_path in dict.fromkeys(spec_paths):
+            if cases := self.parse_for_plan(spec_path):
+                spec_keys[spec_path] = {case_key(spec_path, case) for case in cases}
+        return spec_keys
+
+    def last_failed(self, history: RunHistory) -> set[str] | None:
+        """Return the keys of the recorded failures which are still cases of the
+        specs being run,  or None to run every case if there are none.
+        """
+        recorded = history.failed_keys()
+        if not recorded:
+            log.info("No failures recorded by --history,  running every case.")
+            return None
+        failed = {key for keys in self.spec_keys.values() for key in keys & recorded}
+        if not failed:
+            log.warning(
+                f"None of the {len(recorded)} failures recorded by --history is a "
+                "case of these specs any more,  running every case."
+            )
+            return None
+        return failed
+
+    def parse_for_plan(self, spec_path: str) -> list[Case]:
+        """Return the cases of `spec_path` without running them,  or none if it
+        cannot be parsed,  which is reported when the spec is processed.
+        """
+        cache = self.parse_cache()
+        try:
+            if cache is not None:
+                parsed = cache.get(spec_path, cache.digest(spec_path))
+                if parsed is not None:
+                    return parsed.cases
+            doc, expanded = self.expand_templates(spec_path)
+            spec = Spec(expanded, context=ShellContext())
+            spec.parse(doc.text)
+            return spec.test_cases
+        except Exception as exc:
+            log.debug(f"Cannot plan shard for {spec_path}: {exc}")
+            return []
+
+    def plan_spec(
+        self, spec: Spec, spec_path: str, ranges: list[tuple[int, int]] | None
+    ) -> None:
+        """Set which cases of `spec` run and in what order,  `ranges` being the
+        lines picked by a spec.txt:LINE selector.
+        """
+        spec.source_path = spec_path
+        spec.in_shard = self.in_shard(spec_path)
+        spec.selector = self.selector(spec_path, ranges)
+        spec.order_key = self.order_key(spec_path)
+
+    def in_shard(self, spec_path: str):
+        """Return the predicate selecting the cases of `spec_path` in this run's
+        --shard,  or None to run them all.
+        """
+        if self.shard_keys is None:
+            return None
+        keys = self.shard_keys
+        return lambda case: case_key(spec_path, case) in keys
+
+    def selector(self, spec_path: str, ranges: list[tuple[int, int]] | None = None):
+        """Return the predicate selecting the cases of `spec_path` to run,  or None
+        to run them all.
+        """
+        predicates = []
+        if (failed := self.failed_keys) is not None:
+            predicates.append(lambda case: case_key(spec_path, case) in failed)
+        if self.args.keyword:
+            matches = compile_expression(self.args.keyword)
+            predicates.append(lambda case: matches(str(case.name)))
+        if ranges:
+            predicates.append(lambda case: spans_lines(case, ranges))
+        if not predicates:
+            return None
+        return lambda case: all(predicate(case) for predicate in predicates)
+
+    def order_key(self, spec_path: str):
+        """Return the --schedule ranking of the cases of `spec_path`,  or None to
+        start them in spec order.
+        """
+        history = self.history
+        if history is None or self.args.schedule == "spec":
+            return None
+        if self.args.schedule == "failed-first":
+            return lambda case: not history.failed(case_key(spec_path, case))
+        durations = history.durations()
+        default = sum(durations.values()) / len(durations) if durations else 0.0
+        return lambda case: -durations.get(case_key(spec_path, case), default)
+
+    def new_context(self) -> ShellContext:
+        """Return the default header/trailer context configured for this run."""
+        context = ShellContext(
+            engine=self.args.engine,
+            delivery=self.args.script_delivery,
+            timeout=self.args.timeout,
+            max_output=self.args.max_output,
+            fail_fast_output=self.args.fail_fast_output,
+        )
+        context.cache = self.result_cache()
+        context.session_dir = self.session_dir
+        context.scratch = scratch.ScratchDirs(
+            self.args.scratch,
+            self.args.scratch_root,
+            self.args.scratch_from,
+            self.args.scratch_link,
+        )
+        return context
+
+    def result_cache(self) -> ResultCache | None:
+        if not self.args.result_cache or self.args.no_cache:
+            return None
+        return ResultCache(
+            self.args.result_cache,
+            max_bytes=int(self.args.cache_max_mb * 2**20),
+            max_age=self.args.cache_max_age * 24 * 3600,
+            refresh=self.args.refresh_cache,
+        )
+
+    def parse_cache(self) -> ParseCache | None:
+        return ParseCache(self.args.parse_cache) if self.args.parse_cache else None
+
+    def process_specs(self) -> SpecSummary | None:
+        """Process each spec in turn,  passing header and trailer on to the next."""
+        totals = SpecSummary()
+        context = self.new_context()
         for spec_path in self.args.test_specs:
-            spec_count = spec_count + 1
+            summary = self.process_spec(spec_path, context.copy())
+            totals.merge(summary)
+            context = summary.context or context
+            if summary.failures and self.args.exit_first_failure:
+                return None
+        return totals
+
+    def process_specs_concurrently(self) -> SpecSummary | None:
+        """Process specs on a pool of worker processes,  each spec starting from
+        its own default context.
+        """
+        totals = SpecSummary()
+        with ProcessPoolExecutor(max_workers=self.args.spec_jobs) as executor:
+            futures = [
+                executor.submit(self.process_spec, spec_path, self.new_context())
+                for spec_path in self.args.test_specs
+            ]
+            for future in as_completed(futures):
+                summary = future.result()
+                totals.merge(summary)
+                if summary.failures and self.args.exit_first_failure:
+                    executor.shutdown(cancel_futures=True)
+                    return None
+        return totals
+
+    def process_spec(self, spec_arg: str, context: ShellContext) -> SpecSummary:
+        """Expand, parse, run, and save one spec,  or the cases of it picked by a
+        spec.txt:LINE selector,  returning its summary.
+        """
+        spec_path, ranges = parse_selector(spec_arg)
+        if self.args.stream:
+            return self.stream_spec(spec_path, context, ranges)
+        summary = SpecSummary(spec_count=1)
+        cache, digest = self.parse_cache(), ""
+        if cache is not None:
             try:
-                doc, expanded = self.expand_templates(spec_path)
-            except Exception:
-                log.exception("Failed to parse", spec_path)
-                failed = 1
-            template_count = template_count + len(doc.templates.keys())
+                digest = cache.digest(spec_path)
+            except OSError:
+                cache = None  # reported by expand_templates() below
+            else:
+                if (parsed := cache.get(spec_path, digest)) is not None:
+                    log.debug("Using cached parse of", spec_path)
+                    return self.run_parsed(summary, spec_path, parsed, context, ranges)
+        try:
+            doc, expanded = self.expand_templates(spec_path)
+        except Exception:
+            log.exception("Failed to parse", spec_path)
+            summary.failures = 1
+            return summary
+        writer = self.keep_expanded(doc, expanded)
+        try:
+            summary.template_count = len(doc.templates.keys())
             try:
-                spec = self.parse_expanded_spec(expanded)
+                spec = self.parse_expanded_spec(expanded, context, doc.text)
+                self.plan_spec(spec, spec_path, ranges)
             except Exception:
                 log.exception("Failed to parse expansion of", expanded)
-                failed = 1
-            expansion_count = expansion_count + len(doc.expansions)
-            if not self.args.dry_run:
-                try:
-                    test_count = test_count + len(spec.test_cases)
-                    failed = self.run_and_check(spec)
-                except Exception:
-                    log.exception("Failed to run and check", expanded)
-                    failed = 1
-            if self.args.save_results:
-                spec.writeto(expanded.replace(".expanded", ".yaml"))
-            if failed:
-                failures += failed
-                if self.args.exit_first_failure:
-                    log.error("Exiting on first failure.")
-                    return 1
-        log.info(f"Executed {test_count} tests defined in {spec_count} specs.")
-        log.info(
-            f"Specs defined {template_count} templates with {expansion_count} template expansions."
+                summary.failures = 1
+                return summary
+            summary.expansion_count = doc.expansion_count
+            if cache is not None and not doc.error_count:
+                cache.put(
+                    spec_path,
+                    digest,
+                    ParsedSpec(
+                        doc.text,
+                        summary.template_count,
+                        summary.expansion_count,
+                        spec.test_cases,
+                        spec.header,
+                        spec.trailer,
+                        spec.fixtures,
+                    ),
+                )
+            summary = self.run_spec(summary, spec, expanded)
+        finally:
+            if writer:
+                writer.join()
+        return summary
+
+    def run_parsed(
+        self,
+        summary: SpecSummary,
+        spec_path: str,
+        parsed: ParsedSpec,
+        context: ShellContext,
+        ranges: list[tuple[int, int]] | None = None,
+    ) -> SpecSummary:
+        """Run and save a spec restored from the parse cache."""
+        expanded = self.expanded_path(spec_path)
+        writer = self.keep_expanded(parsed, expanded)
+        try:
+            summary.template_count = parsed.template_count
+            summary.expansion_count = parsed.expansion_count
+            spec = Spec(
+                expanded,
+                self.args.exit_first_failure,
+                self.args.drop_uninteresting,
+                self.args.jobs,
+                context,
+            )
+            self.plan_spec(spec, spec_path, ranges)
+            spec.restore(parsed.cases, parsed.header, parsed.trailer, parsed.fixtures)
+            summary = self.run_spec(summary, spec, expanded)
+        finally:
+            if writer:
+                writer.join()
+        return summary
+
+    def run_spec(self, summary: SpecSummary, spec: Spec, expanded: str) -> SpecSummary:
+        """Run and save a parsed spec."""
+        summary.context = spec.context
+        if not self.args.dry_run:
+            try:
+                summary.failures = self.run_and_check(spec)
+            except Exception:
+                log.exception("Failed to run and check", expanded)
+                summary.failures = 1
+            summary.test_count = spec.case_count
+            summary.skipped = spec.skipped
+            summary.usages = spec.usages
+            summary.durations = spec.durations
+            summary.statuses = spec.statuses
+        if self.args.save_results:
+            spec.writeto(expanded.replace(".expanded", ".yaml"))
+        return summary
+
+    def stream_spec(
+        self,
+        spec_path: str,
+        context: ShellContext,
+        ranges: list[tuple[int, int]] | None = None,
+    ) -> SpecSummary:
+        """Expand, parse, and run one spec as a pipeline so that memory is bounded
+        by the largest case rather than the whole expanded spec.
+        """
+        summary = SpecSummary(spec_count=1)
+        expanded = self.expanded_path(spec_path)
+        spec = Spec(
+            expanded,
+            self.args.exit_first_failure,
+            self.args.drop_uninteresting,
+            context=context,
         )
-        log.info("All tests passed." if not failures else f"Approx {failures} tests failed.")
-        return failures
+        self.plan_spec(spec, spec_path, ranges)
+        spec.keep_cases = self.args.save_results
+        try:
+            doc = TemplatedDoc.from_file(spec_path)
+            with contextlib.ExitStack() as stack:
+                chunks = doc.iter_text()
+                if self.args.keep_expanded:
+                    handle = stack.enter_context(open(expanded, "w", encoding="utf-8"))
+                    chunks = write_through(chunks, handle)
+                summary.failures = spec.run_stream(
+                    doc.iter_lines(chunks), self.args.dry_run
+                )
+        except Exception:
+            log.exception("Failed to stream", spec_path)
+            summary.failures = 1
+            return summary
+        summary.template_count = len(doc.templates.keys())
+        summary.expansion_count = doc.expansion_count
+        summary.context = spec.context
+        if not self.args.dry_run:
+            summary.test_count = spec.case_count
+            summary.skipped = spec.skipped
+            summary.usages = spec.usages
+            summary.durations = spec.durations
+            summary.statuses = spec.statuses
+        if self.args.save_results:
+            spec.writeto(expanded.replace(".expanded", ".yaml"))
+        return summary
+
+    def expanded_path(self, spec_path: str) -> str:
+        return str(Path(self.args.output) / (Path(spec_path).name + ".expanded"))
 
     def expand_templates(self, spec_path: str) -> tuple[TemplatedDoc, str]:
         log.debug("Expanding templates for", spec_path)
         doc = TemplatedDoc.from_file(spec_path)
         doc.parse()
-        expanded = str(Path(self.args.output) / (Path(spec_path).name + ".expanded"))
-        doc.writeto(expanded)
-        return doc, expanded
+        return doc, self.expanded_path(spec_path)
+
+    def keep_expanded(
+        self, doc: TemplatedDoc | ParsedSpec, expanded: str
+    ) -> threading.Thread | None:
+        """With --keep-expanded,  start writing the expansion in the background."""
+        if not self.args.keep_expanded:
+            return None
+        writer = threading.Thread(target=doc.writeto, args=(expanded,))
+        writer.start()
+        return writer
 
-    def parse_expanded_spec(self, expanded: str) -> Spec:
+    def parse_expanded_spec(
+        self,
+        expanded: str,
+        context: ShellContext | None = None,
+        text: str | None = None,
+    ) -> Spec:
         log.debug("Parsing expanded spec", expanded)
         spec = Spec(
-            expanded, self.args.exit_first_failure, self.args.drop_uninteresting
+            expanded,
+            self.args.exit_first_failure,
+            self.args.drop_uninteresting,
+            self.args.jobs,
+            context,
         )
-        spec.parse()
+        spec.parse(text)
         return spec
 
     def run_and_check(self, spec: Spec) -> int:
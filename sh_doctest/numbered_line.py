@@ -6,6 +6,8 @@ from typing import Any
 class NumberedLine:
     """A line of text with a line number describing its position in a larger text."""
 
+    __slots__ = ("line", "lineno")
+
     def __init__(self, line: Any, lineno: int = -1) -> None:
         if isinstance(line, NumberedLine):
             self.line: str = line.line
@@ -0,0 +1,95 @@
+"""This module defines an on-disk cache of parsed specs so that unchanged spec files
+skip template expansion and case parsing on later runs.
+
+Each spec path has one pickled entry which records the sha256 of the spec source it
+was made from.  Editing the spec changes the digest and the entry is rebuilt on the
+next run,  as it is when the sh_doctest version changes.  Specs are self contained,
+so the spec source is the only input to expansion and parsing.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+from . import __version__
+from .case import Case
+from .log import log
+
+# -----------------------------------------------------------------------------------
+
+FORMAT = 5  # changed with ParsedSpec or Case to invalidate older entries
+
+
+class ParsedSpec:
+    """The products of expanding and parsing one spec:  the expanded text,  the
+    template and expansion counts,  the parsed cases,  and any header,  trailer,
+    or fixtures the spec defines.
+    """
+
+    def __init__(
+        self,
+        text: str,
+        template_count: int,
+        expansion_count: int,
+        cases: list[Case],
+        header: str | None = None,
+        trailer: str | None = None,
+        fixtures: dict[str, Case] | None = None,
+    ) -> None:
+        self.text = text
+        self.template_count = template_count
+        self.expansion_count = expansion_count
+        self.cases = cases
+        self.header = header
+        self.trailer = trailer
+        self.fixtures = fixtures or {}
+
+    def writeto(self, path: str) -> None:
+        """Save the expanded text to a file as TemplatedDoc.writeto() does."""
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.text + "\n")
+
+
+class ParseCache:
+    """Pickled ParsedSpecs stored beneath `directory`,  one file per spec path."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def digest(self, spec_path: str) -> str:
+        """Return the hash of the source of `spec_path`,  the sh_doctest version,  and
+        the entry FORMAT.
+        """
+        with open(spec_path, "rb") as spec_file:
+            source = spec_file.read()
+        prefix = f"{__version__}\0{FORMAT}\0".encode()
+        return hashlib.sha256(prefix + source).hexdigest()
+
+    def path(self, spec_path: str) -> str:
+        name = hashlib.sha256(os.path.abspath(spec_path).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name + ".pickle")
+
+    def get(self, spec_path: str, digest: str) -> ParsedSpec | None:
+        """Return the cached parse of `spec_path` if it was made from `digest`."""
+        try:
+            with open(self.path(spec_path), "rb") as entry_file:
+                entry_digest, parsed = pickle.load(entry_file)
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            log.debug(f"Ignoring unreadable parse cache entry for {spec_path}: {exc}")
+            return None
+        return parsed if entry_digest == digest else None
+
+    def put(self, spec_path: str, digest: str, parsed: ParsedSpec) -> None:
+        """Store `parsed` for `spec_path`,  replacing any existing entry atomically."""
+        os.makedirs(self.directory, exist_ok=True)
+        handle, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as entry_file:
+                pickle.dump((digest, parsed), entry_file, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path(spec_path))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
@@ -0,0 +1,252 @@
+"""This module runs the cases of a spec concurrently,  on a pool of worker threads
+or as asyncio tasks,  honoring the ordering constraints declared with the group:
+and depends: case options.
+
+Cases which declare neither option are serial:  they wait for every earlier case
+and every later case waits for them,  exactly as when running with --jobs 1.
+Cases sharing a group: run one after another in spec order but concurrently with
+other groups.  depends: names earlier cases or groups which must finish first.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+import asyncio
+from typing import Any, Callable
+
+from .case import Case
+from .log import log
+from .shell import CaseCancelled, Cancellation, ShellContext
+
+# -----------------------------------------------------------------------------------
+
+
+def split_names(value: str) -> list[str]:
+    """Split a comma separated depends: value into names."""
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+class CaseGraph:
+    """The dependency DAG of a list of cases.  dependencies[i] is the set of indices
+    of the cases which must complete before case i can start,  and declared[i] the
+    subset due to its group: and depends: options rather than to serial cases.
+    """
+
+    def __init__(self, cases: list[Case]) -> None:
+        self.cases = cases
+        self.dependencies: list[set[int]] = []
+        self.declared: list[set[int]] = []
+        self.build()
+
+    def build(self) -> None:
+        barrier: int | None = None  # most recent serial case
+        since_barrier: list[int] = []  # cases started after the barrier
+        last_in_group: dict[str, int] = {}
+        by_name: dict[str, list[int]] = {}
+        for index, case in enumerate(self.cases):
+            group = case.option("group")
+            depends = split_names(case.option("depends"))
+            deps: set[int] = set()
+            declared: set[int] = set()
+            if not group and not depends:
+                deps.update(since_barrier)
+                if barrier is not None:
+                    deps.add(barrier)
+                barrier, since_barrier, last_in_group = index, [], {}
+            else:
+                if barrier is not None:
+                    deps.add(barrier)
+                if group in last_in_group:
+                    declared.add(last_in_group[group])
+                for name in depends:
+                    if name not in by_name:
+                        raise ValueError(
+                            f"Case '{case.name}' at line {case.name.lineno+1} depends on "
+                            f"unknown earlier case or group '{name}'."
+                        )
+                    declared.update(by_name[name])
+                deps.update(declared)
+                since_barrier.append(index)
+                if group:
+                    last_in_group[group] = index
+                    by_name.setdefault(group, []).append(index)
+            by_name.setdefault(str(case.name), []).append(index)
+            self.dependencies.append(deps)
+            self.declared.append(declared)
+
+    def requirements(self, indices: list[int]) -> set[int]:
+        """Return the cases which `indices` declare they depend on,  directly or
+        indirectly.
+        """
+        required: set[int] = set()
+        pending = list(indices)
+        while pending:
+            for dep in self.declared[pending.pop()] - required:
+                required.add(dep)
+                pending.append(dep)
+        return required
+
+    def dependents(self) -> list[list[int]]:
+        """Return the inverse of dependencies,  the cases each case unblocks."""
+        result: list[list[int]] = [[] for _ in self.cases]
+        for index, deps in enumerate(self.dependencies):
+            for dep in deps:
+                result[dep].append(index)
+        return result
+
+
+class Scheduler:
+    """Run the cases of a CaseGraph on `jobs` worker threads,  starting each case as
+    soon as its dependencies complete and reporting failures in spec order.
+    """
+
+    def __init__(
+        self,
+        cases: list[Case],
+        jobs: int,
+        exit_first_failure: bool = False,
+        context: ShellContext | None = None,
+        order_key: Callable[[Case], Any] | None = None,
+    ):
+        self.graph = CaseGraph(cases)
+        self.cases = cases
+        self.jobs = jobs
+        self.exit_first_failure = exit_first_failure
+        self.context = context
+        self.order_key = order_key  # ranks ready cases,  spec order breaks ties
+        self.outcomes: dict[int, bool | BaseException] = {}
+        self.dependents: list[list[int]] = []
+        self.waiting: list[int] = []  # count of unfinished dependencies per case
+        self.ready: list[int] = []  # cases whose dependencies have all finished
+        self.stopping = False  # set after the first failure with exit_first_failure
+
+    def ready_order(self, ready: list[int]) -> list[int]:
+        """Order in which ready cases are started,  by order_key and then in spec
+        order.
+        """
+        if (order_key := self.order_key) is None:
+            return sorted(ready)
+        return sorted(ready, key=lambda index: (order_key(self.cases[index]), index))
+
+    def run(self) -> int:
+        """Run all the cases and return the number which failed.  After the first
+        failure with exit_first_failure the cases still running are killed.
+        """
+        self.start()
+        context = (self.context or ShellContext()).copy()
+        context.cancellation = cancellation = Cancellation()
+        running: dict[Future, int] = {}
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                while self.ready or running:
+                    for index in self.take_ready():
+                        future = executor.submit(
+                            self.cases[index].run_and_check, False, context
+                        )
+                        running[future] = index
+                    if not running:
+                        break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index = running.pop(future)
+                        try:
+                            self.completed(index, future.result())
+                        except Exception as exc:
+                            self.completed(index, exc)
+                    if self.stopping and running:
+                        log.debug(f"Cancelling {len(running)} cases in flight.")
+                        cancellation.cancel()
+        finally:
+            cancellation.close()
+        return self.report()
+
+    def start(self) -> None:
+        self.dependents = self.graph.dependents()
+        self.waiting = [len(deps) for deps in self.graph.dependencies]
+        self.ready = [index for index, count in enumerate(self.waiting) if not count]
+        self.stopping = False
+
+    def take_ready(self) -> list[int]:
+        """Return the cases to start now in the order to start them."""
+        if self.stopping:
+            return []
+        ready, self.ready = self.ready, []
+        return self.ready_order(ready)
+
+    def completed(self, index: int, outcome: bool | BaseException) -> None:
+        """Record the outcome of case `index` and make ready the cases it unblocks.
+        Cases cancelled after a failure have no outcome.
+        """
+        if isinstance(outcome, CaseCancelled):
+            return
+        self.outcomes[index] = outcome
+        if outcome is not False and self.exit_first_failure:
+            self.stopping = True
+        for dependent in self.dependents[index]:
+            self.waiting[dependent] -= 1
+            if not self.waiting[dependent]:
+                self.ready.append(dependent)
+
+    def report(self) -> int:
+        """Report the outcomes in spec order,  returning the failure count."""
+        failures = 0
+        for index, case in enumerate(self.cases):
+            if index not in self.outcomes:
+                continue
+            outcome = self.outcomes[index]
+            if isinstance(outcome, BaseException):
+                log.error(
+                    f"On: {case.name} ::\n{case.commands}\n",
+                    f"{type(outcome).__name__}: {outcome}",
+                )
+                failures += 1
+            elif outcome:
+                case.report_failure()
+                failures += 1
+        if len(self.outcomes) < len(self.cases):
+            log.error(
+                f"Cancelled {len(self.cases) - len(self.outcomes)} cases after first failure."
+            )
+        return failures
+
+
+class AsyncScheduler(Scheduler):
+    """Run the cases of a CaseGraph as asyncio tasks in a single thread,  with at
+    most `jobs` running at once.  Ready cases queue on a semaphore in the order
+    given by ready_order().  After the first failure with exit_first_failure the
+    tasks still running are cancelled.
+    """
+
+    def run(self) -> int:
+        asyncio.run(self.run_async())
+        return self.report()
+
+    async def run_async(self) -> None:
+        semaphore = asyncio.Semaphore(self.jobs)
+        self.start()
+        running: set[asyncio.Task] = set()
+        while self.ready or running:
+            for index in self.take_ready():
+                running.add(asyncio.create_task(self.run_case(index, semaphore)))
+            if not running:
+                break
+            _, running = await asyncio.wait(
+                running, return_when=asyncio.FIRST_COMPLETED
+            )
+            if self.stopping:
+                for task in running:
+                    task.cancel()  # kills the case's process group
+
+    async def run_case(self, index: int, semaphore: asyncio.Semaphore) -> None:
+        """Run and check case `index` unless the run is stopping.  Its outcome is
+        recorded before the semaphore is released so a failure stops the next case.
+        """
+        async with semaphore:
+            if self.stopping:
+                return
+            outcome: bool | BaseException
+            try:
+                outcome = await self.cases[index].run_and_check_async(
+                    False, self.context
+                )
+            except Exception as exc:
+                outcome = exc
+            self.completed(index, outcome)
@@ -0,0 +1,217 @@
+"""This module gives cases private scratch directories to run in,  so concurrent
+cases cannot trip over each other's files and leave nothing behind.
+
+A case runs in a fresh directory when it sets scratch: case,  or --scratch case
+is given,  and cases of the same group: share one with scratch: group.  The
+directory is made beneath --scratch-root,  tmpfs at /dev/shm by default,  seeded
+from the tree named by scratch_from: or --scratch-from,  and owned by the case's
+run_as identity.  Files are seeded by reflink where the filesystem supports it,
+otherwise by an in-kernel copy,  or with --scratch-link by hard links for trees
+cases only read.  Hard linked files keep their owner,  since changing it would
+change the seed tree too.  Directories are removed on a background thread when
+their case,  or for groups their spec,  finishes.
+"""
+
+import fcntl
+import grp
+import hashlib
+import os
+import pwd
+import shutil
+import stat
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from .log import log
+from .shell import process_run_as
+
+# -----------------------------------------------------------------------------------
+
+SCOPES = ("none", "case", "group")
+
+FICLONE = 0x40049409  # linux/fs.h:  _IOW(0x94, 9, int)
+
+
+def default_root() -> str:
+    """Return /dev/shm if usable,  else the system temporary directory."""
+    shm = "/dev/shm"
+    if os.path.isdir(shm) and os.access(shm, os.W_OK | os.X_OK):
+        return shm
+    return tempfile.gettempdir()
+
+
+def clone_file(source: str, target: str) -> None:
+    """Copy `source` to `target` sharing its blocks if the filesystem can,  else
+    with an in-kernel copy,  preserving its mode and times.
+    """
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            cloned = True
+        except OSError:
+            cloned = False
+    if not cloned:
+        shutil.copyfile(source, target)
+    shutil.copystat(source, target)
+
+
+def link_file(source: str, target: str) -> None:
+    """Hard link `target` to `source`,  cloning it instead across filesystems."""
+    try:
+        os.link(source, target)
+    except OSError:
+        clone_file(source, target)
+
+
+def clone_tree(source: str, target: str, link: bool = False) -> None:
+    """Seed the existing directory `target` with the contents of `source`."""
+    shutil.copytree(
+        source,
+        target,
+        symlinks=True,
+        copy_function=link_file if link else clone_file,
+        dirs_exist_ok=True,
+    )
+
+
+def owner_ids(run_as) -> tuple[int, int] | None:
+    """Return the uid and gid of a run_as: identity,  or None if there is none."""
+    user, group, _ = process_run_as(run_as)
+    if not user:
+        return None
+    uid = int(user) if user.isdigit() else pwd.getpwnam(user).pw_uid
+    gid = int(group) if group.isdigit() else grp.getgrnam(group).gr_gid
+    return uid, gid
+
+
+def chown_tree(path: str, uid: int, gid: int) -> None:
+    """Give `path` and everything beneath it to `uid` and `gid`,  except files
+    hard linked from elsewhere,  whose owner is shared with the original.
+    """
+    os.lchown(path, uid, gid)
+    for directory, subdirs, files in os.walk(path):
+        for name in subdirs + files:
+            entry = os.path.join(directory, name)
+            info = os.lstat(entry)
+            if stat.S_ISREG(info.st_mode) and info.st_nlink > 1:
+                continue
+            os.lchown(entry, uid, gid)
+
+
+def tree_signature(path: str) -> str | None:
+    """Return a hash of the names,  modes,  sizes,  and modification times of
+    everything beneath `path`,  or None if it cannot be read.
+    """
+    digest = hashlib.sha256()
+    try:
+        for directory, subdirs, files in os.walk(path, onerror=raise_error):
+            subdirs.sort()
+            for name in sorted(subdirs + files):
+                entry = os.path.join(directory, name)
+                info = os.lstat(entry)
+                digest.update(os.fsencode(os.path.relpath(entry, path)))
+                digest.update(
+                    f"\0{info.st_mode}\0{info.st_size}\0{info.st_mtime_ns}\0".encode()
+                )
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def raise_error(exc: OSError) -> None:
+    raise exc
+
+
+class ScratchDirs:
+    """Makes,  shares,  and removes the scratch directories of cases.  `scope` is
+    the default for cases without a scratch: option and `seed` the default tree
+    for cases without scratch_from:.
+    """
+
+    def __init__(
+        self,
+        scope: str = "none",
+        root: str | None = None,
+        seed: str | None = None,
+        link: bool = False,
+    ) -> None:
+        if scope not in SCOPES:
+            raise ValueError(f"Unknown scratch scope '{scope}'.")
+        self.scope = scope
+        self.root = root or default_root()
+        self.seed = seed
+        self.link = link
+        self.setup()
+
+    def setup(self) -> None:
+        self.lock = threading.Lock()
+        self.groups: dict[str, str] = {}  # group name -> shared directory
+        self.remover = ThreadPoolExecutor(1, thread_name_prefix="sh-doctest-rmtree")
+        self.removals: list[Future] = []
+
+    def __getstate__(self) -> dict:
+        return dict(scope=self.scope, root=self.root, seed=self.seed, link=self.link)
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.setup()
+
+    def scope_of(self, case) -> str:
+        scope = case.option("scratch", self.scope).lower()
+        if scope not in SCOPES:
+            raise ValueError(f"Invalid scratch: '{scope}' for case '{case.name}'.")
+        return scope
+
+    def identity(self, case) -> list | None:
+        """What about the scratch directory of `case` can affect its result,  for
+        cache keys:  the scope,  whether seeding links,  and the seed tree.  None
+        if the case runs in the current directory.
+        """
+        scope = self.scope_of(case)
+        if scope == "none":
+            return None
+        seed = case.option("scratch_from") or self.seed
+        signature = tree_signature(seed) if seed else None
+        return [scope, self.link, seed, signature]
+
+    def acquire(self, case) -> str | None:
+        """Return the directory `case` should run in,  or None for the current one."""
+        scope = self.scope_of(case)
+        if scope == "none":
+            return None
+        group = case.option("group") if scope == "group" else ""
+        if not group:
+            return self.create(case)
+        with self.lock:
+            if group not in self.groups:
+                self.groups[group] = self.create(case)
+            return self.groups[group]
+
+    def create(self, case) -> str:
+        path = tempfile.mkdtemp(prefix="sh-doctest-", dir=self.root)
+        if seed := case.option("scratch_from") or self.seed:
+            clone_tree(seed, path, self.link)
+        if ids := owner_ids(case.run_as):
+            chown_tree(path, *ids)
+        log.debug(f"Running {case.name} in scratch directory {path}")
+        return path
+
+    def release(self, path: str) -> None:
+        """Remove the directory of a finished case unless its group shares it."""
+        with self.lock:
+            if path in self.groups.values():
+                return
+            self.remove(path)
+
+    def release_groups(self) -> None:
+        """Remove the group directories and wait for every removal to finish."""
+        with self.lock:
+            groups, self.groups = self.groups, {}
+            for path in groups.values():
+                self.remove(path)
+            removals, self.removals = self.removals, []
+        wait(removals)
+
+    def remove(self, path: str) -> None:
+        self.removals.append(self.remover.submit(shutil.rmtree, path, True))
@@ -0,0 +1,147 @@
+"""This module selects the cases to run by name with -k expressions and by position
+with spec.txt:LINE selectors.
+
+A -k expression combines name patterns with and,  or,  not,  and parentheses.  A
+pattern containing *,  ?,  or [ is a glob which must match the whole case name,
+any other pattern matches any part of it,  and either way letter case is
+ignored.  Patterns containing spaces or keywords can be quoted.
+
+A LINE selector picks the case spanning that line of the spec,  counting the
+lines of the expanded spec as reported for failures,  which are the lines of the
+spec file itself when it uses no templates.  START-END picks every case
+overlapping those lines.  Each argument is run on its own,  like a repeated spec
+path,  so naming a spec both plainly and with a selector runs the whole spec and
+then the selected cases again.
+"""
+
+import argparse
+import fnmatch
+import os
+import re
+from typing import Callable
+
+from .case import Case
+
+# -----------------------------------------------------------------------------------
+
+TOKEN = re.compile(r"""\s*(?:(\()|(\))|"([^"]*)"|'([^']*)'|([^\s()]+))""")
+
+KEYWORDS = ("and", "or", "not")
+
+
+def compile_expression(expression: str) -> Callable[[str], bool]:
+    """Return a predicate on case names for -k `expression`."""
+    tokens = tokenize(expression)
+    position = 0
+
+    def peek() -> str | None:
+        return tokens[position] if position < len(tokens) else None
+
+    def take() -> str:
+        nonlocal position
+        if position >= len(tokens):
+            raise ValueError(f"Incomplete -k expression '{expression}'.")
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or():
+        terms = [parse_and()]
+        while peek() == "or":
+            take()
+            terms.append(parse_and())
+        return lambda name: any(term(name) for term in terms)
+
+    def parse_and():
+        terms = [parse_not()]
+        while peek() == "and":
+            take()
+            terms.append(parse_not())
+        return lambda name: all(term(name) for term in terms)
+
+    def parse_not():
+        token = take()
+        if token == "not":
+            term = parse_not()
+            return lambda name: not term(name)
+        if token == "(":
+            term = parse_or()
+            if take() != ")":
+                raise ValueError(f"Unbalanced parentheses in -k '{expression}'.")
+            return term
+        if token in KEYWORDS or token == ")":
+            raise ValueError(f"Unexpected '{token}' in -k '{expression}'.")
+        return pattern_matcher(token.removeprefix("\0"))
+
+    predicate = parse_or()
+    if position < len(tokens):
+        raise ValueError(f"Unexpected '{tokens[position]}' in -k '{expression}'.")
+    return predicate
+
+
+def tokenize(expression: str) -> list[str]:
+    """Split `expression` into parentheses,  keywords,  and patterns.  Quoted
+    patterns are prefixed with NUL so they are never taken as keywords.
+    """
+    tokens = []
+    for match in TOKEN.finditer(expression.strip()):
+        opening, closing, double, single, word = match.groups()
+        if double is not None or single is not None:
+            tokens.append("\0" + (double if double is not None else single))
+        else:
+            tokens.append(opening or closing or word)
+    return tokens
+
+
+def pattern_matcher(pattern: str) -> Callable[[str], bool]:
+    pattern = pattern.lower()
+    if any(char in pattern for char in "*?["):
+        return lambda name: fnmatch.fnmatchcase(name.lower(), pattern)
+    return lambda name: pattern in name.lower()
+
+
+def check_expression(expression: str) -> str:
+    """Validate -k `expression` for argparse,  returning it unchanged."""
+    try:
+        compile_expression(expression)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from None
+    return expression
+
+
+LINE_SELECTOR = re.compile(r"(.+):(\d+)(?:-(\d+))?")
+
+
+def parse_selector(spec: str) -> tuple[str, list[tuple[int, int]] | None]:
+    """Split a spec.txt:LINE or spec.txt:START-END argument into the spec path and
+    the 1-based line range selected,  or None for a plain path selecting the whole
+    spec.  An existing file is a plain path even if it looks like a selector.
+    """
+    match = None if os.path.exists(spec) else LINE_SELECTOR.fullmatch(spec)
+    if not match:
+        return spec, None
+    start = int(match.group(2))
+    return match.group(1), [(start, int(match.group(3) or start))]
+
+
+def case_span(case: Case) -> tuple[int, int]:
+    """Return the first and last 1-based lines of `case` in its spec."""
+    linenos = [
+        line.lineno
+        for block in (
+            case.narrative,
+            [case.name, case.run_as, *case.options.values()],
+            case.commands,
+            [case.expected.exit_code],
+            case.expected.stdout,
+            case.expected.stderr,
+        )
+        for line in block
+        if line.lineno >= 0
+    ]
+    return (min(linenos) + 1, max(linenos) + 1) if linenos else (0, 0)
+
+
+def spans_lines(case: Case, ranges: list[tuple[int, int]]) -> bool:
+    """Return True if `case` overlaps any of the 1-based line `ranges`."""
+    first, last = case_span(case)
+    return any(start <= last and first <= end for start, end in ranges)
@@ -0,0 +1,89 @@
+"""This module splits the cases of a run into disjoint shards for --shard I/N.
+
+Cases are partitioned in units which must run on the same node:  a case on its
+own,  or every case joined through a shared group: or a depends: declaration.
+Without timings the units are dealt round-robin in spec order.  With past
+durations they are assigned longest first to the least loaded shard,  the greedy
+longest-processing-time heuristic for minimizing the slowest shard's run time.
+Both are deterministic,  so every node computes the same partition from the same
+specs and timings.
+"""
+
+import heapq
+
+from .case import Case
+from .scheduler import split_names
+
+# -----------------------------------------------------------------------------------
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    """Parse a --shard value of the form I/N with 1 <= I <= N."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{value}',  expected I/N such as 2/4.")
+    if not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{value}',  I must be between 1 and N.")
+    return index, count
+
+
+def units(cases: list[Case]) -> list[list[int]]:
+    """Group the indices of `cases` into units joined by group: and depends:,
+    ordered by their first case.
+    """
+    parent = list(range(len(cases)))
+
+    def find(index: int) -> int:
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    def union(a: int, b: int) -> None:
+        a, b = find(a), find(b)
+        parent[max(a, b)] = min(a, b)
+
+    # Earlier cases by ("group", group) and ("name", name);  like the scheduler,
+    # depends: may name either,  and a name may be shared by several cases.
+    earlier: dict[tuple[str, str], list[int]] = {}
+    for index, case in enumerate(cases):
+        keys = [("name", str(case.name))]
+        if group := case.option("group"):
+            keys.append(("group", group))
+            for other in earlier.get(("group", group), [])[:1]:
+                union(index, other)
+        for name in split_names(case.option("depends")):
+            for key in (("group", name), ("name", name)):
+                for other in earlier.get(key, []):
+                    union(index, other)
+        for key in keys:
+            earlier.setdefault(key, []).append(index)
+    members: dict[int, list[int]] = {}
+    for index in range(len(cases)):
+        members.setdefault(find(index), []).append(index)
+    return list(members.values())
+
+
+def partition(
+    unit_keys: list[list[str]], durations: dict[str, float], count: int
+) -> list[list[int]]:
+    """Assign the units,  each given as the case keys it contains,  to `count`
+    shards,  returning the unit indices of each shard.  Cases without a recorded
+    duration are assumed to take the mean of those with one.
+    """
+    shards: list[list[int]] = [[] for _ in range(count)]
+    if not durations:
+        for index in range(len(unit_keys)):
+            shards[index % count].append(index)
+        return shards
+    default = sum(durations.values()) / len(durations)
+    costs = [sum(durations.get(key, default) for key in keys) for keys in unit_keys]
+    loads = [(0.0, shard) for shard in range(count)]
+    for index in sorted(range(len(unit_keys)), key=lambda i: (-costs[i], i)):
+        load, shard = heapq.heappop(loads)
+        shards[shard].append(index)
+        heapq.heappush(loads, (load + costs[index], shard))
+    for members in shards:
+        members.sort()
+    return shards
@@ -1,9 +1,23 @@
+import contextlib
+import locale
+import resource
+import selectors
+import signal
 import subprocess
 import tempfile
+import threading
+import time
 import os
+from typing import TYPE_CHECKING
 
+from .capture import Capture, LineMatcher
+from .command_result import ResourceUsage
 from .log import log
 
+if TYPE_CHECKING:  # these import shell themselves
+    from .cache import ResultCache
+    from .scratch import ScratchDirs
+
 # -----------------------------------------------------------------------------------
 
 HEADER = "#!\bin/bash set -eu -o pipefail\n"
@@ -22,21 +36,183 @@ def set_trailer(script: str) -> None:
     log.debug(f"Setting trailer:\n{'.'*80}\n{script}")
 
 
-def shell(
-    script: str,
-    cwd: str = ".",
-    timeout: int = 10,
-    check: bool = False,
-    interpreter: str = "/bin/bash",
-    run_as=None,
-) -> subprocess.CompletedProcess:
-    """Treat `script` as an inline multi-line bash script and execute it after switching
-    to the `cwd` directory.
+DEFAULT_TIMEOUT = 10  # seconds a case may run
+KILL_GRACE = 2  # seconds between SIGTERM and SIGKILL for a case which timed out
+
+DELIVERIES = ("auto", "memfd", "pipe", "tempfile")
+PIPE_CAPACITY = 65536  # Linux default,  writes smaller than this never block
+
+
+def best_delivery() -> str:
+    """Return the cheapest script delivery this platform supports."""
+    if hasattr(os, "memfd_create") and os.path.isdir("/proc/self/fd"):
+        return "memfd"
+    elif os.path.isdir("/dev/fd"):
+        return "pipe"
+    else:
+        return "tempfile"
+
+
+@contextlib.contextmanager
+def script_path(script: str, delivery: str = "auto"):
+    """Make `script` readable by a child interpreter,  yielding the path to pass it
+    and the file descriptors it must inherit.
+
+    memfd:     an anonymous in-memory file read through /dev/fd/N.
+    pipe:      a pipe read through /dev/fd/N,  fed by a thread if it might block.
+    tempfile:  a named temporary file,  the only choice on platforms without /dev/fd.
     """
-    # global HEADER, TRAILER
-    combined_script = f"""#!{interpreter}
+    delivery = best_delivery() if delivery == "auto" else delivery
+    data = script.encode()
+    if delivery == "memfd":
+        try:
+            fd = os.memfd_create("sh-doctest-script")
+        except OSError:
+            log.debug("memfd_create failed,  falling back to a tempfile.")
+        else:
+            try:
+                os.write(fd, data)
+                yield f"/dev/fd/{fd}", (fd,)
+            finally:
+                os.close(fd)
+            return
+    elif delivery == "pipe":
+        read_fd, write_fd = os.pipe()
+        os.fchmod(read_fd, 0o444)  # reopened through /dev/fd after run_as switches user
+        writer = None
+        if len(data) < PIPE_CAPACITY:
+            _feed_pipe(write_fd, data)  # cannot block on an empty pipe
+        else:
+            writer = threading.Thread(target=_feed_pipe, args=(write_fd, data))
+            writer.start()
+        try:
+            yield f"/dev/fd/{read_fd}", (read_fd,)
+        finally:
+            os.close(read_fd)  # unblocks the writer if the script exited early
+            if writer:
+                writer.join()
+        return
+    tmp = tempfile.NamedTemporaryFile(mode="w", delete=False)
+    try:
+        tmp.write(script)
+        tmp.flush()
+        tmp.close()
+        os.chmod(tmp.name, 0o755)
+        yield tmp.name, ()
+    finally:
+        os.remove(tmp.name)
 
-{HEADER}
+
+def _feed_pipe(write_fd: int, data: bytes) -> None:
+    try:
+        with open(write_fd, "wb") as pipe:
+            pipe.write(data)
+    except BrokenPipeError:
+        pass
+
+
+class Cancellation:
+    """Lets a concurrent run stop the cases it has in flight.  cancel() sets
+    `cancelled` and makes `fd` readable,  waking every process and worker waiting
+    on it in a selector,  which then kill their case and raise CaseCancelled.
+    """
+
+    def __init__(self) -> None:
+        self.fd, self.write_fd = os.pipe()
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        if not self.cancelled:
+            self.cancelled = True
+            os.write(self.write_fd, b"x")
+
+    def close(self) -> None:
+        os.close(self.fd)
+        os.close(self.write_fd)
+
+
+class ShellContext:
+    """The settings for running the case scripts of one spec:  the header and trailer
+    wrapped around every script,  the state captured from setup fixtures,  how
+    scripts are run and delivered,  the default timeout,  output limit,  and fail
+    fast mode,  and the optional result cache and scratch directories.  Each spec
+    owns a context so specs can run concurrently without sharing the module level
+    HEADER and TRAILER.
+    """
+
+    ENGINES = ("subprocess", "worker", "asyncio")
+
+    def __init__(
+        self,
+        header: str | None = None,
+        trailer: str | None = None,
+        engine: str = "subprocess",
+        delivery: str = "auto",
+        timeout: float = DEFAULT_TIMEOUT,
+        max_output: int | None = None,
+        fail_fast_output: bool = False,
+    ) -> None:
+        self.header = HEADER if header is None else header
+        self.trailer = TRAILER if trailer is None else trailer
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown shell engine '{engine}'.")
+        if delivery not in DELIVERIES:
+            raise ValueError(f"Unknown script delivery '{delivery}'.")
+        self.engine = engine
+        self.delivery = delivery
+        self.timeout = timeout  # unless a case sets timeout:
+        self.max_output = max_output  # bytes per stream unless a case sets max_output:
+        self.fail_fast_output = fail_fast_output  # unless a case sets fail_fast_output:
+        self.cache: ResultCache | None = None  # shared by every spec in a run
+        self.session_dir: str | None = None  # session_setup: state shared by a run
+        self.session_state = ""  # bash source recreating session_setup: state
+        self.spec_state = ""  # bash source recreating setup: state
+        self.scratch: ScratchDirs | None = None  # shared by every spec in a run
+        self.cancellation: Cancellation | None = None  # set by concurrent runs
+
+    def __repr__(self) -> str:
+        return f"ShellContext{self.settings()!r}"
+
+    def settings(self) -> tuple:
+        """The constructor arguments which recreate this context."""
+        return (
+            self.header,
+            self.trailer,
+            self.engine,
+            self.delivery,
+            self.timeout,
+            self.max_output,
+            self.fail_fast_output,
+        )
+
+    def copy(self) -> "ShellContext":
+        context = ShellContext(*self.settings())
+        context.cache = self.cache
+        context.session_dir = self.session_dir
+        context.session_state = self.session_state
+        context.spec_state = self.spec_state
+        context.scratch = self.scratch
+        return context
+
+    def preamble(self) -> str:
+        """The header followed by any state captured from setup fixtures."""
+        states = [state for state in (self.session_state, self.spec_state) if state]
+        return "\n".join([self.header, *states])
+
+    def set_header(self, script: str) -> None:
+        self.header = script
+        log.debug(f"Setting header:\n{'.'*80}\n{script}")
+
+    def set_trailer(self, script: str) -> None:
+        self.trailer = script
+        log.debug(f"Setting trailer:\n{'.'*80}\n{script}")
+
+
+def wrap_script(script: str, interpreter: str, context: ShellContext) -> str:
+    """Return `script` between the preamble and trailer of `context`."""
+    return f"""#!{interpreter}
+
+{context.preamble()}
 
 # ...............................................................................
 
@@ -44,31 +220,235 @@ def shell(
 
 # ...............................................................................
 
-{TRAILER}
+{context.trailer}
 """
+
+
+def shell(
+    script: str,
+    cwd: str = ".",
+    timeout: float = DEFAULT_TIMEOUT,
+    check: bool = False,
+    interpreter: str = "/bin/bash",
+    run_as=None,
+    context: ShellContext | None = None,
+    max_output: int | None = None,
+    watch: LineMatcher | None = None,
+) -> subprocess.CompletedProcess:
+    """Treat `script` as an inline multi-line bash script and execute it after switching
+    to the `cwd` directory.  The header and trailer come from `context` or default
+    to the module level HEADER and TRAILER.  Output beyond `max_output` bytes per
+    stream is discarded.  With `watch`,  the script is killed as soon as its
+    stdout diverges from the expected lines and OutputDiverged is raised.
+    """
+    context = context or ShellContext()
+    combined_script = wrap_script(script, interpreter, context)
     user, group, extra_groups = process_run_as(run_as)
-    tmp = tempfile.NamedTemporaryFile(mode="w", delete=False)
-    try:
-        tmp.write(combined_script)
-        tmp.flush()
-        tmp.close()
-        os.chmod(tmp.name, 0o755)
-        result = subprocess.run(
-            (interpreter, tmp.name),
-            text=True,
-            capture_output=True,
-            check=check,
+    with script_path(combined_script, context.delivery) as (path, pass_fds):
+        result = run_process(
+            (interpreter, path),
+            timeout,
+            check,
+            max_output,
+            watch,
+            context.cancellation,
+            pass_fds=pass_fds,
             cwd=cwd,
-            timeout=timeout,
             user=user,
             group=group,
             extra_groups=extra_groups,
         )
+    return result
+
+
+class CompletedCase(subprocess.CompletedProcess):
+    """A CompletedProcess which also records the resources the case used and
+    which of its streams were truncated.
+    """
+
+    usage: ResourceUsage | None = None
+    truncated: tuple[str, ...] = ()  # streams cut short at max_output
+
+
+class CaseCancelled(subprocess.SubprocessError):
+    """Raised when a case is stopped by Cancellation.cancel(),  after its process
+    group has been killed.  `output` and `stderr` hold what it printed,  as bytes.
+    """
+
+    def __init__(self, cmd, output: bytes = b"", stderr: bytes = b""):
+        self.cmd = cmd
+        self.output = output
+        self.stderr = stderr
+
+    def __str__(self) -> str:
+        return "Cancelled after another case failed"
+
+
+class OutputDiverged(subprocess.SubprocessError):
+    """Raised when a process watched by a LineMatcher prints a line which does not
+    match its expected output.  `index` is the position of the expected line and
+    `line` what was printed instead.  The process group has been killed and
+    `output` and `stderr` hold what it printed,  as bytes.
+    """
+
+    def __init__(self, cmd, index: int, line: str, output: bytes, stderr: bytes):
+        self.cmd = cmd
+        self.index = index
+        self.line = line
+        self.output = output
+        self.stderr = stderr
+
+    def __str__(self) -> str:
+        return f"Output diverged from expected line {self.index + 1}: {self.line!r}"
+
+    @property
+    def stdout(self) -> bytes:
+        return self.output
+
+
+def run_process(
+    args: tuple[str, ...],
+    timeout: float,
+    check: bool = False,
+    max_output: int | None = None,
+    watch: LineMatcher | None = None,
+    cancellation: Cancellation | None = None,
+    **popen_kwargs,
+) -> subprocess.CompletedProcess:
+    """Run `args` like subprocess.run(args, capture_output=True, text=True) but in a
+    new session,  reaping the child with os.wait4() so the result also carries its
+    ResourceUsage as result.usage.
+
+    Each stream is collected by a Capture which spills to disk when large and keeps
+    at most `max_output` bytes.  result.truncated names the streams which were cut
+    short.  On timeout the whole process group is killed with kill_group() and the
+    TimeoutExpired raised carries whatever output was collected,  as bytes.
+    Likewise OutputDiverged is raised as soon as stdout departs from what `watch`
+    expects,  and CaseCancelled as soon as `cancellation` is cancelled.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    stdout, stderr = Capture(max_output, watch=watch), Capture(max_output)
+    diverged = (lambda: watch.divergence is not None) if watch else None
+    shared_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        with subprocess.Popen(
+            args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+            **popen_kwargs,
+        ) as process, selectors.DefaultSelector() as selector:
+            assert process.stdout is not None and process.stderr is not None
+            selector.register(process.stdout, selectors.EVENT_READ, stdout)
+            selector.register(process.stderr, selectors.EVENT_READ, stderr)
+            if cancellation:
+                selector.register(cancellation.fd, selectors.EVENT_READ)
+            reaped = None
+            if _read_until(selector, deadline, diverged):
+                reaped = _wait4(process.pid, deadline)
+            if reaped is None:
+                if cancellation:
+                    selector.unregister(cancellation.fd)
+                kill_group(process.pid, lambda limit: _read_until(selector, limit))
+                if cancellation and cancellation.cancelled:
+                    raise CaseCancelled(
+                        args, output=stdout.getvalue(), stderr=stderr.getvalue()
+                    )
+                if watch and watch.divergence:
+                    raise OutputDiverged(
+                        args,
+                        *watch.divergence,
+                        output=stdout.getvalue(),
+                        stderr=stderr.getvalue(),
+                    )
+                raise subprocess.TimeoutExpired(
+                    args, timeout, output=stdout.getvalue(), stderr=stderr.getvalue()
+                )
+            status, rusage = reaped
+            process.returncode = os.waitstatus_to_exitcode(status)
+        result = CompletedCase(
+            args,
+            process.returncode,
+            stdout.decode(decode_output),
+            stderr.decode(decode_output),
+        )
     finally:
-        os.remove(tmp.name)
+        stdout.close()
+        stderr.close()
+    result.usage = ResourceUsage.from_rusage(
+        time.monotonic() - start, rusage, shared_rss
+    )
+    result.truncated = tuple(
+        name
+        for name, capture in (("stdout", stdout), ("stderr", stderr))
+        if capture.truncated
+    )
+    if check:
+        result.check_returncode()
     return result
 
 
+def kill_group(pgid: int, wait, grace: float | None = None) -> None:
+    """Send SIGTERM to process group `pgid`,  call wait(deadline) to give it until
+    `grace` seconds from now to exit,  then SIGKILL whatever remains.
+    """
+    grace = KILL_GRACE if grace is None else grace
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(pgid, sig)
+        except ProcessLookupError:
+            return
+        if sig == signal.SIGTERM:
+            wait(time.monotonic() + grace)
+
+
+def _read_until(selector: selectors.BaseSelector, deadline: float, stop=None) -> bool:
+    """Collect output from the pipes registered with `selector` into their data
+    buffers,  returning True if they all closed before `deadline`,  before the
+    optional stop() returned True,  and before any file registered without a
+    buffer,  i.e. a Cancellation,  became readable.
+    """
+    while any(key.data is not None for key in selector.get_map().values()):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or (stop and stop()):
+            return False
+        for key, _ in selector.select(remaining):
+            if key.data is None:
+                return False
+            data = os.read(key.fd, 65536)
+            if data:
+                key.data.extend(data)
+            else:
+                selector.unregister(key.fileobj)
+    return True
+
+
+def _wait4(pid: int, deadline: float):
+    """Reap `pid` by `deadline`,  returning its wait status and resource usage,  or
+    None if it is still running.
+    """
+    delay = 0.0001
+    while True:
+        reaped, status, rusage = os.wait4(pid, os.WNOHANG)
+        if reaped:
+            return status, rusage
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(delay)
+        delay = min(delay * 2, 0.01)
+
+
+def decode_output(data) -> str:
+    """Decode raw process output,  bytes or any buffer,  the way
+    subprocess.run(..., text=True) does,  including universal newline translation.
+    """
+    text = str(data, locale.getpreferredencoding(False), "replace")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
 def process_run_as(run_as):
     if run_as:
         parts = run_as.line.split(":")
@@ -1,6 +1,12 @@
+from typing import Any, Callable, Iterable, Iterator
+
 import yaml
 
 from .case import Case, CaseParser
+from .command_result import ResourceUsage
+from .fixtures import FIXTURES, FixtureError, capture_state, run_fixture, session_state
+from .history import case_key
+from .scheduler import AsyncScheduler, CaseGraph, Scheduler
 from .log import log
 from . import shell
 
@@ -13,11 +19,30 @@ class Spec:
         spec_path: str,
         exit_first_failure: bool = False,
         drop_uninteresting: bool = False,
+        jobs: int = 1,
+        context: shell.ShellContext | None = None,
+        source_path: str | None = None,
     ) -> None:
         self.spec_path: str = spec_path
+        self.source_path: str = source_path or spec_path  # as named by the user
         self.test_cases: list[Case] = []
         self.exit_first_failure: bool = exit_first_failure
         self.drop_uninteresting: bool = drop_uninteresting
+        self.jobs: int = jobs
+        self.context = context or shell.ShellContext()
+        self.keep_cases: bool = True  # retain cases run by run_stream()
+        self.in_shard: Callable[[Case], bool] | None = None  # cases of this node
+        self.selector: Callable[[Case], bool] | None = None  # cases to run
+        self.case_count: int = 0  # cases selected to run
+        self.skipped: int = 0  # cases of this shard not selected
+        self.header: str | None = None  # defined by this spec,  if any
+        self.trailer: str | None = None
+        self.usages: list[tuple[str, ResourceUsage]] = []  # (case label, usage)
+        self.durations: dict[str, float] = {}  # by history.case_key()
+        self.statuses: dict[str, bool] = {}  # True if failed,  by history.case_key()
+        self.order_key: Callable[[Case], Any] | None = None  # --schedule policy
+        self.fixtures: dict[str, Case] = {}  # setup:,  teardown:,  session_setup:
+        self.fixtures_run: set[str] = set()
 
     def __repr__(self) -> str:
         return f"Spec {self.spec_path} with {len(self.test_cases)} test cases."
@@ -47,33 +72,208 @@ class Spec:
             with open(path, "w+", encoding="utf-8") as spec_file:
                 spec_file.write(self.to_yaml())
 
-    def parse(self) -> None:
-        """Parse a test specification into a list of Case objects."""
-        self.test_cases = []
-        parser = CaseParser.from_file(self.spec_path)
-        while parser.lines:
+    def parse(self, text: str | None = None) -> None:
+        """Parse a test specification into a list of Case objects,  from `text`
+        if given or else from the file at spec_path.
+        """
+        if text is None:
+            parser = CaseParser.from_file(self.spec_path)
+        else:
+            parser = CaseParser.from_text(text)
+        self.test_cases = list(self.iter_cases(parser))
+
+    def restore(
+        self,
+        cases: list[Case],
+        header: str | None,
+        trailer: str | None,
+        fixtures: dict[str, Case] | None = None,
+    ) -> None:
+        """Adopt previously parsed `cases`,  applying the header and trailer they
+        were parsed with as parse() would have.
+        """
+        self.test_cases = cases
+        self.fixtures = dict(fixtures or {})
+        if header is not None:
+            self.header = header
+            self.context.set_header(header)
+        if trailer is not None:
+            self.trailer = trailer
+            self.context.set_trailer(trailer)
+
+    def iter_cases(self, parser: CaseParser) -> Iterator[Case]:
+        """Yield test cases as they are parsed,  applying header and trailer
+        pseudo-cases to the context as they are seen and setting aside fixtures.
+        Cases repeating the name and commands of earlier ones are numbered so
+        each has a distinct history.case_key().
+        """
+        seen: dict[tuple[str, str], int] = {}
+        while not parser.at_end():
             case = parser.parse()
-            # Conveniently,  the shell persistence of header and trailer lines
-            # is global,  so header and trailer persist between specs.
+            # The header and trailer persist into later specs when the caller
+            # passes this spec's context on to the next Spec.
             if case.name == "header":
-                shell.set_header(str(case.commands))
+                self.header = str(case.commands)
+                self.context.set_header(self.header)
             elif case.name == "trailer":
-                shell.set_trailer(str(case.commands))
+                self.trailer = str(case.commands)
+                self.context.set_trailer(self.trailer)
+            elif str(case.name) in FIXTURES:
+                self.fixtures[str(case.name)] = case
             else:
-                self.test_cases.append(case)
+                identity = (str(case.name), str(case.commands))
+                case.occurrence = seen.get(identity, 0)
+                seen[identity] = case.occurrence + 1
+                yield case
 
-    def run_and_check(self) -> bool:
-        """Run and check all the test cases."""
-        failed = False
+    def run_stream(self, lines: Iterable, dry_run: bool = False) -> int:
+        """Parse and run cases one at a time from a stream of expanded lines,  so
+        the first cases run while later ones are still being expanded.  Only cases
+        worth saving are retained,  and only when keep_cases is set.
+        """
+        self.case_count = self.skipped = 0
+        if dry_run:
+            for case in self.iter_cases(CaseParser(lines)):
+                self.case_count += self.select(case)
+            return 0
+        try:
+            failures = self.stream_cases(lines)
+        except FixtureError as exc:
+            log.error(str(exc))
+            failures = 1
+        return failures + self.tear_down()
+
+    def stream_cases(self, lines: Iterable) -> int:
         failures = 0
-        for test_case in self.test_cases:
-            try:
-                failed = test_case.run_and_check()
-            except Exception:
-                log.exception(f"On: {test_case.name} ::\n{test_case.commands}\n")
-                failed = True
+        for case in self.iter_cases(CaseParser(lines)):
+            if not self.select(case):
+                continue
+            self.case_count += 1
+            self.set_up()  # fixtures defined before this case
+            failed = self.run_case(case)
+            if self.keep_cases and (
+                not self.drop_uninteresting or case.is_interesting()
+            ):
+                self.test_cases.append(case)
             if failed:
                 failures += 1
                 if self.exit_first_failure:
                     return 1
         return failures
+
+    def run_and_check(self) -> int:
+        """Run and check the selected test cases between the spec's setup and
+        teardown,  returning the failure count.
+        """
+        self.skipped = 0
+        selected = [i for i, case in enumerate(self.test_cases) if self.select(case)]
+        if self.selector is not None:
+            self.select_requirements(selected)
+        cases = [case for case in self.test_cases if case.selected]
+        self.case_count = len(cases)
+        if not cases:
+            return 0
+        try:
+            self.set_up()
+            failures = self.run_cases(cases)
+        except FixtureError as exc:
+            log.error(str(exc))
+            failures = 1
+        return failures + self.tear_down()
+
+    def select(self, test_case: Case) -> bool:
+        """Mark whether `test_case` is selected to run,  counting it as skipped if
+        it belongs to this shard but is not.
+        """
+        in_shard = self.in_shard is None or self.in_shard(test_case)
+        test_case.selected = in_shard and (
+            self.selector is None or self.selector(test_case)
+        )
+        self.skipped += in_shard and not test_case.selected
+        return test_case.selected
+
+    def select_requirements(self, selected: list[int]) -> None:
+        """Also select the cases which the `selected` cases declare they depend on
+        with group: or depends:.
+        """
+        for index in CaseGraph(self.test_cases).requirements(selected):
+            if not self.test_cases[index].selected:
+                self.test_cases[index].selected = True
+                self.skipped -= 1
+
+    def run_cases(self, cases: list[Case]) -> int:
+        scheduler: type[Scheduler] | None
+        if self.context.engine == "asyncio":
+            scheduler = AsyncScheduler
+        elif self.jobs > 1 or self.order_key:
+            scheduler = Scheduler
+        else:
+            scheduler = None
+        if scheduler:
+            runner = scheduler(
+                cases, self.jobs, self.exit_first_failure, self.context, self.order_key
+            )
+            failures = runner.run()
+            for index, test_case in enumerate(cases):
+                if index in runner.outcomes:
+                    self.record(test_case, runner.outcomes[index] is not False)
+            return failures
+        failures = 0
+        for test_case in cases:
+            if self.run_case(test_case):
+                failures += 1
+                if self.exit_first_failure:
+                    return 1
+        return failures
+
+    def set_up(self) -> None:
+        """Run the session_setup: and setup: fixtures not yet run,  adding the state
+        they leave to the context.  Raises FixtureError if one fails.
+        """
+        for name in ("session_setup", "setup"):
+            if name not in self.fixtures or name in self.fixtures_run:
+                continue
+            self.fixtures_run.add(name)
+            fixture = self.fixtures[name]
+            if name == "session_setup":
+                self.context.session_state = session_state(fixture, self.context)
+            else:
+                self.context.spec_state = capture_state(fixture, self.context)
+
+    def tear_down(self) -> int:
+        """Run the teardown: fixture,  if any,  drop the state of setup: so it does
+        not leak into later specs,  and remove the spec's scratch directories.
+        Returns 1 if the teardown failed.
+        """
+        failures = 0
+        if (fixture := self.fixtures.get("teardown")) and self.case_count:
+            try:
+                run_fixture(fixture, self.context, check=True)
+            except FixtureError as exc:
+                log.error(str(exc))
+                failures = 1
+        if "setup" in self.fixtures_run:
+            self.context.spec_state = ""
+        if self.context.scratch:
+            self.context.scratch.release_groups()
+        return failures
+
+    def run_case(self, test_case: Case) -> bool:
+        """Run and check one case,  returning True if it failed."""
+        failed = True
+        try:
+            failed = test_case.run_and_check(context=self.context)
+        except Exception:
+            log.exception(f"On: {test_case.name} ::\n{test_case.commands}\n")
+        finally:
+            self.record(test_case, failed)
+        return failed
+
+    def record(self, test_case: Case, failed: bool) -> None:
+        """Note whether `test_case` failed and the resources it used if measured."""
+        key = case_key(self.source_path, test_case)
+        self.statuses[key] = failed
+        if test_case.result.usage is not None:
+            label = f"{self.source_path}:{test_case.name.lineno+1} {test_case.name}"
+            self.usages.append((label, test_case.result.usage))
+            self.durations[key] = test_case.result.usage.duration
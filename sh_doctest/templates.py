@@ -1,17 +1,58 @@
+import hashlib
+import itertools
+import os
 import re
+from typing import Iterable, Iterator
 
 from .line_block import LineBlock
 from .numbered_line import NumberedLine
 from .log import log
 
-from jinja2 import Environment, BaseLoader
-
+import jinja2
+from jinja2 import Environment, BaseLoader, FileSystemBytecodeCache, TemplateNotFound
 
 # log.set_level("DEBUG")
 
 # =====================================================================================================
 
 
+class SourceLoader(BaseLoader):
+    """Serves template sources registered under the hash of their text.  Loading by
+    name rather than Environment.from_string() lets Jinja's bytecode cache apply.
+    """
+
+    def __init__(self) -> None:
+        self.sources: dict[str, str] = {}
+
+    def get_source(self, environment, name):
+        if name not in self.sources:
+            raise TemplateNotFound(name)
+        return self.sources[name], None, lambda: True
+
+
+LOADER = SourceLoader()
+ENVIRONMENT = Environment(loader=LOADER)
+COMPILED: dict[str, jinja2.Template] = {}  # template text -> compiled template
+
+
+def compile_template(text: str) -> jinja2.Template:
+    """Return the compiled form of template `text`,  compiling it at most once per
+    process no matter how many specs or expansions use it.
+    """
+    compiled = COMPILED.get(text)
+    if compiled is None:
+        name = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        LOADER.sources[name] = text
+        compiled = COMPILED[text] = ENVIRONMENT.get_template(name)
+    return compiled
+
+
+def use_bytecode_cache(directory: str) -> None:
+    """Persist compiled template bytecode in `directory` across runs."""
+    os.makedirs(directory, exist_ok=True)
+    ENVIRONMENT.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
 def transform_placeholders(input_string):
     """This function replaces placeholders/variables of the form <identifier> with Jinja2's
     somewhat more verbose {{ identifier }} syntax.  Note that the placeholder notation is only
@@ -47,6 +88,29 @@ def parse_value(keyword: str, line: NumberedLine) -> NumberedLine:
     return rval
 
 
+def stripped_lines(lines: Iterable[str]) -> Iterator[NumberedLine]:
+    """Number `lines` the way LineBlock.from_text("\n".join(lines)) would,  dropping
+    leading and trailing whitespace of the whole text,  while holding back no more
+    than the whitespace-only lines which might turn out to be trailing.
+    """
+    lineno = 0
+    held: list[str] = []  # last text line plus any whitespace-only lines after it
+    for line in lines:
+        if not held:
+            if line.strip():
+                held = [line.lstrip()]
+            continue
+        if line.strip():
+            for pending in held:
+                yield NumberedLine(pending, lineno)
+                lineno += 1
+            held = [line]
+        else:
+            held.append(line)
+    if held:
+        yield NumberedLine(held[0].rstrip(), lineno)
+
+
 class Template:
     """A template for a test specification which can be rendered to expand
     variables and produce corresponding test case instances.  It is parsed
@@ -96,8 +160,13 @@ class Template:
                 )
         else:
             raise ValueError("Missing end_template")
+        compile_template(self.text)
         return self
 
+    @property
+    def compiled(self) -> jinja2.Template:
+        return compile_template(self.text)
+
 
 class Expansion:
     """A template expansion is used to record a template name and the variables
@@ -135,13 +204,95 @@ class Expansion:
         return Expansion(name, variables)
 
 
+class MatrixExpansion:
+    """A matrix expansion expands a template once for every combination of the
+    values listed by its let: lines,  skipping combinations matched by an
+    exclude: line.  It has a simple form in the spec like this:
+
+    expand_matrix: <template name>
+    let: username  admin1 user1 user2
+    let: group     team1 team2
+    exclude: username=admin1 group=team2
+
+    An exclude: line skips the combinations with all of its variable=value pairs,
+    each naming a value listed by a let: line.
+    The matrix ends with anything other than a line beginning with let: or
+    exclude:
+    """
+
+    BATCH = 64  # combinations rendered into each chunk of text
+
+    def __init__(
+        self,
+        template_name: NumberedLine,
+        axes: dict[str, list[str]],
+        excludes: list[dict[str, str]] = [],
+    ) -> None:
+        self.template_name = NumberedLine(template_name)
+        self.axes = axes
+        self.excludes = excludes or []
+
+    @classmethod
+    def parse(cls, lines: LineBlock) -> "MatrixExpansion":
+        """Parse a matrix expansion from a list of lines."""
+        log.debug(f"Parsing matrix expansion from lines: {lines[0]}")
+        name = parse_value("expand_matrix", lines.pop(0))
+        axes: dict[str, list[str]] = {}
+        excludes: list[dict[str, str]] = []
+        while lines and lines[0].startswith(("let:", "exclude:")):
+            line = lines.pop(0)
+            if line.startswith("let:"):
+                var, *values = parse_value("let", line).line.split()
+                if not values:
+                    raise ValueError(f"let:  {repr(line)} lists no values")
+                axes[var] = values
+            else:
+                excludes.append(cls.parse_exclude(line))
+        for exclude in excludes:
+            for var, value in exclude.items():
+                if var not in axes:
+                    raise ValueError(f"exclude: names unknown variable {var} in {name}")
+                if value not in axes[var]:
+                    raise ValueError(
+                        f"exclude: {var}={value} is not a value of {var} in {name}"
+                    )
+        return cls(name, axes, excludes)
+
+    @staticmethod
+    def parse_exclude(line: NumberedLine) -> dict[str, str]:
+        exclude = {}
+        for pair in parse_value("exclude", line).line.split():
+            var, equals, value = pair.partition("=")
+            if not equals:
+                raise ValueError(f"exclude:  {repr(line)} expects variable=value")
+            exclude[var] = value
+        return exclude
+
+    def excluded(self, variables: dict[str, str]) -> bool:
+        return any(
+            all(variables[var] == value for var, value in exclude.items())
+            for exclude in self.excludes
+        )
+
+    def iter_expansions(self) -> Iterator[Expansion]:
+        """Yield an Expansion for each combination not excluded,  in the order of
+        the let: lines with the last varying fastest.
+        """
+        names = list(self.axes)
+        for values in itertools.product(*self.axes.values()):
+            variables = dict(zip(names, values))
+            if not self.excluded(variables):
+                variables["template"] = self.template_name.line
+                yield Expansion(self.template_name, variables)
+
+
 class TemplatedDoc:
     """Within the bounds of template definition and expansion notations,
     a templated document describes relatively arbitrary text using with a
     simple grammar like this:
 
     TemplatedDoc ::= DocPart*
-    DocPart ::= Text | Template | TemplateExpansion
+    DocPart ::= Text | Template | TemplateExpansion | MatrixExpansion
     Text ::= .*
     """
 
@@ -161,7 +312,19 @@ class TemplatedDoc:
         self.lines = lines or LineBlock()
         self.templates = templates or {}
         self.expansions = expansions or []
-        self.text = ""
+        self.matrix_count = 0  # combinations rendered by expand_matrix:,  not kept
+        self.chunks: list[str] = []
+        self.error_count = 0  # elements which failed to parse and were logged
+
+    @property
+    def expansion_count(self) -> int:
+        """The number of times a template has been rendered."""
+        return len(self.expansions) + self.matrix_count
+
+    @property
+    def text(self) -> str:
+        """The expanded document."""
+        return "".join(self.chunks)
 
     @classmethod
     def from_file(cls, path: str) -> "TemplatedDoc":
@@ -172,12 +335,22 @@ class TemplatedDoc:
 
     def parse(self) -> None:
         """Parse the templated document into a list of templates and template
-        expansions.
+        expansions,  accumulating the expanded text.
+        """
+        self.chunks.extend(self.iter_text())
+
+    def iter_text(self) -> Iterator[str]:
+        """Parse the document incrementally,  yielding each piece of expanded text as
+        soon as it is rendered.
         """
         last_len = len(self.lines)
         while self.lines:
+            chunk = None
             try:
-                self.parse_element()
+                chunk = self.parse_element()
+                if chunk is not None and not isinstance(chunk, str):
+                    yield from chunk  # a matrix,  rendered inside the try
+                    chunk = None
             except KeyboardInterrupt as e:
                 line = self.lines[0] if self.lines else "<empty>"
                 log.exception("Interrupt", self.path, "at", line, ":", repr(e))
@@ -185,8 +358,19 @@ class TemplatedDoc:
             except Exception as e:
                 line = self.lines[0] if self.lines else "<empty>"
                 log.exception("Error parsing", self.path, ":", repr(e))
+                self.error_count += 1
+            if isinstance(chunk, str):
+                yield chunk
             last_len = self.break_on_loop(last_len)
 
+    def iter_lines(self, chunks: Iterable[str] | None = None) -> Iterator[NumberedLine]:
+        """Yield the expanded document as numbered lines while it is still being
+        expanded,  numbered exactly as LineBlock.from_text(self.text) would be.
+        `chunks` defaults to iter_text() and may wrap it,  e.g. to save a copy.
+        """
+        chunks = self.iter_text() if chunks is None else chunks
+        return stripped_lines(line for chunk in chunks for line in chunk.splitlines())
+
     def break_on_loop(
         self, last_len: int
     ) -> int:  # Factored out so it can be mocked to null
@@ -195,29 +379,48 @@ class TemplatedDoc:
             raise RuntimeError(f"Infinite loop parsing {self.path}")
         return new_len
 
-    def parse_element(self) -> None:
+    def parse_element(self) -> str | Iterator[str] | None:
+        """Parse the next template,  expansion,  or narrative line,  returning the
+        expanded text it contributes to the document,  if any.  A matrix expansion
+        returns an iterator rendering its text lazily.
+        """
         log.debug(f"Parsing {repr(self.lines[0])}")
         line = self.lines[0]
         if line.startswith("template:"):
             template = Template.parse(self.lines)
             self.templates[template.name.line] = template
+            return None
         elif line.startswith("expand:"):
             expansion = Expansion.parse(self.lines)
             template = self.templates[expansion.template_name.line]
-            text = self.render(template.text, expansion.variables)
-            self.text += text + "\n"
+            text = template.compiled.render(expansion.variables)
             self.expansions.append(expansion)
+            return text + "\n"
+        elif line.startswith("expand_matrix:"):
+            matrix = MatrixExpansion.parse(self.lines)
+            template = self.templates[matrix.template_name.line]
+            return self.render_matrix(template, matrix)
         else:
             log.debug(f"Skipping narrative {repr(line)}")
-            text = self.lines.pop(0).line
-            self.text += text + "\n"
+            return self.lines.pop(0).line + "\n"
+
+    def render_matrix(
+        self, template: Template, matrix: MatrixExpansion
+    ) -> Iterator[str]:
+        """Render `template` for each combination of `matrix` as it is needed,
+        joining the text of up to BATCH combinations into each chunk.
+        """
+        compiled = template.compiled
+        expansions = matrix.iter_expansions()
+        while batch := list(itertools.islice(expansions, matrix.BATCH)):
+            self.matrix_count += len(batch)
+            yield "".join(
+                compiled.render(expansion.variables) + "\n" for expansion in batch
+            )
 
     def render(self, template_str: str, variables: dict[str, str]) -> str:
         """Render a template pattern using the given variables."""
-        environment = Environment(loader=BaseLoader())
-        template = environment.from_string(template_str)
-        rendered_text = template.render(variables)
-        return rendered_text
+        return compile_template(template_str).render(variables)
 
     def writeto(self, path: str) -> None:
         """Save the templated document to a file."""
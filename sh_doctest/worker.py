@@ -0,0 +1,394 @@
+"""This module defines an opt-in execution engine which keeps one long lived bash
+process per distinct run_as identity and header instead of starting a fresh
+interpreter for every case.
+
+The header is sent to a worker on its stdin and evaluated once when it starts.
+Each case is then sent as a NUL terminated script and evaluated in a background
+subshell with a process group of its own,  so it inherits the functions,
+variables,  and options defined by the header but cannot disturb the worker
+itself.  The subshell first writes a sentinel line carrying its process group to
+stdout.  When it exits,  whatever it left running in its group is sent SIGTERM
+and,  after a grace period,  SIGKILL,  and the worker writes a sentinel line
+carrying the exit status to stdout and a bare sentinel line to stderr,  which is
+how the output of consecutive cases is framed.  Output between the sentinels is
+collected by the same Captures as the subprocess engine uses.
+
+A worker which times out is killed along with its own and the case's process
+groups,  and a worker which dies is discarded;  either way a fresh worker is
+spawned for the next case with the same identity.
+"""
+
+import atexit
+import contextlib
+import os
+import re
+import selectors
+import shlex
+import signal
+import subprocess
+import threading
+import time
+import uuid
+
+from .capture import Capture
+from .command_result import ResourceUsage
+from .log import log
+from .shell import (
+    DEFAULT_TIMEOUT,
+    KILL_GRACE,
+    CaseCancelled,
+    Cancellation,
+    CompletedCase,
+    ShellContext,
+    decode_output,
+    process_run_as,
+)
+
+# -----------------------------------------------------------------------------------
+
+DRIVER = r"""
+__sh_doctest_sentinel=$1
+__sh_doctest_grace=$2
+set --
+IFS= read -r -d '' __sh_doctest_header
+eval "$__sh_doctest_header" </dev/null
+unset __sh_doctest_header
+while IFS= read -r -d '' __sh_doctest_script; do
+    set -m
+    (
+        set +m
+        printf '%s pgid %d\n' "$__sh_doctest_sentinel" "$BASHPID"
+        eval "$__sh_doctest_script"
+    ) </dev/null &
+    __sh_doctest_pid=$!
+    set +m
+    __sh_doctest_status=0
+    wait "$__sh_doctest_pid" 2>/dev/null || __sh_doctest_status=$?
+    if builtin kill -TERM -- "-$__sh_doctest_pid" 2>/dev/null; then
+        __sh_doctest_tries=$__sh_doctest_grace
+        while (( __sh_doctest_tries-- > 0 )) &&
+            builtin kill -0 -- "-$__sh_doctest_pid" 2>/dev/null; do
+            command sleep 0.1
+        done
+        builtin kill -KILL -- "-$__sh_doctest_pid" 2>/dev/null || true
+    fi
+    printf '%s %d\n' "$__sh_doctest_sentinel" "$__sh_doctest_status"
+    printf '%s\n' "$__sh_doctest_sentinel" >&2
+done
+"""
+
+
+class WorkerOutput:
+    """One output stream of a worker.  What a case writes is passed on to a
+    Capture,  minus the sentinel lines framing it,  holding back just enough of
+    the stream to recognize a sentinel split across reads.  `end` matches the
+    last line of a case's output and `start`,  if given,  its first line.
+    """
+
+    def __init__(
+        self,
+        capture: Capture,
+        end: re.Pattern,
+        start: re.Pattern | None = None,
+        hold: int = 0,
+    ) -> None:
+        self.capture = capture
+        self.end = end
+        self.start = start
+        self.hold = hold
+        self.pending = bytearray()
+        self.first: re.Match | None = None  # of start,  once seen
+        self.last: re.Match | None = None  # of end,  once seen
+
+    def extend(self, data: bytes) -> None:
+        self.pending.extend(data)
+        if self.start is not None and self.first is None:
+            if (newline := self.pending.find(b"\n")) < 0:
+                return
+            self.first = self.start.fullmatch(bytes(self.pending[: newline + 1]))
+            if self.first is None:
+                raise WorkerCrashed("Shell worker output is missing its sentinel.")
+            del self.pending[: newline + 1]
+        if match := self.end.search(bytes(self.pending)):
+            self.last = match
+            self.capture.extend(bytes(self.pending[: match.start()]))
+            self.pending.clear()
+        elif len(self.pending) > self.hold:
+            self.capture.extend(bytes(self.pending[: -self.hold or None]))
+            del self.pending[: -self.hold or None]
+
+    def flush(self) -> None:
+        """Pass on everything held back,  when the case is stopped early."""
+        self.capture.extend(bytes(self.pending))
+        self.pending.clear()
+
+
+class WorkerCrashed(RuntimeError):
+    """A shell worker exited while running a case."""
+
+
+class ShellWorker:
+    """A single long lived interpreter running DRIVER as one identity."""
+
+    def __init__(
+        self,
+        interpreter: str,
+        header: str,
+        cwd: str,
+        user: str | None,
+        group: str | None,
+        extra_groups: list[str] | None,
+    ) -> None:
+        if "\0" in header:
+            raise ValueError("Shell worker headers cannot contain NUL characters.")
+        self.sentinel = f"__sh_doctest_{uuid.uuid4().hex}"
+        grace = str(round(KILL_GRACE * 10))  # in tenths of a second
+        self.process = subprocess.Popen(
+            (interpreter, "-c", DRIVER, "sh-doctest-worker", self.sentinel, grace),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=cwd,
+            user=user,
+            group=group,
+            extra_groups=extra_groups,
+            start_new_session=True,
+        )
+        sentinel = re.escape(self.sentinel.encode())
+        self.start_pattern = re.compile(sentinel + rb" pgid (\d+)\n")
+        self.status_pattern = re.compile(sentinel + rb" (-?\d+)\n\Z")
+        self.stderr_pattern = re.compile(sentinel + rb"\n\Z")
+        log.debug(f"Started shell worker {self.process.pid} as {user}:{group}")
+        self.send(header)
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def send(self, text: str) -> None:
+        """Write `text` to the worker as one NUL terminated record."""
+        try:
+            assert self.process.stdin is not None
+            self.process.stdin.write(text.encode() + b"\0")
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            raise WorkerCrashed(self.crash_message()) from None
+
+    def run(
+        self,
+        script: str,
+        timeout: float,
+        max_output: int | None = None,
+        cancellation: Cancellation | None = None,
+    ) -> tuple[int, str, str, tuple[str, ...]]:
+        """Run `script` in a subshell of the worker,  returning the exit status,
+        stdout,  stderr,  and the names of the streams cut short at `max_output`
+        bytes.  If `cancellation` is cancelled first the worker is killed and
+        CaseCancelled raised.
+        """
+        if "\0" in script:
+            raise ValueError("Shell worker scripts cannot contain NUL characters.")
+        self.send(script)
+        hold = len(self.sentinel) + 16
+        stdout = WorkerOutput(
+            Capture(max_output), self.status_pattern, self.start_pattern, hold
+        )
+        stderr = WorkerOutput(Capture(max_output), self.stderr_pattern, hold=hold)
+        try:
+            self.collect(script, timeout, stdout, stderr, cancellation)
+            assert stdout.last is not None
+            status = int(stdout.last.group(1))
+            truncated = tuple(
+                name
+                for name, output in (("stdout", stdout), ("stderr", stderr))
+                if output.capture.truncated
+            )
+            return (
+                status,
+                stdout.capture.decode(decode_output),
+                stderr.capture.decode(decode_output),
+                truncated,
+            )
+        finally:
+            stdout.capture.close()
+            stderr.capture.close()
+
+    def collect(
+        self,
+        script: str,
+        timeout: float,
+        stdout: WorkerOutput,
+        stderr: WorkerOutput,
+        cancellation: Cancellation | None,
+    ) -> None:
+        """Read the output of the case running `script` until both streams have
+        reached their closing sentinels.
+        """
+        deadline = time.monotonic() + timeout
+        assert self.process.stdout is not None and self.process.stderr is not None
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.process.stdout, selectors.EVENT_READ, stdout)
+            selector.register(self.process.stderr, selectors.EVENT_READ, stderr)
+            if cancellation:
+                selector.register(cancellation.fd, selectors.EVENT_READ)
+            while stdout.last is None or stderr.last is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stop_case(stdout, stderr)
+                    raise subprocess.TimeoutExpired(
+                        script,
+                        timeout,
+                        output=stdout.capture.getvalue(),
+                        stderr=stderr.capture.getvalue(),
+                    )
+                for key, _ in selector.select(remaining):
+                    if key.data is None:
+                        self.stop_case(stdout, stderr)
+                        raise CaseCancelled(
+                            script,
+                            output=stdout.capture.getvalue(),
+                            stderr=stderr.capture.getvalue(),
+                        )
+                    data = os.read(key.fd, 65536)
+                    if not data:
+                        self.kill()
+                        raise WorkerCrashed(self.crash_message())
+                    key.data.extend(data)
+
+    def stop_case(self, stdout: WorkerOutput, stderr: WorkerOutput) -> None:
+        """Kill the worker and the case it is running,  keeping what it printed."""
+        self.kill(int(stdout.first.group(1)) if stdout.first else None)
+        stdout.flush()
+        stderr.flush()
+
+    def crash_message(self) -> str:
+        return (
+            f"Shell worker {self.process.pid} exited with status {self.process.poll()}."
+        )
+
+    def kill(self, case_pgid: int | None = None) -> None:
+        """Kill the worker and everything it started.  Its process group and that of
+        the case it is running,  if known,  are sent SIGTERM and,  once the worker
+        has exited or after a grace period,  SIGKILL.
+        """
+        groups = (
+            [self.process.pid] if case_pgid is None else [case_pgid, self.process.pid]
+        )
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            for pgid in groups:
+                with contextlib.suppress(ProcessLookupError):
+                    os.killpg(pgid, sig)
+            if sig == signal.SIGTERM:
+                self.wait_until(time.monotonic() + KILL_GRACE)
+        self.process.wait()
+
+    def wait_until(self, deadline: float) -> None:
+        try:
+            self.process.wait(max(0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            pass
+
+    def stop(self) -> None:
+        """Ask the worker to exit by closing its input."""
+        try:
+            assert self.process.stdin is not None
+            self.process.stdin.close()
+            self.process.wait(timeout=1)
+        except (OSError, subprocess.TimeoutExpired):
+            self.kill()
+
+
+class WorkerPool:
+    """Idle workers keyed by interpreter,  header,  cwd,  and run_as identity.  A key
+    gets a second worker only when cases with that key run concurrently.  Workers
+    start in the current directory;  a case run elsewhere changes directory in its
+    own subshell so per-case scratch directories do not each need a worker.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.idle: dict[tuple, list[ShellWorker]] = {}
+
+    def acquire(self, key: tuple) -> ShellWorker:
+        with self.lock:
+            workers = self.idle.get(key, [])
+            while workers:
+                worker = workers.pop()
+                if worker.alive():
+                    return worker
+        interpreter, header, cwd, user, group, extra_groups = key
+        return ShellWorker(
+            interpreter,
+            header,
+            cwd,
+            user,
+            group,
+            list(extra_groups) if extra_groups is not None else None,
+        )
+
+    def release(self, key: tuple, worker: ShellWorker) -> None:
+        if worker.alive():
+            with self.lock:
+                self.idle.setdefault(key, []).append(worker)
+
+    def close(self) -> None:
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for workers in idle.values():
+            for worker in workers:
+                worker.stop()
+
+    def forget(self) -> None:
+        """Drop workers inherited by a forked child without touching them."""
+        self.lock = threading.Lock()
+        self.idle = {}
+
+
+POOL = WorkerPool()
+atexit.register(POOL.close)
+os.register_at_fork(after_in_child=POOL.forget)
+
+
+def shell(
+    script: str,
+    cwd: str = ".",
+    timeout: float = DEFAULT_TIMEOUT,
+    check: bool = False,
+    interpreter: str = "/bin/bash",
+    run_as=None,
+    context: ShellContext | None = None,
+    max_output: int | None = None,
+    watch=None,
+) -> subprocess.CompletedProcess:
+    """Run `script` like shell.shell() but in a persistent worker for its identity.
+    The worker reaps the case subshell,  so only its wall clock time is measured,
+    and `watch` is ignored.
+    """
+    context = context or ShellContext()
+    user, group, extra_groups = process_run_as(run_as)
+    if cwd != ".":
+        script = f"cd -- {shlex.quote(cwd)} || exit\n{script}"
+    key = (
+        interpreter,
+        context.preamble(),
+        ".",
+        user,
+        group,
+        tuple(extra_groups) if extra_groups is not None else None,
+    )
+    worker = POOL.acquire(key)
+    start = time.monotonic()
+    try:
+        status, stdout, stderr, truncated = worker.run(
+            f"{script}\n\n{context.trailer}\n",
+            timeout,
+            max_output,
+            context.cancellation,
+        )
+    finally:
+        POOL.release(key, worker)
+    if check and status:
+        raise subprocess.CalledProcessError(status, script, stdout, stderr)
+    result = CompletedCase(script, status, stdout, stderr)
+    result.usage = ResourceUsage(time.monotonic() - start)
+    result.truncated = truncated
+    return result
@@ -0,0 +1,15 @@
+import pytest
+
+from sh_doctest.case import CaseParser
+
+
+@pytest.fixture
+def make_case():
+    """Return a factory parsing a case with the given name,  commands,  and options."""
+
+    def make(name="case", commands="true", **options):
+        text = f"name: {name}\n"
+        text += "".join(f"{key}: {value}\n" for key, value in options.items())
+        return CaseParser.from_text(f"{text}$ {commands}\n").parse()
+
+    return make
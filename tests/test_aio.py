@@ -0,0 +1,52 @@
+import asyncio
+import subprocess
+import time
+
+import pytest
+
+from sh_doctest import aio
+from sh_doctest.capture import LineMatcher
+from sh_doctest.shell import OutputDiverged, ShellContext
+
+
+def run(script, **keys):
+    keys.setdefault("context", ShellContext("", ""))
+    return asyncio.run(aio.shell(script, **keys))
+
+
+def test_shell_runs_script():
+    result = run("echo 'Hello, World!'; echo oops >&2; exit 3")
+    assert result.stdout == "Hello, World!\n"
+    assert result.stderr == "oops\n"
+    assert result.returncode == 3
+    assert result.usage.duration > 0
+
+
+def test_shell_timeout_keeps_partial_output():
+    with pytest.raises(subprocess.TimeoutExpired) as exc:
+        run("echo partial; sleep 5", timeout=0.5)
+    assert exc.value.output == b"partial\n"
+
+
+def test_shell_diverged():
+    with pytest.raises(OutputDiverged) as exc:
+        run("echo one; echo three; sleep 5", watch=LineMatcher(["one", "two"]))
+    assert (exc.value.index, exc.value.line) == (1, "three")
+
+
+def test_shell_max_output():
+    result = run("seq 1000", max_output=10)
+    assert result.stdout == "1\n2\n3\n4\n5\n"
+    assert result.truncated == ("stdout",)
+
+
+def test_shell_runs_concurrently():
+    async def main():
+        context = ShellContext("", "")
+        scripts = (f"sleep 0.5; echo {i}" for i in range(20))
+        return await asyncio.gather(*(aio.shell(s, context=context) for s in scripts))
+
+    start = time.monotonic()
+    results = asyncio.run(main())
+    assert time.monotonic() - start < 5
+    assert [result.stdout for result in results] == [f"{i}\n" for i in range(20)]
@@ -0,0 +1,117 @@
+import os
+import time
+from unittest.mock import patch
+
+from sh_doctest.cache import ResultCache
+from sh_doctest.case import CaseRunner
+from sh_doctest.command_result import CommandResult
+from sh_doctest.line_block import LineBlock
+from sh_doctest.numbered_line import NumberedLine
+from sh_doctest.scratch import ScratchDirs
+from sh_doctest.shell import ShellContext
+
+
+def make_result(stdout="hi"):
+    return CommandResult(NumberedLine("0"), LineBlock.from_text(stdout), LineBlock())
+
+
+def test_key_depends_on_inputs(tmp_path, make_case):
+    cache = ResultCache(str(tmp_path / "cache"))
+    context = ShellContext("", "")
+    assert cache.key(make_case(), context) == cache.key(make_case(), context)
+    assert cache.key(make_case(), context) != cache.key(
+        make_case(commands="echo bye"), context
+    )
+    assert cache.key(make_case(), context) != cache.key(
+        make_case(), ShellContext("x", "")
+    )
+    data = tmp_path / "data"
+    data.write_text("one")
+    case = make_case(inputs=str(data))
+    first = cache.key(case, context)
+    data.write_text("two")
+    assert cache.key(case, context) != first
+
+
+def test_key_depends_on_options_and_scratch(tmp_path, make_case):
+    cache = ResultCache(str(tmp_path / "cache"))
+    context = ShellContext("", "")
+    plain = cache.key(make_case(), context)
+    assert cache.key(make_case(max_output="1K"), context) != plain
+    assert cache.key(make_case(), ShellContext("", "", max_output=10)) != plain
+    seed = tmp_path / "seed"
+    seed.mkdir()
+    (seed / "data").write_text("one")
+    context.scratch = ScratchDirs(root=str(tmp_path))
+    assert cache.key(make_case(), context) == plain
+    case = make_case(scratch="case", scratch_from=str(seed))
+    first = cache.key(case, context)
+    assert first != plain
+    (seed / "data").write_text("three")
+    assert cache.key(case, context) != first
+
+
+def test_cacheable_no(tmp_path, make_case):
+    cache = ResultCache(str(tmp_path))
+    assert cache.key(make_case(cacheable="no"), ShellContext()) is None
+
+
+def test_put_get_round_trip(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    result = make_result("line 1\n  line 2")
+    cache.put("ab" * 32, result)
+    cached = cache.get("ab" * 32)
+    assert cached.exit_code == result.exit_code
+    assert cached.stdout == result.stdout
+    assert cache.get("cd" * 32) is None
+    assert ResultCache(str(tmp_path), refresh=True).get("ab" * 32) is None
+
+
+def test_expired_entries_ignored_and_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path), max_age=60)
+    cache.put("ab" * 32, make_result())
+    old = time.time() - 120
+    os.utime(cache.path("ab" * 32), (old, old))
+    assert cache.get("ab" * 32) is None
+    cache.evict()
+    assert not os.path.exists(cache.path("ab" * 32))
+
+
+def test_evict_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    keys = [str(i) * 64 for i in range(3)]
+    for age, key in enumerate(reversed(keys)):
+        cache.put(key, make_result())
+        stamp = time.time() - 10 * age
+        os.utime(cache.path(key), (stamp, stamp))
+    cache.max_bytes = os.path.getsize(cache.path(keys[0])) * 2
+    cache.evict()
+    assert [os.path.exists(cache.path(key)) for key in keys] == [False, True, True]
+
+
+@patch("sh_doctest.case.shell.shell")
+def test_runner_uses_cache(mock_shell, tmp_path, make_case):
+    context = ShellContext("", "")
+    context.cache = ResultCache(str(tmp_path))
+    mock_shell.return_value.returncode = 0
+    mock_shell.return_value.stdout = "hi\n"
+    mock_shell.return_value.stderr = ""
+    CaseRunner(make_case(), context).run()
+    case = make_case()
+    CaseRunner(case, context).run()
+    assert mock_shell.call_count == 1
+    assert case.result.stdout == LineBlock(["hi"])
+
+
+@patch("sh_doctest.case.shell.shell")
+def test_runner_uses_cached_empty_result(mock_shell, tmp_path, make_case):
+    context = ShellContext("", "")
+    context.cache = ResultCache(str(tmp_path))
+    mock_shell.return_value.returncode = 0
+    mock_shell.return_value.stdout = ""
+    mock_shell.return_value.stderr = ""
+    CaseRunner(make_case(), context).run()
+    case = make_case()
+    CaseRunner(case, context).run()
+    assert mock_shell.call_count == 1
+    assert not case.result and case.result.exit_code == "0"
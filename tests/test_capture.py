@@ -0,0 +1,102 @@
+import subprocess
+import time
+
+import pytest
+
+from sh_doctest.capture import Capture, LineMatcher, parse_size
+from sh_doctest.case import CaseParser
+from sh_doctest.shell import OutputDiverged, ShellContext, decode_output, shell
+
+
+def test_parse_size():
+    assert parse_size("4096") == 4096
+    assert parse_size("64K") == 65536
+    assert parse_size("10 MiB") == 10 * 2**20
+    assert parse_size("1g") == 2**30
+    with pytest.raises(ValueError):
+        parse_size("lots")
+
+
+def test_capture_in_memory():
+    capture = Capture()
+    capture.extend(b"hello ")
+    capture.extend(b"world\r\n")
+    assert capture.file is None
+    assert capture.getvalue() == b"hello world\r\n"
+    assert capture.decode(decode_output) == "hello world\n"
+    assert not capture.truncated
+
+
+def test_capture_spills_to_disk():
+    capture = Capture(spill=10)
+    capture.extend(b"0123456789")
+    assert capture.file is None
+    capture.extend(b"abc")
+    capture.extend(b"def")
+    assert capture.file is not None
+    assert not capture.buffer
+    assert capture.getvalue() == b"0123456789abcdef"
+    assert capture.decode(decode_output) == "0123456789abcdef"
+    capture.close()
+
+
+def test_capture_limit():
+    capture = Capture(limit=8, spill=4)
+    for chunk in (b"abc", b"defgh", b"ijk", b"lmn"):
+        capture.extend(chunk)
+    assert capture.truncated
+    assert capture.size == 8
+    assert capture.getvalue() == b"abcdefgh"
+    capture.close()
+
+
+def test_shell_spills_large_output(monkeypatch):
+    monkeypatch.setattr("sh_doctest.capture.SPILL_THRESHOLD", 4096)
+    result = shell("seq 100000", context=ShellContext("", ""))
+    assert result.stdout == "".join(f"{i}\n" for i in range(1, 100001))
+    assert result.truncated == ()
+    result = shell("seq 100000; seq 3 >&2", context=ShellContext("", ""), max_output=10)
+    assert result.stdout == "1\n2\n3\n4\n5\n"
+    assert result.stderr == "1\n2\n3\n"
+    assert result.truncated == ("stdout",)
+
+
+def test_case_output_bounded_by_default(monkeypatch):
+    monkeypatch.setattr("sh_doctest.capture.SPILL_THRESHOLD", 4096)
+    monkeypatch.setattr("sh_doctest.capture.DEFAULT_MAX_OUTPUT", 8192)
+    case = CaseParser.from_text("name: big\n$ seq 100000\n1\n").parse()
+    assert case.run_and_check(report=False, context=ShellContext("", ""))
+    assert case.result.truncated == ("stdout",)
+    assert len("\n".join(case.result.stdout.str_list())) <= 8192
+    assert "truncated" in case.comparison["stdout"]
+
+
+def feed(expected, *chunks):
+    matcher = LineMatcher(expected)
+    for chunk in chunks:
+        matcher.feed(chunk)
+    return matcher.divergence
+
+
+def test_line_matcher():
+    assert feed(["a", "b"], b"\n  a\nb", b"  \n\n") is None
+    assert feed(["a", "b"], b"a\r\n", b"b\r\n") is None
+    assert feed(["a", "b"], b"a\nc\n") == (1, "c")
+    assert feed(["a", "b"], b"a\n\nb\n") == (1, "")
+    assert feed(["a"], b"a\nb\n") == (1, "b")
+    assert feed([], b"x\n") == (0, "x")
+    assert feed(["a", "b"], b"a\vc\n") is None  # not comparable line by line
+
+
+def test_shell_stops_on_divergence():
+    start = time.monotonic()
+    with pytest.raises(OutputDiverged) as exc:
+        shell(
+            "echo a; echo b; sleep 5",
+            context=ShellContext("", ""),
+            watch=LineMatcher(["a", "c"]),
+        )
+    assert time.monotonic() - start < 4
+    assert (exc.value.index, exc.value.line) == (1, "b")
+    assert exc.value.output == b"a\nb\n"
+    assert isinstance(exc.value, subprocess.SubprocessError)
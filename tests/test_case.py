@@ -1,9 +1,12 @@
 import unittest
 from unittest.mock import patch, Mock
 from sh_doctest.case import Case, CaseParser, CaseRunner, CaseChecker
+from sh_doctest.case import bounded_diff, truncate_lines
 from sh_doctest.numbered_line import NumberedLine
 from sh_doctest.line_block import LineBlock
 from sh_doctest.command_result import CommandResult
+from sh_doctest.shell import ShellContext
+from sh_doctest.capture import DEFAULT_MAX_OUTPUT
 
 
 class TestCase(unittest.TestCase):
@@ -75,16 +78,14 @@ class TestCase(unittest.TestCase):
 
 class TestCaseParser(unittest.TestCase):
     def test_parse(self):
-        lines = LineBlock.from_text(
-            """
+        lines = LineBlock.from_text("""
 This is a test case.
 
 name: Test Case
 run_as: root
 $ echo 'Hello, World!'
 Hello, World!
-"""
-        )
+""")
         parser = CaseParser(lines)
         case = parser.parse()
 
@@ -96,6 +97,63 @@ Hello, World!
         self.assertEqual(case.expected.stdout, LineBlock(["Hello, World!"]))
         self.assertEqual(case.expected.stderr, LineBlock())
 
+    def test_parse_options(self):
+        parser = CaseParser.from_text("""
+name: second
+group: users
+depends: first
+$ echo hi
+hi
+""")
+        case = parser.parse()
+        self.assertEqual(case.option("group"), "users")
+        self.assertEqual(case.option("depends"), "first")
+        self.assertEqual(case.option("missing", "default"), "default")
+        self.assertEqual(case.expected.stdout, LineBlock(["hi"]))
+
+    def test_options_only_in_header(self):
+        parser = CaseParser.from_text("""
+timeout: is narrative here
+name: config
+$ printf 'timeout: 5\\ngroup: db\\n'; printf 'scratch: x\\n' >&2
+timeout: 5
+group: db
+!!
+scratch: x
+""")
+        case = parser.parse()
+        self.assertTrue(parser.at_end())
+        self.assertEqual(case.options, {})
+        self.assertEqual(case.narrative, LineBlock(["timeout: is narrative here"]))
+        self.assertEqual(case.expected.stdout, LineBlock(["timeout: 5", "group: db"]))
+        self.assertEqual(case.expected.stderr, LineBlock(["scratch: x"]))
+        case.expected.exit_code = NumberedLine("0")
+        self.assertFalse(case.run_and_check(report=False, context=ShellContext("", "")))
+
+    def test_parse_scales_linearly(self):
+        def count_lines_built(n_cases):
+            text = "\n\n".join(
+                f"Narrative {i}\nname: case {i}\n$ echo {i}\n{i}"
+                for i in range(n_cases)
+            )
+            parser = CaseParser.from_text(text)
+            original_init = NumberedLine.__init__
+            built = 0
+
+            def counting_init(self, *args, **keys):
+                nonlocal built
+                built += 1
+                original_init(self, *args, **keys)
+
+            with patch.object(NumberedLine, "__init__", counting_init):
+                while not parser.at_end():
+                    parser.parse()
+            return built
+
+        small, large = count_lines_built(100), count_lines_built(800)
+        # Quadratic parsing would build ~64x as many lines for 8x the input.
+        self.assertLess(large / small, 10)
+
 
 class TestCaseRunner(unittest.TestCase):
     @patch("sh_doctest.case.shell.shell")
@@ -113,11 +171,47 @@ class TestCaseRunner(unittest.TestCase):
         runner = CaseRunner(case)
         runner.run()
 
-        mock_shell.assert_called_once_with("echo 'Hello, World!'", run_as="root")
+        mock_shell.assert_called_once_with(
+            "echo 'Hello, World!'",
+            cwd=".",
+            timeout=10,
+            run_as="root",
+            context=None,
+            max_output=DEFAULT_MAX_OUTPUT,
+            watch=None,
+        )
         self.assertEqual(case.result.exit_code, NumberedLine("0", -1))
         self.assertEqual(case.result.stdout, LineBlock(["Hello, World!"]))
         self.assertEqual(case.result.stderr, LineBlock())
 
+    def test_timeout_keeps_partial_output(self):
+        case = Case()
+        case.commands = LineBlock(["echo partial; echo oops >&2; sleep 5"])
+        case.options["timeout"] = NumberedLine("0.5", 1)
+        context = ShellContext("", "", timeout=60)
+        runner = CaseRunner(case, context)
+        self.assertEqual(runner.timeout(), 0.5)
+        runner.run()
+        self.assertEqual(case.result.exit_code, NumberedLine("timeout", -1))
+        self.assertEqual(case.result.stdout, LineBlock(["partial"]))
+        self.assertEqual(case.result.stderr, LineBlock(["oops"]))
+        del case.options["timeout"]
+        self.assertEqual(runner.timeout(), 60)
+
+    def test_max_output_truncates_and_flags(self):
+        case = Case()
+        case.commands = LineBlock(["seq 1000"])
+        case.options["max_output"] = NumberedLine("1K", 1)
+        case.expected.stdout = LineBlock.from_text("\n".join(map(str, range(1, 1001))))
+        CaseRunner(case, ShellContext("", "")).run()
+        self.assertEqual(case.result.truncated, ("stdout",))
+        self.assertEqual(
+            len(str(case.result.stdout)), 1023
+        )  # trailing newline stripped
+        self.assertTrue(CaseChecker(case).check())
+        self.assertTrue(case.comparison["stdout"].startswith("Output exceeded"))
+        self.assertEqual(case.comparison["stderr"], "Passed")
+
 
 class TestCaseChecker(unittest.TestCase):
     def test_check_exit_code(self):
@@ -168,6 +262,35 @@ class TestCaseChecker(unittest.TestCase):
             expected_diff,
         )
 
+    @patch("sh_doctest.case.difflib.unified_diff")
+    def test_check_pattern_equal_skips_diff(self, mock_diff):
+        checker = CaseChecker(Case())
+        block = LineBlock.from_text("one\ntwo")
+        self.assertEqual(
+            checker.check_pattern(NumberedLine("0"), block, LineBlock(["one", "two"])),
+            "Passed",
+        )
+        mock_diff.assert_not_called()
+
+    def test_bounded_diff_offsets(self):
+        expected = [f"line {i}" for i in range(100)]
+        result = list(expected)
+        result[50] = "changed"
+        diff = bounded_diff(expected, result).split("\n")
+        self.assertEqual(diff[4], "@@ -48,7 +48,7 @@")
+        self.assertEqual(diff[9:11], ["-line 50", "+changed"])
+
+    def test_bounded_diff_limits(self):
+        expected = [f"line {i}" for i in range(3000)]
+        result = [f"other {i}" for i in range(3000)]
+        diff = bounded_diff(expected, result, max_lines=10).split("\n")
+        self.assertEqual(diff[4], "@@ -1,3000 +1,3000 @@")
+        self.assertEqual(diff[-1], "... diff truncated after 10 lines")
+
+    def test_truncate_lines(self):
+        self.assertEqual(truncate_lines("a\nb", 2), "a\nb")
+        self.assertEqual(truncate_lines("a\nb\nc\nd", 2), "a\nb\n... 2 more lines")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,7 +1,7 @@
 import unittest
 from unittest.mock import Mock, patch
 
-from sh_doctest.command_result import CommandResult
+from sh_doctest.command_result import CommandResult, ResourceUsage
 from sh_doctest.numbered_line import NumberedLine
 from sh_doctest.line_block import LineBlock
 
@@ -60,3 +60,23 @@ class TestCommandResult(unittest.TestCase):
         self.assertEqual(cmd_result.exit_code, NumberedLine("1"))
         self.assertEqual(cmd_result.stdout, LineBlock.from_text("stdout text"))
         self.assertEqual(cmd_result.stderr, LineBlock.from_text("stderr text"))
+
+    def test_usage_to_simpl(self):
+        usage = ResourceUsage(1.5, 0.25, None, 2048)
+        self.assertEqual(
+            usage.to_simpl(), {"duration": 1.5, "user_time": 0.25, "max_rss_kib": 2048}
+        )
+        cmd_result = CommandResult(NumberedLine("0"), ["out"], [], usage)
+        self.assertEqual(cmd_result.to_simpl()[-1], {"usage": usage.to_simpl()})
+        self.assertIsNone(
+            CommandResult.from_completed_process(Mock(stdout="", stderr="")).usage
+        )
+
+    def test_usage_case_rss(self):
+        self.assertEqual(ResourceUsage(1.0, max_rss=300, shared_rss=200).case_rss, 300)
+        self.assertIsNone(ResourceUsage(1.0, max_rss=200, shared_rss=200).case_rss)
+        self.assertIsNone(ResourceUsage(1.0, max_rss=300).case_rss)
+
+    def test_usage_cpu_time(self):
+        self.assertEqual(ResourceUsage(1.0, 0.25, 0.5).cpu_time, 0.75)
+        self.assertIsNone(ResourceUsage(1.0, 0.25).cpu_time)
@@ -0,0 +1,57 @@
+import pytest
+
+from sh_doctest.case import CaseParser
+from sh_doctest.fixtures import FixtureError, capture_state, session_state
+from sh_doctest.shell import ShellContext, shell
+from sh_doctest.spec import Spec
+
+
+def parse_fixture(commands):
+    return CaseParser.from_text(f"name: setup\n{commands}\n").parse()
+
+
+def test_capture_state():
+    context = ShellContext("", "")
+    fixture = parse_fixture(
+        "$ export GREETING='hello there'\n"
+        '$ greet () { echo "$GREETING $1"; }\n'
+        "$ umask 0077\n"
+        "$ echo ignored"
+    )
+    context.spec_state = capture_state(fixture, context)
+    assert "ignored" not in context.spec_state
+    assert "PWD" not in context.spec_state
+    result = shell("greet world; umask", context=context)
+    assert result.stdout == "hello there world\n0077\n"
+
+
+def test_capture_state_failure():
+    with pytest.raises(FixtureError, match="exit code 3"):
+        capture_state(parse_fixture("$ exit 3"), ShellContext("", ""))
+
+
+def test_session_state_runs_once(tmp_path):
+    context = ShellContext("", "")
+    context.session_dir = str(tmp_path)
+    log = tmp_path / "ran"
+    fixture = parse_fixture(f"$ echo ran >> {log}\n$ export SESSION=1")
+    first = session_state(fixture, context)
+    assert session_state(fixture, context.copy()) == first
+    assert log.read_text() == "ran\n"
+
+
+def test_spec_runs_setup_and_teardown_once(tmp_path):
+    log = tmp_path / "log"
+    spec_path = tmp_path / "spec.txt"
+    spec_path.write_text(
+        f"name: setup\n$ echo setup >> {log}\n$ export VALUE=42\n\n"
+        f"name: teardown\n$ echo teardown >> {log}\n\n"
+        "name: one\n$ echo $VALUE\n42\n\n"
+        "name: two\n$ echo $VALUE\n42\n"
+    )
+    spec = Spec(str(spec_path), context=ShellContext("", ""))
+    spec.parse()
+    assert [str(case.name) for case in spec.test_cases] == ["one", "two"]
+    assert spec.run_and_check() == 0
+    assert log.read_text() == "setup\nteardown\n"
+    assert spec.context.spec_state == ""
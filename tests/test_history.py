@@ -0,0 +1,42 @@
+from sh_doctest.case import CaseParser
+from sh_doctest.history import RunHistory, case_key, load_durations, save_durations
+from sh_doctest.spec import Spec
+
+
+def test_case_key_tracks_commands():
+    first = CaseParser.from_text("name: one\n$ echo 1\n1\n").parse()
+    edited = CaseParser.from_text("name: one\n$ echo 2\n2\n").parse()
+    assert case_key("spec.txt", first).startswith("spec.txt::one::")
+    assert case_key("spec.txt", first) != case_key("spec.txt", edited)
+
+
+def test_case_key_distinguishes_duplicates():
+    spec = Spec("spec.txt")
+    spec.parse("name: same\n$ true\n\nname: same\n$ true\n\nname: other\n$ true\n")
+    keys = [case_key("spec.txt", case) for case in spec.test_cases]
+    assert len(set(keys)) == 3
+    assert keys[0] == case_key(
+        "spec.txt", CaseParser.from_text("name: same\n$ true\n").parse()
+    )
+
+
+def test_save_and_load_durations(tmp_path):
+    first, second = str(tmp_path / "1.json"), str(tmp_path / "2.json")
+    save_durations(first, {"a": 1.0, "b": 2.0})
+    save_durations(second, {"b": 3.0})
+    missing = str(tmp_path / "missing.json")
+    assert load_durations([first, second, missing]) == {"a": 1.0, "b": 3.0}
+
+
+def test_run_history(tmp_path):
+    path = str(tmp_path / "history.json")
+    history = RunHistory.load(path)
+    for duration in range(1, RunHistory.KEEP + 3):
+        history.record("a", False, float(duration))
+    history.record("b", True)
+    history.save()
+    history = RunHistory.load(path)
+    assert history.duration("a") == sum(range(3, RunHistory.KEEP + 3)) / RunHistory.KEEP
+    assert history.duration("b") is None
+    assert history.failed("b") and not history.failed("a")
+    assert load_durations([path]) == {"a": history.duration("a")}
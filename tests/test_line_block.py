@@ -119,3 +119,38 @@ class TestLineBlock:
         block = LineBlock(lines)
         expected = ["line1", "line2"]
         assert block.str_list() == expected
+
+    def test_from_text_slice_is_view(self):
+        block = LineBlock.from_text("a\nb\nc\nd")
+        view = block[1:3]
+        assert view == LineBlock(["b", "c"])
+        assert [line.lineno for line in view] == [1, 2]
+        assert view[-1] == NumberedLine("c", 2)
+        assert view._text is block._text
+        assert block[3:1] == LineBlock()
+
+    def test_from_text_pop_ends(self):
+        block = LineBlock.from_text("a\nb\nc")
+        assert block.pop(0) == NumberedLine("a", 0)
+        assert block.pop() == NumberedLine("c", 2)
+        assert block.lines == [NumberedLine("b", 1)]
+
+    def test_from_text_line_breaks(self):
+        block = LineBlock.from_text("a\r\nb\rc\x0cd  \n\ne")
+        assert block.str_list() == ["a", "b", "c", "d  ", "", "e"]
+
+    def test_from_text_append_converts_to_list(self):
+        block = LineBlock.from_text("a\nb")
+        block.append(NumberedLine("c", 2))
+        assert block == LineBlock(["a", "b", "c"])
+        assert block.pop(1) == NumberedLine("b", 1)
+        assert block.str_list() == ["a", "c"]
+
+    def test_getitem_out_of_range(self):
+        block = LineBlock.from_text("a")
+        try:
+            block[1]
+        except IndexError:
+            pass
+        else:
+            assert False, "Should have raised IndexError"
@@ -0,0 +1,190 @@
+import json
+import re
+
+from sh_doctest.command_result import ResourceUsage
+from sh_doctest.history import RunHistory
+from sh_doctest.log import log
+from sh_doctest.main import ShDoctest, SpecSummary
+
+SPEC = """
+name: header
+$ greet () { echo "hello $1"; }
+
+name: {name}
+$ greet {name}
+hello {name}
+"""
+
+
+def write_specs(tmp_path, names):
+    paths = []
+    for name in names:
+        path = tmp_path / f"{name}.txt"
+        path.write_text(SPEC.replace("{name}", name))
+        paths.append(str(path))
+    return paths
+
+
+def test_summary_merge():
+    totals = SpecSummary()
+    for count in range(1, 4):
+        summary = SpecSummary(spec_count=1)
+        summary.test_count = count
+        summary.failures = count % 2
+        totals.merge(summary)
+    assert totals.spec_count == 3
+    assert totals.test_count == 6
+    assert totals.failures == 2
+
+
+def test_log_top_ranks_time_cpu_and_memory(monkeypatch):
+    summary = SpecSummary()
+    summary.usages = [
+        ("fast busy", ResourceUsage(1.0, 2.0, 1.0, 30000, 50000)),
+        ("slow idle", ResourceUsage(5.0, 0.1, 0.1, 90000, 50000)),
+        ("big", ResourceUsage(0.5, 0.1, 0.1, 900000, 50000)),
+        ("unmeasured", ResourceUsage(3.0)),
+    ]
+    messages = []
+    monkeypatch.setattr(log, "info", lambda *args: messages.append(" ".join(args)))
+    summary.log_top(2)
+    slowest, busiest, largest = messages
+    assert slowest.index("slow idle") < slowest.index("unmeasured")
+    assert "fast busy" not in slowest
+    assert busiest.index("fast busy") < busiest.index("slow idle")
+    assert "unmeasured" not in busiest
+    assert largest.index("big") < largest.index("slow idle")
+    assert "fast busy" not in largest and "unmeasured" not in largest
+
+
+def test_usage_labels_name_the_source_spec(tmp_path):
+    paths = write_specs(tmp_path, ["one"])
+    totals = ShDoctest(paths + ["-o", str(tmp_path)]).process_specs()
+    assert totals.usages
+    for label, _ in totals.usages:
+        assert label.startswith(f"{paths[0]}:")
+
+
+def test_main_sequential(tmp_path):
+    paths = write_specs(tmp_path, ["one", "two"])
+    assert ShDoctest(paths + ["-o", str(tmp_path)]).main() == 0
+
+
+def test_main_spec_jobs_aggregates(tmp_path):
+    paths = write_specs(tmp_path, ["one", "two", "three"])
+    tester = ShDoctest(paths + ["-o", str(tmp_path), "--spec-jobs", "2"])
+    totals = tester.process_specs_concurrently()
+    assert totals.spec_count == 3
+    assert totals.test_count == 3
+    assert totals.failures == 0
+
+
+def test_expanded_written_only_when_kept(tmp_path):
+    paths = write_specs(tmp_path, ["one"])
+    expanded = tmp_path / "one.txt.expanded"
+    assert ShDoctest(paths + ["-o", str(tmp_path)]).main() == 0
+    assert not expanded.exists()
+    assert ShDoctest(paths + ["-o", str(tmp_path), "--keep-expanded"]).main() == 0
+    assert "greet one" in expanded.read_text()
+
+
+def without_usage(yaml_text):
+    """Drop the timings,  which differ from run to run."""
+    return re.sub(r"\n *- usage:\n(?: {8}.*\n)*", "\n", yaml_text)
+
+
+def test_stream_matches_batch(tmp_path):
+    paths = write_specs(tmp_path, ["one", "two"])
+    results = []
+    for extra in ([], ["--stream"]):
+        tester = ShDoctest(paths + ["-o", str(tmp_path), "--save-results"] + extra)
+        totals = tester.process_specs()
+        results.append(
+            (
+                totals.test_count,
+                totals.failures,
+                without_usage((tmp_path / "two.txt.yaml").read_text()),
+            )
+        )
+    assert results[0] == results[1]
+    assert results[0][0] == 2
+
+
+def test_shards_reproduce_single_node_totals(tmp_path):
+    paths = write_specs(tmp_path, ["one", "two", "three"])
+    summaries = []
+    for index in (1, 2):
+        summary = str(tmp_path / f"shard{index}.json")
+        tester = ShDoctest(
+            paths
+            + ["-o", str(tmp_path), "--shard", f"{index}/2", "--summary-json", summary]
+        )
+        assert tester.main() == 0
+        summaries.append(summary)
+    assert len(tester.shard_keys) == 1
+    merger = ShDoctest(["--merge-summaries"] + summaries)
+    assert merger.main() == 0
+    single = ShDoctest(paths + ["-o", str(tmp_path)]).process_specs()
+    totals = SpecSummary()
+    for path in summaries:
+        with open(path) as summary_file:
+            totals.merge_shard(SpecSummary.from_simpl(json.load(summary_file)))
+    assert totals.to_simpl() == single.to_simpl()
+
+
+def test_shards_split_duplicate_cases(tmp_path):
+    spec = tmp_path / "dups.txt"
+    spec.write_text("".join("name: same\n$ true\n\n" for _ in range(4)))
+    counts = []
+    for index in (1, 2):
+        summary = tmp_path / f"dups{index}.json"
+        tester = ShDoctest(
+            [str(spec), "-o", str(tmp_path), "--shard", f"{index}/2"]
+            + ["--summary-json", str(summary)]
+        )
+        assert tester.main() == 0
+        counts.append(json.loads(summary.read_text())["test_count"])
+    assert counts == [2, 2]
+
+
+def test_plain_and_line_selectors_are_separate_entries(tmp_path):
+    spec = tmp_path / "spec.txt"
+    spec.write_text("name: one\n$ echo 1\n1\n\nname: two\n$ echo 2\n2\n")
+    for argv, expected in (
+        ([str(spec), f"{spec}:1"], 3),
+        ([f"{spec}:1", str(spec)], 3),
+        ([str(spec), str(spec)], 4),
+        ([f"{spec}:1", f"{spec}:5"], 2),
+    ):
+        totals = ShDoctest(argv + ["-o", str(tmp_path)]).process_specs()
+        assert (totals.spec_count, totals.test_count) == (2, expected)
+
+
+def test_last_failed_runs_failures_and_their_dependencies(tmp_path):
+    spec = tmp_path / "spec.txt"
+    spec.write_text(
+        "name: first\n$ echo one\none\n\n"
+        "name: prep\ngroup: g\n$ echo prep\nprep\n\n"
+        "name: broken\ngroup: g\n$ echo no\nyes\n"
+    )
+    args = [str(spec), "-o", str(tmp_path), "--history", str(tmp_path / "h.json")]
+    assert ShDoctest(args).main() == 1
+    tester = ShDoctest(args + ["--last-failed"])
+    tester.history = RunHistory.load(str(tmp_path / "h.json"))
+    tester.failed_keys = tester.history.failed_keys()
+    totals = tester.process_specs()
+    assert (totals.test_count, totals.skipped, totals.failures) == (2, 1, 1)
+
+
+def test_last_failed_ignores_and_forgets_edited_cases(tmp_path):
+    spec = tmp_path / "spec.txt"
+    spec.write_text("name: a\n$ echo a\na\n\nname: b\n$ echo no\nyes\n")
+    history = str(tmp_path / "h.json")
+    args = [str(spec), "-o", str(tmp_path), "--history", history, "--last-failed"]
+    assert ShDoctest(args).main() == 1
+    spec.write_text("name: a\n$ echo a\na\n\nname: b\n$ echo yes\nyes\n")
+    tester = ShDoctest(args)
+    assert tester.main() == 0
+    assert tester.failed_keys is None
+    assert not RunHistory.load(history).failed_keys()
+    assert len(RunHistory.load(history).entries) == 2
@@ -81,6 +81,10 @@ class TestNumberedLine(unittest.TestCase):
         self.assertFalse(line.endswith("He"))
         self.assertTrue(line.endswith(("ld", "He")))
 
+    def test_slots(self):
+        line = NumberedLine("Hello", 1)
+        self.assertFalse(hasattr(line, "__dict__"))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,64 @@
+from unittest.mock import patch
+
+from sh_doctest.main import ShDoctest
+from sh_doctest.parse_cache import ParseCache, ParsedSpec
+
+SPEC = """
+name: header
+$ greet () { echo "hello $1"; }
+
+template: greeting
+var: who
+name: greet <who>
+$ greet <who>
+hello <who>
+end_template: greeting
+
+expand: greeting
+let: who world
+"""
+
+
+def run(tmp_path, spec, *extra):
+    argv = [str(spec), "-o", str(tmp_path), "--parse-cache", str(tmp_path / "cache")]
+    return ShDoctest(argv + list(extra)).main()
+
+
+def test_get_checks_digest(tmp_path):
+    spec = tmp_path / "spec.txt"
+    spec.write_text(SPEC)
+    cache = ParseCache(str(tmp_path / "cache"))
+    digest = cache.digest(str(spec))
+    assert cache.get(str(spec), digest) is None
+    cache.put(str(spec), digest, ParsedSpec("text", 1, 2, [], "header", None))
+    parsed = cache.get(str(spec), digest)
+    assert (parsed.text, parsed.expansion_count, parsed.header) == ("text", 2, "header")
+    spec.write_text(SPEC + "\n")
+    assert cache.get(str(spec), cache.digest(str(spec))) is None
+
+
+def test_unreadable_entry_ignored(tmp_path):
+    spec = tmp_path / "spec.txt"
+    spec.write_text(SPEC)
+    cache = ParseCache(str(tmp_path))
+    with open(cache.path(str(spec)), "wb") as entry:
+        entry.write(b"not a pickle")
+    assert cache.get(str(spec), cache.digest(str(spec))) is None
+
+
+def test_hit_skips_expansion(tmp_path):
+    spec = tmp_path / "spec.txt"
+    spec.write_text(SPEC)
+    assert run(tmp_path, spec) == 0
+    with patch.object(ShDoctest, "expand_templates") as expand:
+        assert run(tmp_path, spec, "--keep-expanded") == 0
+        expand.assert_not_called()
+    assert "greet world" in (tmp_path / "spec.txt.expanded").read_text()
+
+
+def test_edit_invalidates(tmp_path):
+    spec = tmp_path / "spec.txt"
+    spec.write_text(SPEC)
+    assert run(tmp_path, spec) == 0
+    spec.write_text(SPEC.replace("hello <who>", "goodbye <who>"))
+    assert run(tmp_path, spec) == 1
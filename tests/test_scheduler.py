@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from sh_doctest.case import Case
+from sh_doctest.scheduler import AsyncScheduler, CaseGraph, Scheduler, split_names
+from sh_doctest.shell import ShellContext
+
+
+def test_split_names():
+    assert split_names(" a, b ,,c") == ["a", "b", "c"]
+
+
+def test_graph_defaults_to_serial(make_case):
+    graph = CaseGraph([make_case("a"), make_case("b"), make_case("c")])
+    assert graph.dependencies == [set(), {0}, {1}]
+
+
+def test_graph_groups_and_depends(make_case):
+    cases = [
+        make_case("setup"),
+        make_case("a1", group="a"),
+        make_case("b1", group="b"),
+        make_case("a2", group="a"),
+        make_case("join", depends="a, b1"),
+        make_case("final"),
+    ]
+    graph = CaseGraph(cases)
+    assert graph.dependencies == [
+        set(),
+        {0},
+        {0},
+        {0, 1},
+        {0, 1, 3, 2},
+        {0, 1, 2, 3, 4},
+    ]
+    assert graph.dependents()[0] == [1, 2, 3, 4, 5]
+
+
+def test_graph_unknown_dependency(make_case):
+    with pytest.raises(ValueError):
+        CaseGraph([make_case("a", depends="missing")])
+
+
+def test_scheduler_runs_groups_concurrently(monkeypatch, make_case):
+    cases = [make_case(f"c{i}", group=f"g{i}") for i in range(4)]
+    active = []
+    peak = [0]
+    lock = threading.Lock()
+
+    def run_and_check(self, report=True, context=None):
+        with lock:
+            active.append(self)
+            peak[0] = max(peak[0], len(active))
+        time.sleep(0.1)
+        with lock:
+            active.remove(self)
+        return False
+
+    monkeypatch.setattr(Case, "run_and_check", run_and_check)
+    assert Scheduler(cases, jobs=4).run() == 0
+    assert peak[0] > 1
+
+
+def test_scheduler_reports_in_spec_order(monkeypatch, make_case):
+    cases = [make_case(f"c{i}", group=f"g{i}") for i in range(3)]
+    reported = []
+
+    def run_and_check(self, report=True, context=None):
+        time.sleep(0.05 * (3 - int(str(self.name)[1:])))
+        return True
+
+    monkeypatch.setattr(Case, "run_and_check", run_and_check)
+    monkeypatch.setattr(
+        Case, "report_failure", lambda self: reported.append(str(self.name))
+    )
+    assert Scheduler(cases, jobs=3).run() == 3
+    assert reported == ["c0", "c1", "c2"]
+
+
+def test_scheduler_exit_first_failure_cancels_pending(monkeypatch, make_case):
+    cases = [make_case("first"), make_case("second"), make_case("third")]
+    ran = []
+
+    def run_and_check(self, report=True, context=None):
+        ran.append(str(self.name))
+        return True
+
+    monkeypatch.setattr(Case, "run_and_check", run_and_check)
+    monkeypatch.setattr(Case, "report_failure", lambda self: None)
+    assert Scheduler(cases, jobs=2, exit_first_failure=True).run() == 1
+    assert ran == ["first"]
+
+
+def test_async_scheduler_limits_concurrency(monkeypatch, make_case):
+    cases = [make_case(f"c{i}", group=f"g{i}") for i in range(6)]
+    active = []
+    peak = [0]
+
+    async def run_and_check_async(self, report=True, context=None):
+        active.append(self)
+        peak[0] = max(peak[0], len(active))
+        await asyncio.sleep(0.05 * (6 - int(str(self.name)[1:])))
+        active.remove(self)
+        return True
+
+    reported = []
+    monkeypatch.setattr(Case, "run_and_check_async", run_and_check_async)
+    monkeypatch.setattr(
+        Case, "report_failure", lambda self: reported.append(str(self.name))
+    )
+    assert AsyncScheduler(cases, jobs=3).run() == 6
+    assert peak[0] == 3
+    assert reported == [f"c{i}" for i in range(6)]
+
+
+def test_async_scheduler_exit_first_failure_cancels_pending(monkeypatch, make_case):
+    cases = [make_case("first", group="a"), make_case("second", group="b")]
+    ran = []
+
+    async def run_and_check_async(self, report=True, context=None):
+        ran.append(str(self.name))
+        return True
+
+    monkeypatch.setattr(Case, "run_and_check_async", run_and_check_async)
+    monkeypatch.setattr(Case, "report_failure", lambda self: None)
+    assert AsyncScheduler(cases, jobs=1, exit_first_failure=True).run() == 1
+    assert ran == ["first"]
+
+
+@pytest.mark.parametrize(
+    "scheduler, engine",
+    [
+        (Scheduler, "subprocess"),
+        (Scheduler, "worker"),
+        (AsyncScheduler, "asyncio"),
+    ],
+)
+def test_exit_first_failure_interrupts_running_cases(scheduler, engine, make_case):
+    cases = [
+        make_case("slow", "sleep 30", group="a"),
+        make_case("fails", "sleep 0.2; echo unexpected", group="b"),
+    ]
+    context = ShellContext(engine=engine, timeout=60)
+    start = time.monotonic()
+    runner = scheduler(cases, jobs=2, exit_first_failure=True, context=context)
+    assert runner.run() == 1
+    assert time.monotonic() - start < 10
+    assert list(runner.outcomes) == [1]
+
+
+def test_scheduler_order_key_starts_ranked_cases_first(monkeypatch, make_case):
+    cases = [make_case(f"c{i}", group=f"g{i}") for i in range(4)]
+    started = []
+
+    def run_and_check(self, report=True, context=None):
+        started.append(str(self.name))
+        return str(self.name) == "c1"
+
+    reported = []
+    monkeypatch.setattr(Case, "run_and_check", run_and_check)
+    monkeypatch.setattr(
+        Case, "report_failure", lambda self: reported.append(str(self.name))
+    )
+    ranks = {"c2": 0, "c0": 1}
+    scheduler = Scheduler(
+        cases, jobs=1, order_key=lambda case: ranks.get(str(case.name), 2)
+    )
+    assert scheduler.run() == 1
+    assert started == ["c2", "c0", "c1", "c3"]
+    assert reported == ["c1"]
+
+
+def test_graph_requirements_follow_declared_dependencies(make_case):
+    cases = [
+        make_case("setup"),
+        make_case("a1", group="a"),
+        make_case("a2", group="a"),
+        make_case("b", depends="a2"),
+        make_case("c"),
+    ]
+    graph = CaseGraph(cases)
+    assert graph.requirements([3]) == {1, 2}
+    assert graph.requirements([4]) == set()
@@ -0,0 +1,114 @@
+import os
+import pickle
+
+import pytest
+
+from sh_doctest.case import CaseParser
+from sh_doctest.scratch import ScratchDirs, chown_tree, clone_tree
+from sh_doctest.shell import ShellContext
+from sh_doctest.spec import Spec
+
+
+def make_seed(tmp_path):
+    seed = tmp_path / "seed"
+    (seed / "sub").mkdir(parents=True)
+    (seed / "data.txt").write_text("hello\n")
+    (seed / "sub" / "run.sh").write_text("echo hi\n")
+    (seed / "sub" / "run.sh").chmod(0o755)
+    (seed / "link").symlink_to("data.txt")
+    return seed
+
+
+def parse_case(options=""):
+    return CaseParser.from_text(f"name: scratchy\n{options}$ pwd\n").parse()
+
+
+def test_clone_tree(tmp_path):
+    seed = make_seed(tmp_path)
+    target = tmp_path / "target"
+    target.mkdir()
+    clone_tree(str(seed), str(target))
+    assert (target / "data.txt").read_text() == "hello\n"
+    assert os.access(target / "sub" / "run.sh", os.X_OK)
+    assert os.readlink(target / "link") == "data.txt"
+    (target / "data.txt").write_text("changed\n")
+    assert (seed / "data.txt").read_text() == "hello\n"
+
+
+def test_clone_tree_link(tmp_path):
+    seed = make_seed(tmp_path)
+    target = tmp_path / "target"
+    target.mkdir()
+    clone_tree(str(seed), str(target), link=True)
+    assert os.path.samefile(target / "data.txt", seed / "data.txt")
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason="chown needs root")
+def test_chown_tree_spares_linked_files(tmp_path):
+    seed = make_seed(tmp_path)
+    target = tmp_path / "target"
+    target.mkdir()
+    clone_tree(str(seed), str(target), link=True)
+    (target / "new.txt").write_text("mine\n")
+    chown_tree(str(target), 12345, 12345)
+    assert (seed / "data.txt").stat().st_uid == os.geteuid()
+    assert (target / "new.txt").stat().st_uid == 12345
+    assert (target / "sub").stat().st_uid == 12345
+
+
+def test_acquire_release(tmp_path):
+    seed = make_seed(tmp_path)
+    scratch = ScratchDirs("case", str(tmp_path), str(seed))
+    case = parse_case()
+    first, second = scratch.acquire(case), scratch.acquire(case)
+    assert first != second
+    assert os.path.dirname(first) == str(tmp_path)
+    assert open(os.path.join(first, "data.txt")).read() == "hello\n"
+    scratch.release(first)
+    scratch.release(second)
+    scratch.release_groups()
+    assert not os.path.exists(first) and not os.path.exists(second)
+
+
+def test_acquire_none(tmp_path):
+    scratch = ScratchDirs(root=str(tmp_path))
+    assert scratch.acquire(parse_case()) is None
+    assert scratch.acquire(parse_case("scratch: case\n")) is not None
+
+
+def test_group_shares_directory(tmp_path):
+    scratch = ScratchDirs("group", str(tmp_path))
+    one = scratch.acquire(parse_case("group: db\n"))
+    two = scratch.acquire(parse_case("group: db\n"))
+    other = scratch.acquire(parse_case())
+    assert one == two != other
+    scratch.release(one)
+    assert os.path.isdir(one)
+    scratch.release_groups()
+    assert not os.path.exists(one)
+
+
+def test_pickle(tmp_path):
+    scratch = pickle.loads(pickle.dumps(ScratchDirs("case", str(tmp_path))))
+    path = scratch.acquire(parse_case())
+    scratch.release(path)
+    scratch.release_groups()
+    assert not os.listdir(tmp_path)
+
+
+def test_spec_runs_cases_in_scratch(tmp_path):
+    seed = make_seed(tmp_path)
+    root = tmp_path / "root"
+    root.mkdir()
+    spec_path = tmp_path / "spec.txt"
+    spec_path.write_text(
+        f"name: first\nscratch_from: {seed}\n$ cat data.txt; echo bye > data.txt\nhello\n\n"
+        f"name: second\nscratch_from: {seed}\n$ cat data.txt\nhello\n"
+    )
+    context = ShellContext()
+    context.scratch = ScratchDirs("case", str(root))
+    spec = Spec(str(spec_path), context=context)
+    spec.parse()
+    assert spec.run_and_check() == 0
+    assert not os.listdir(root)
+    assert (seed / "data.txt").read_text() == "hello\n"
@@ -0,0 +1,54 @@
+import argparse
+
+import pytest
+
+from sh_doctest.case import CaseParser
+from sh_doctest.selection import (
+    case_span,
+    check_expression,
+    compile_expression,
+    spans_lines,
+    parse_selector,
+)
+
+
+@pytest.mark.parametrize(
+    "expression, expected",
+    [
+        ("user", ["add user", "remove user"]),
+        ("USER and not remove", ["add user"]),
+        ("add* or group", ["add user", "add group", "group perms"]),
+        ("not (user or group)", ["self-test"]),
+        ("'self-test'", ["self-test"]),
+        ("*perm?", ["group perms"]),
+    ],
+)
+def test_compile_expression(expression, expected):
+    names = ["add user", "remove user", "add group", "group perms", "self-test"]
+    matches = compile_expression(expression)
+    assert [name for name in names if matches(name)] == expected
+
+
+@pytest.mark.parametrize("expression", ["a and", "(a", "a )", "or a", ""])
+def test_invalid_expression(expression):
+    with pytest.raises(argparse.ArgumentTypeError):
+        check_expression(expression)
+
+
+def test_parse_selector(tmp_path):
+    existing = tmp_path / "odd:12"
+    existing.write_text("")
+    assert parse_selector("a.txt:3") == ("a.txt", [(3, 3)])
+    assert parse_selector("a.txt:10-20") == ("a.txt", [(10, 20)])
+    assert parse_selector("b.txt") == ("b.txt", None)
+    assert parse_selector(str(existing)) == (str(existing), None)
+
+
+def test_spans_lines():
+    parser = CaseParser.from_text(
+        "First case.\n\nname: one\n$ echo 1\n1\n\nname: two\n$ echo 2\n2\n"
+    )
+    one, two = parser.parse(), parser.parse()
+    assert case_span(one) == (1, 5)
+    assert spans_lines(two, [(8, 8)]) and not spans_lines(one, [(8, 8)])
+    assert spans_lines(one, [(1, 4)])
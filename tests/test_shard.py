@@ -0,0 +1,45 @@
+import pytest
+
+from sh_doctest.shard import parse_shard, partition, units
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+    for value in ("0/4", "5/4", "2", "a/b"):
+        with pytest.raises(ValueError):
+            parse_shard(value)
+
+
+def test_units_join_groups_and_depends(make_case):
+    cases = [
+        make_case("a"),
+        make_case("b1", group="b"),
+        make_case("c"),
+        make_case("b2", group="b"),
+        make_case("d", depends="c"),
+        make_case("e"),
+    ]
+    assert units(cases) == [[0], [1, 3], [2, 4], [5]]
+
+
+def test_units_join_every_case_of_a_depended_name(make_case):
+    cases = [
+        make_case("setup"),
+        make_case("other"),
+        make_case("setup"),
+        make_case("check", depends="setup"),
+        make_case("x", group="setup"),
+        make_case("y", depends="x"),
+    ]
+    assert units(cases) == [[0, 2, 3], [1], [4, 5]]
+
+
+def test_partition_round_robin():
+    keys = [[f"k{i}"] for i in range(5)]
+    assert partition(keys, {}, 2) == [[0, 2, 4], [1, 3]]
+
+
+def test_partition_longest_first():
+    keys = [["a"], ["b"], ["c", "d"], ["e"]]
+    durations = {"a": 5.0, "b": 4.0, "c": 2.0, "d": 1.0}  # e defaults to the mean 3
+    assert partition(keys, durations, 2) == [[0, 3], [1, 2]]  # loads 8 and 7
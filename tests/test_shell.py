@@ -1,12 +1,24 @@
 import os
 import grp
 import subprocess
+import sys
 import tempfile
+import time
+
+import pytest
 
 # from unittest.mock import patch
 
 from sh_doctest.numbered_line import NumberedLine
-from sh_doctest.shell import shell, set_header, set_trailer, process_run_as
+from sh_doctest.shell import (
+    shell,
+    set_header,
+    set_trailer,
+    process_run_as,
+    ShellContext,
+    DELIVERIES,
+    script_path,
+)
 
 
 def test_shell_runs_script():
@@ -34,6 +46,47 @@ def test_shell_runs_script_with_timeout():
         assert False, "Should have raised an exception"
 
 
+def test_shell_timeout_keeps_partial_output():
+    with pytest.raises(subprocess.TimeoutExpired) as exc:
+        shell("echo partial; sleep 5", timeout=0.5, context=ShellContext("", ""))
+    assert exc.value.output == b"partial\n"
+
+
+def test_shell_timeout_kills_process_group():
+    script = "sleep 30 & echo $!; wait"
+    with pytest.raises(subprocess.TimeoutExpired) as exc:
+        shell(script, timeout=0.5, context=ShellContext("", ""))
+    pid = int(exc.value.output)
+    for _ in range(100):
+        try:
+            with open(f"/proc/{pid}/stat") as stat:
+                if stat.read().split(")")[-1].split()[0] == "Z":
+                    break  # dead but not yet reaped by init
+        except FileNotFoundError:
+            break
+        time.sleep(0.01)
+    else:
+        assert False, "Background child survived the timeout"
+
+
+def test_shell_records_usage():
+    script = "for i in $(seq 100000); do :; done"
+    result = shell(script, context=ShellContext("", ""))
+    usage = result.usage
+    assert usage.user_time + usage.system_time > 0
+    assert usage.duration >= usage.user_time
+    assert usage.max_rss > 0
+    assert usage.max_rss >= usage.shared_rss > 0
+
+
+def test_shell_measures_case_rss():
+    small = shell("true", context=ShellContext("", "")).usage
+    assert small.case_rss is None  # bash needs less than sh_doctest shares
+    script = f"{sys.executable} -c 'data = b\"x\" * (256 << 20)'"
+    big = shell(script, context=ShellContext("", "")).usage
+    assert big.case_rss is not None and big.case_rss > 256 << 10
+
+
 def test_shell_runs_script_with_check():
     script = "exit 1"
     try:
@@ -108,3 +161,32 @@ def test_process_run_as_with_none():
     assert user is None
     assert group is None
     assert extra_groups is None
+
+
+def test_shell_context_overrides_globals():
+    set_header("echo 'Global header'")
+    set_trailer("")
+    context = ShellContext("echo 'Spec header'", "echo 'Spec trailer'")
+    result = shell("echo 'Test'", context=context)
+    assert result.stdout.strip() == "Spec header\nTest\nSpec trailer"
+    copy = context.copy()
+    copy.set_header("")
+    assert context.header == "echo 'Spec header'"
+    set_header("")
+
+
+@pytest.mark.parametrize("delivery", DELIVERIES)
+def test_shell_script_delivery(delivery):
+    context = ShellContext("", "", delivery=delivery)
+    assert shell("echo 'Test'", context=context).stdout == "Test\n"
+    # Larger than a pipe buffer,  and exiting before the whole script is read.
+    long_script = "\n".join(f": {i}" for i in range(20000))
+    assert shell(long_script + "\necho done", context=context).stdout == "done\n"
+    assert shell("exit 3\n" + long_script, context=context).returncode == 3
+
+
+def test_script_path_tempfile_is_removed():
+    with script_path("echo hi", "tempfile") as (path, pass_fds):
+        assert os.path.exists(path)
+        assert pass_fds == ()
+    assert not os.path.exists(path)
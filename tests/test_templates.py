@@ -1,15 +1,19 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import patch
+
+from sh_doctest import templates
 from sh_doctest.templates import (
     Template,
     Expansion,
+    MatrixExpansion,
     TemplatedDoc,
     transform_placeholders,
 )
 from sh_doctest.line_block import LineBlock
 from sh_doctest.numbered_line import NumberedLine
-from sh_doctest.templates import parse_value
-
+from sh_doctest.templates import parse_value, stripped_lines
 
 """
 This test suite covers the following cases:
@@ -65,32 +69,26 @@ class TestTemplateParsing(unittest.TestCase):
             parse_value("keyword", line)
 
     def test_template_parse_missing_end_template(self):
-        lines = LineBlock.from_text(
-            """
+        lines = LineBlock.from_text("""
 template: my_template
 var: var1, var2
 This is a template with {{ var1 }} and {{ var2 }}.
-"""
-        )
+""")
         with self.assertRaises(ValueError):
             Template.parse(lines)
 
     def test_expansion_parse_invalid_let(self):
-        lines = LineBlock.from_text(
-            """
+        lines = LineBlock.from_text("""
 expand: my_template
 let: var1
-"""
-        )
+""")
         with self.assertRaises(ValueError):
             Expansion.parse(lines)
 
     def test_expansion_parse_no_let(self):
-        lines = LineBlock.from_text(
-            """
+        lines = LineBlock.from_text("""
 expand: my_template
-"""
-        )
+""")
         expansion = Expansion.parse(lines)
         self.assertEqual(expansion.template_name.line, "my_template")
         self.assertEqual(expansion.variables, {"template": "my_template"})
@@ -109,14 +107,12 @@ class TestTemplatedDocParsing(unittest.TestCase):
         )
         doc = TemplatedDoc(
             "test.txt",
-            LineBlock.from_text(
-                """
+            LineBlock.from_text("""
 template: my_template
 var: var1, var2
 This is a template with {{ var1 }} and {{ var2 }}.
 end_template: my_template
-"""
-            ),
+"""),
         )
         doc.parse()
         self.assertEqual(doc.templates, {"my_template": template})
@@ -124,8 +120,7 @@ end_template: my_template
     def test_parse_line_expansion(self):
         doc = TemplatedDoc(
             "test.txt",
-            LineBlock.from_text(
-                """
+            LineBlock.from_text("""
 template: my_template
 var: var1, var2
 This is a template with {{ var1 }} and {{ var2 }}.
@@ -134,8 +129,7 @@ end_template: my_template
 expand: my_template
 let: var1 value1
 let: var2 value2
-"""
-            ),
+"""),
         )
         doc.parse()
         self.assertEqual(
@@ -145,28 +139,24 @@ let: var2 value2
 
 class TestTemplate(unittest.TestCase):
     def test_parse_empty_template(self):
-        lines = LineBlock.from_text(
-            """
+        lines = LineBlock.from_text("""
 template: empty_template
 end_template: empty_template
-"""
-        )
+""")
         template = Template.parse(lines)
         self.assertEqual(template.name.line, "empty_template")
         self.assertEqual(template.variables, [])
         self.assertEqual(template.text, "")
 
     def test_parse_template_with_whitespace(self):
-        lines = LineBlock.from_text(
-            """
+        lines = LineBlock.from_text("""
 template: whitespace_template
 var: var1, var2
 
     This is a template with whitespace.
 
 end_template: whitespace_template
-"""
-        )
+""")
         template = Template.parse(lines)
         self.assertEqual(template.name.line, "whitespace_template")
         self.assertEqual(template.variables, ["var1", "var2"])
@@ -175,24 +165,20 @@ end_template: whitespace_template
 
 class TestExpansion(unittest.TestCase):
     def test_parse_expansion_no_variables(self):
-        lines = LineBlock.from_text(
-            """
+        lines = LineBlock.from_text("""
 expand: no_variables
-"""
-        )
+""")
         expansion = Expansion.parse(lines)
         self.assertEqual(expansion.template_name.line, "no_variables")
         self.assertEqual(expansion.variables, {"template": "no_variables"})
 
     def test_parse_expansion_multiple_variables(self):
-        lines = LineBlock.from_text(
-            """
+        lines = LineBlock.from_text("""
 expand: multiple_variables
 let: var1 value1
 let: var2 value2
 let: var3 value3
-"""
-        )
+""")
         expansion = Expansion.parse(lines)
         self.assertEqual(expansion.template_name.line, "multiple_variables")
         self.assertEqual(
@@ -206,6 +192,77 @@ let: var3 value3
         )
 
 
+class TestMatrixExpansion(unittest.TestCase):
+    SOURCE = """
+template: access
+var: user,group
+<user> in <group>
+end_template: access
+expand_matrix: access
+let: user alice bob
+let: group team1 team2 team3
+exclude: user=bob group=team2
+exclude: group=team3 user=alice
+after
+"""
+
+    def test_parse_matrix(self):
+        lines = LineBlock.from_text("""
+expand_matrix: access
+let: user alice bob
+let: group team1
+exclude: user=bob
+""")
+        matrix = MatrixExpansion.parse(lines)
+        self.assertEqual(matrix.template_name.line, "access")
+        self.assertEqual(matrix.axes, {"user": ["alice", "bob"], "group": ["team1"]})
+        self.assertEqual(matrix.excludes, [{"user": "bob"}])
+        self.assertEqual(
+            [expansion.variables for expansion in matrix.iter_expansions()],
+            [{"user": "alice", "group": "team1", "template": "access"}],
+        )
+
+    def test_parse_matrix_unknown_exclude(self):
+        for exclude in ("group=team1", "user=alcie"):
+            lines = LineBlock.from_text(
+                f"expand_matrix: access\nlet: user alice\nexclude: {exclude}\n"
+            )
+            with self.assertRaises(ValueError):
+                MatrixExpansion.parse(lines)
+
+    def test_expand_matrix(self):
+        doc = TemplatedDoc("test.txt", LineBlock.from_text(self.SOURCE))
+        doc.parse()
+        self.assertEqual(
+            [line for line in doc.text.splitlines() if line],
+            [
+                "alice in team1",
+                "alice in team2",
+                "bob in team1",
+                "bob in team3",
+                "after",
+            ],
+        )
+        self.assertEqual(doc.expansion_count, 4)
+        self.assertEqual(doc.expansions, [])
+
+    def test_expand_matrix_is_lazy(self):
+        source = """
+template: big
+var: a,b
+<a><b>
+end_template: big
+expand_matrix: big
+let: a {}
+let: b {}
+""".format(" ".join(map(str, range(100))), " ".join(map(str, range(100))))
+        doc = TemplatedDoc("test.txt", LineBlock.from_text(source))
+        lines = doc.iter_lines()
+        self.assertEqual(str(next(lines)), "00")
+        self.assertEqual(doc.expansion_count, MatrixExpansion.BATCH)
+        self.assertEqual(sum(1 for _ in lines), 9999)
+
+
 class TestTemplatedDoc(unittest.TestCase):
     @patch("sh_doctest.line_block.LineBlock.from_file")
     def test_parse_empty_doc(self, mock_from_file):
@@ -214,3 +271,77 @@ class TestTemplatedDoc(unittest.TestCase):
         doc.parse()
         self.assertEqual(doc.templates, {})
         self.assertEqual(doc.expansions, [])
+
+
+class TestTemplateCompilation(unittest.TestCase):
+    def test_template_compiled_once(self):
+        source = """
+template: compiled_once
+var: who
+hello <who>
+end_template: compiled_once
+""" + "".join(f"\nexpand: compiled_once\nlet: who person{i}\n" for i in range(5))
+        with patch.object(
+            templates.ENVIRONMENT,
+            "get_template",
+            wraps=templates.ENVIRONMENT.get_template,
+        ) as get_template:
+            doc = TemplatedDoc("test.txt", LineBlock.from_text(source))
+            doc.parse()
+            TemplatedDoc("again.txt", LineBlock.from_text(source)).parse()
+        self.assertEqual(get_template.call_count, 1)
+        self.assertEqual(
+            [line for line in doc.text.splitlines() if line],
+            [f"hello person{i}" for i in range(5)],
+        )
+
+    def test_bytecode_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            previous = templates.ENVIRONMENT.bytecode_cache
+            try:
+                templates.use_bytecode_cache(cache_dir)
+                compiled = templates.compile_template("cached {{ value }}")
+                self.assertEqual(compiled.render(value=1), "cached 1")
+                self.assertTrue(os.listdir(cache_dir))
+            finally:
+                templates.ENVIRONMENT.bytecode_cache = previous
+
+
+class TestStreaming(unittest.TestCase):
+    SOURCE = """
+
+template: t
+var: n
+line <n>
+end_template: t
+  first narrative
+expand: t
+let: n 1
+expand: t
+let: n 2
+
+last narrative  \x20
+
+"""
+
+    def test_iter_lines_matches_text(self):
+        doc = TemplatedDoc("test.txt", LineBlock.from_text(self.SOURCE))
+        doc.parse()
+        streamed = TemplatedDoc("test.txt", LineBlock.from_text(self.SOURCE))
+        expected = [(line.line, line.lineno) for line in LineBlock.from_text(doc.text)]
+        got = [(line.line, line.lineno) for line in streamed.iter_lines()]
+        self.assertEqual(got, expected)
+
+    def test_iter_lines_is_lazy(self):
+        doc = TemplatedDoc("test.txt", LineBlock.from_text(self.SOURCE))
+        lines = doc.iter_lines()
+        # One line of lookahead is needed to recognize the trailing text.
+        self.assertEqual(str(next(lines)), "first narrative")
+        self.assertEqual(len(doc.expansions), 1)
+
+    def test_stripped_lines(self):
+        lines = ["", "  ", " a ", "", "b ", " ", ""]
+        self.assertEqual(
+            [(line.line, line.lineno) for line in stripped_lines(lines)],
+            [("a ", 0), ("", 1), ("b", 2)],
+        )
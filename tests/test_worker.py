@@ -0,0 +1,78 @@
+import subprocess
+
+import pytest
+
+from sh_doctest.shell import ShellContext
+from sh_doctest.worker import POOL, WorkerCrashed, shell
+
+
+def test_worker_evaluates_header_once(tmp_path):
+    counter = tmp_path / "count"
+    context = ShellContext(f"echo x >> {counter}; greet () {{ echo hi $1; }}", "")
+    for name in ("a", "b", "c"):
+        result = shell(f"greet {name}", context=context)
+        assert result.stdout == f"hi {name}\n"
+    assert counter.read_text() == "x\n"
+
+
+def test_worker_frames_output_and_status():
+    context = ShellContext("set -eu", "exit 0")
+    result = shell(
+        "printf 'no newline'; echo oops >&2; false; echo unreached", context=context
+    )
+    assert result.returncode == 1
+    assert result.stdout == "no newline"
+    assert result.stderr == "oops\n"
+    result = shell("echo ok", context=context)
+    assert (result.returncode, result.stdout, result.stderr) == (0, "ok\n", "")
+
+
+def test_worker_kills_what_a_case_leaves_running(tmp_path):
+    context = ShellContext("", "")
+    late = tmp_path / "late"
+    result = shell(
+        f"(sleep 0.5; echo late; touch {late}) & echo early", context=context
+    )
+    assert result.stdout == "early\n"
+    assert shell("sleep 1; echo next", context=context).stdout == "next\n"
+    assert not late.exists()
+
+
+def test_worker_header_larger_than_argv():
+    header = "big=" + "x" * 2**18 + "\ngreet () { echo ${#big}; }"
+    result = shell("greet", context=ShellContext(header, ""))
+    assert result.stdout == f"{2**18}\n"
+
+
+def test_worker_truncates_at_max_output():
+    context = ShellContext("", "")
+    result = shell(
+        "head -c 100000 /dev/zero | tr '\\0' x; echo err >&2",
+        max_output=10,
+        context=context,
+    )
+    assert result.stdout == "x" * 10
+    assert result.stderr == "err\n"
+    assert result.truncated == ("stdout",)
+    assert shell("echo ok", context=context).stdout == "ok\n"
+
+
+def test_worker_check():
+    with pytest.raises(subprocess.CalledProcessError):
+        shell("exit 3", check=True, context=ShellContext("", ""))
+
+
+def test_worker_respawns_after_timeout():
+    context = ShellContext("", "")
+    with pytest.raises(subprocess.TimeoutExpired) as exc:
+        shell("echo partial; sleep 5", timeout=1, context=context)
+    assert exc.value.output == b"partial\n"
+    assert shell("echo again", context=context).stdout == "again\n"
+
+
+def test_worker_respawns_after_crash():
+    context = ShellContext("", "")
+    with pytest.raises(WorkerCrashed):
+        shell("kill -9 $$", context=context)
+    assert shell("echo again", context=context).stdout == "again\n"
+    POOL.close()